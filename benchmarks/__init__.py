@@ -0,0 +1,12 @@
+"""
+Offline benchmarks. Run from the project root, e.g.
+py -m benchmarks.ann_benchmark
+
+The agent packages live under src/ (see src/main.py), so put it on the path.
+"""
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
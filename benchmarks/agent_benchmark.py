@@ -0,0 +1,436 @@
+"""
+End-to-end agent benchmark without network, microphone or speakers.
+
+Conversations are replayed through the real IntentRouter, Planner, Memory,
+ContextController, DocumentIndex retrieval, Reflection, ToolRuntime and
+TurnPipeline, configured as in server.py, against the local stand-ins in
+benchmarks/fakes.py: a fake OpenAI-compatible server (reached through the
+pooled LLMClient) with a configurable time to first token, token rate and
+injected failures or slow tails, a hashing embedding model, synthetic
+speech through StreamingRecognizer (--audio) and a null TTS sink fed by
+speak_stream (--voice).
+
+Conversations are synthetic (seeded) or replayed from a JSONL file, one
+conversation per line:
+  {"id": "c1", "turns": ["hello", {"text": "what is 12 * 7", "audio": true}]}
+
+Reports throughput, per-stage latency percentiles (agent.tracing spans)
+and memory. --save writes the report as JSON; --baseline compares against
+a saved report and exits with status 1 when throughput or a stage's p95
+regressed by more than --tolerance.
+
+The report also has the prompt prefix shared between consecutive LLM
+requests (see agent.context.prefix). To see its effect on time to first
+token, give the fake LLM a prefill rate and compare prompt layouts:
+  py -m benchmarks.agent_benchmark --prefill-tokens-per-second 2000 --prompt-layout priority
+  py -m benchmarks.agent_benchmark --prefill-tokens-per-second 2000 --prompt-layout prefix
+
+Use the command below to run
+py -m benchmarks.agent_benchmark --conversations 32 --turns 8 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import numpy as np
+
+import benchmarks  # noqa: F401  (puts src/ on sys.path)
+from benchmarks.fakes import (
+    FakeChatClient,
+    FakeLLM,
+    FakeOpenAIServer,
+    HashingEncoder,
+    NullTTS,
+    ScriptedSTT,
+    synthetic_speech,
+)
+from agent.context.controller import PROMPT_LAYOUTS, ContextController
+from agent.llm_client import LLMClient, RequestPolicy
+from agent.llm_wrapper import LLMWrapper
+from agent.memory import Memory
+from agent.pipeline import TurnPipeline
+from agent.planning import Planner
+from agent.reflection import Reflection
+from agent.retrieval.bm25_index import BM25Index
+from agent.retrieval.document_index import DocumentIndex
+from agent.retrieval.embedding_model import EmbeddingModel
+from agent.routing import IntentRouter
+from agent.tool_runtime import ToolRuntime
+from agent.tool_use import ToolRegistry
+from agent.tracing import JsonlExporter, tracer
+from agent.worker_pool import WorkerPool, run_blocking
+from speech.audio_sources import ArraySource
+from speech.streaming_stt import StreamingRecognizer
+from speech.streaming_tts import TTSWorker, speak_stream
+from tools.simple_tool import SimpleCalculatorTool
+import server
+
+SECONDS_PER_WORD = 0.3  # synthetic speech rate
+
+QUESTIONS = [
+    "what is {topic}",
+    "explain {topic} to me",
+    "how does {topic} differ from the other approaches",
+    "give me an example of {topic}",
+]
+FOLLOW_UPS = ["tell me more about that", "why does that work", "can you summarize what we talked about"]
+CHIT_CHAT = ["hello", "thanks", "how are you", "ok"]
+ARITHMETIC = ["what is {a} * {b}", "calculate ({a} + {b}) / 2", "what is {a} ** 2 - {b}"]
+
+
+@dataclass
+class Turn:
+    text: str
+    audio: bool = False
+
+
+@dataclass
+class Conversation:
+    id: str
+    turns: List[Turn] = field(default_factory=list)
+
+
+def synthetic_conversations(count: int, turns: int, audio_fraction: float, seed: int) -> List[Conversation]:
+    """
+    Knowledge questions about the server's documents, follow-ups, small
+    talk and arithmetic (tool turns), in seeded proportions.
+    """
+    rng = random.Random(seed)
+    topics = [document["id"].replace("_", " ") + " learning" for document in server.DOCUMENTS]
+    conversations = []
+    for c in range(count):
+        conversation = Conversation(id=f"bench-{c}")
+        for _ in range(turns):
+            kind = rng.random()
+            if kind < 0.5:
+                text = rng.choice(QUESTIONS).format(topic=rng.choice(topics))
+            elif kind < 0.7:
+                text = rng.choice(FOLLOW_UPS)
+            elif kind < 0.8:
+                text = rng.choice(CHIT_CHAT)
+            else:
+                text = rng.choice(ARITHMETIC).format(a=rng.randint(2, 99), b=rng.randint(2, 99))
+            conversation.turns.append(Turn(text, audio=rng.random() < audio_fraction))
+        conversations.append(conversation)
+    return conversations
+
+
+def load_conversations(path: str) -> List[Conversation]:
+    conversations = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            turns = [
+                Turn(turn) if isinstance(turn, str) else Turn(turn["text"], audio=bool(turn.get("audio")))
+                for turn in record["turns"]
+            ]
+            conversations.append(Conversation(id=str(record.get("id", f"trace-{number}")), turns=turns))
+    return conversations
+
+
+class BenchmarkAgent:
+    """
+    The server's shared components (see AgentServer), built on the fakes.
+    """
+
+    def __init__(self, args, client):
+        self.voice = args.voice
+        self.tts_words_per_second = args.tts_words_per_second
+        self.prompt_layout = args.prompt_layout
+        self.llm = LLMWrapper(client=client, model="fake", embedding_model="fake")
+        encoder = HashingEncoder(
+            seconds_per_batch=args.embedding_ms_per_batch / 1000,
+            seconds_per_text=args.embedding_ms_per_text / 1000,
+        )
+        self.embedding_model = EmbeddingModel(micro_batching=True, model=encoder)
+        self.router = IntentRouter(self.embedding_model, confidence_threshold=server.ROUTER_CONFIDENCE_THRESHOLD)
+        self.tools = ToolRegistry()
+        self.tools.register(SimpleCalculatorTool())
+        self.planner = Planner(self.llm, router=None if args.no_router else self.router, registry=self.tools)
+        self.reflection = Reflection(self.llm, context_window_size=server.CONTEXT_WINDOW_SIZE)
+        self.document_index = DocumentIndex(self.embedding_model, sparse=BM25Index())
+        self.document_index.sync(server.DOCUMENTS)
+
+        self.stt = ScriptedSTT(seconds_per_word=SECONDS_PER_WORD, realtime_factor=args.stt_realtime_factor)
+        self.pools: Dict[str, WorkerPool] = {
+            "llm": WorkerPool("llm", args.llm_concurrency, max_queue=args.max_queue),
+            "embedding": WorkerPool("embedding", args.embedding_concurrency, max_queue=args.max_queue),
+            "tool": WorkerPool("tool", 4, max_queue=args.max_queue),
+            "stt": WorkerPool("stt", 1, max_queue=args.max_queue),
+        }
+        self.tool_runtime = ToolRuntime(
+            default_timeout=server.TOOL_TIMEOUT, pool=self.pools["tool"], processes=server.TOOL_PROCESSES
+        )
+        self.memory_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="memory")
+
+    def create_pipeline(self, session_id: str) -> TurnPipeline:
+        return TurnPipeline(
+            llm=self.llm,
+            planner=self.planner,
+            memory=Memory(),
+            reflection=self.reflection,
+            tools=self.tools,
+            embedding_model=self.embedding_model,
+            document_index=self.document_index,
+            top_k=server.TOP_K_RETRIEVAL,
+            score_threshold=server.RETRIEVAL_SCORE_THRESHOLD,
+            context_window_size=server.CONTEXT_WINDOW_SIZE,
+            reflection_interval=server.REFLECTION_INTERVAL,
+            session_id=session_id,
+            pools=self.pools,
+            memory_executor=self.memory_executor,
+            context_controller=ContextController(token_budget=server.CONTEXT_TOKEN_BUDGET, layout=self.prompt_layout),
+            tool_runtime=self.tool_runtime,
+        )
+
+    def recognize(self, text: str) -> str:
+        """
+        Speak `text` as synthetic audio and run it through StreamingRecognizer.
+        """
+        with tracer.span("stt.utterance"):
+            audio = synthetic_speech(text, seconds_per_word=SECONDS_PER_WORD)
+            self.stt.expect(text)
+            # One segment per utterance (see ScriptedSTT); 8 s is the production window
+            window = max(8.0, len(text.split()) * SECONDS_PER_WORD + 1.0)
+            recognizer = StreamingRecognizer(self.stt, window_s=window)
+            return recognizer.transcribe_utterance(ArraySource(audio, block_size=512))
+
+    async def replay(self, conversation: Conversation, latencies: List[float], errors: List[str]):
+        pipeline = self.create_pipeline(conversation.id)
+        tts_worker = TTSWorker(lambda: NullTTS(self.tts_words_per_second)) if self.voice else None
+        respond = None
+        if tts_worker is not None:
+            respond = lambda messages: speak_stream(self.llm.generate_stream(messages), tts_worker)
+        try:
+            for turn in conversation.turns:
+                start = time.perf_counter()
+                user_input = turn.text
+                try:
+                    if turn.audio:
+                        user_input = await run_blocking(self.pools["stt"], conversation.id, self.recognize, turn.text)
+                    await pipeline.run_turn(user_input, respond=respond)
+                except Exception as e:  # the server answers 500 and the conversation goes on
+                    errors.append(f"{type(e).__name__}: {e}")
+                    continue
+                pipeline.context_controller.step()
+                latencies.append(time.perf_counter() - start)
+            await pipeline.drain()
+        finally:
+            pipeline.close()
+            if tts_worker is not None:
+                tts_worker.close()
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.shutdown()
+        self.memory_executor.shutdown(wait=True)
+        self.tool_runtime.close()
+        self.embedding_model.close()
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+async def run(agent: BenchmarkAgent, conversations: List[Conversation], concurrency: int) -> Dict:
+    latencies: List[float] = []
+    errors: List[str] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def replay(conversation: Conversation):
+        async with semaphore:
+            await agent.replay(conversation, latencies, errors)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(replay(conversation) for conversation in conversations))
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": round(elapsed, 3),
+        "turns": len(latencies),
+        "failed_turns": len(errors),
+        "errors": sorted(set(errors))[:10],
+        "turns_per_second": round(len(latencies) / elapsed, 2),
+        "turn_ms": {
+            f"p{q}": round(1000 * float(np.percentile(latencies, q)), 2) if latencies else 0.0
+            for q in (50, 95, 99)
+        },
+    }
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float, floor_ms: float = 1.0) -> List[str]:
+    """
+    Regressions of `report` against `baseline`: lower throughput, or a
+    higher p95 for any stage present in both (ignoring changes under `floor_ms`).
+    """
+    regressions = []
+    if report["failed_turns"] > baseline.get("failed_turns", 0):
+        regressions.append(f"failed turns {baseline.get('failed_turns', 0)} -> {report['failed_turns']}")
+    old, new = baseline["turns_per_second"], report["turns_per_second"]
+    if new < old * (1 - tolerance):
+        regressions.append(f"throughput {old} -> {new} turns/s")
+    for name, stage in report["stages"].items():
+        before = baseline["stages"].get(name)
+        if before is None or not before["count"]:
+            continue
+        if stage["p95_ms"] > before["p95_ms"] * (1 + tolerance) and stage["p95_ms"] - before["p95_ms"] > floor_ms:
+            regressions.append(f"{name} p95 {before['p95_ms']} -> {stage['p95_ms']} ms")
+    return regressions
+
+
+def print_report(report: Dict):
+    print(
+        f"\n{report['turns']} turns ({report['failed_turns']} failed) in {report['seconds']:.2f}s: "
+        f"{report['turns_per_second']} turns/s  "
+        f"(turn p50 {report['turn_ms']['p50']} ms, p95 {report['turn_ms']['p95']} ms, p99 {report['turn_ms']['p99']} ms)"
+    )
+    print(f"\n{'stage':<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stage in report["stages"].items():
+        print(
+            f"{name:<28}{stage['count']:>8}{stage['p50_ms']:>10.2f}{stage['p95_ms']:>10.2f}"
+            f"{stage['p99_ms']:>10.2f}{stage['max_ms']:>10.2f}"
+        )
+    print("\ncounters:", report["counters"])
+    print("llm:", report["llm"], " planner:", report["planner"], " embedding:", report["embedding"])
+    if report["llm_client"]:
+        print("llm client:", report["llm_client"])
+    print("prompt prefix:", report["prompt_prefix"])
+    print("memory:", report["memory"])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=8, help="turns per synthetic conversation")
+    parser.add_argument("--concurrency", type=int, default=4, help="conversations replayed at once")
+    parser.add_argument("--replay", default=None, help="JSONL file of conversations (default: synthetic)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm", choices=["server", "inprocess"], default="server",
+                        help="LLMClient against a fake OpenAI server over HTTP, or an in-process fake client")
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="fake LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--reply-tokens", type=int, default=48)
+    parser.add_argument(
+        "--prefill-tokens-per-second", type=float, default=0.0,
+        help="fake LLM prompt processing rate for prompt tokens missing its prefix cache (0: free)",
+    )
+    parser.add_argument("--prompt-layout", choices=PROMPT_LAYOUTS, default="prefix")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of HTTP requests failing with 503")
+    parser.add_argument("--llm-tail-rate", type=float, default=0.0, help="fraction of slow requests")
+    parser.add_argument("--llm-tail-factor", type=float, default=10.0, help="slowdown of a slow request")
+    parser.add_argument("--no-hedging", action="store_true", help="never send a second planner request")
+    parser.add_argument("--embedding-ms-per-batch", type=float, default=2.0)
+    parser.add_argument("--embedding-ms-per-text", type=float, default=0.5)
+    parser.add_argument("--audio", type=float, default=0.0, metavar="FRACTION",
+                        help="fraction of synthetic turns spoken through STT")
+    parser.add_argument("--stt-realtime-factor", type=float, default=0.1)
+    parser.add_argument("--voice", action="store_true", help="stream responses through speak_stream and TTS")
+    parser.add_argument("--tts-words-per-second", type=float, default=0.0, help="0: instant null TTS")
+    parser.add_argument("--no-router", action="store_true", help="send every plan to the LLM")
+    parser.add_argument("--llm-concurrency", type=int, default=32)
+    parser.add_argument("--embedding-concurrency", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=2048)
+    parser.add_argument("--trace-memory", action="store_true", help="tracemalloc peak (slows the run)")
+    parser.add_argument("--trace-file", default=None, help="append every turn's span tree as JSONL")
+    parser.add_argument("--save", default=None, help="write the report as JSON")
+    parser.add_argument("--baseline", default=None, help="compare against a saved report")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.replay:
+        conversations = load_conversations(args.replay)
+    else:
+        conversations = synthetic_conversations(args.conversations, args.turns, args.audio, args.seed)
+
+    tracer.enabled = True
+    exporter = JsonlExporter(args.trace_file) if args.trace_file else None
+    if exporter is not None:
+        tracer.exporters.append(exporter)
+
+    fake_llm = FakeLLM(
+        ttft=args.ttft_ms / 1000,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.llm_error_rate,
+        tail_rate=args.llm_tail_rate,
+        tail_factor=args.llm_tail_factor,
+        seed=args.seed,
+        prefill_tokens_per_second=args.prefill_tokens_per_second,
+    )
+    fake_server = None
+    if args.llm == "server":
+        fake_server = FakeOpenAIServer(fake_llm).start()
+        client = LLMClient(
+            base_url=fake_server.url,
+            api_key="benchmark",
+            max_concurrency=args.llm_concurrency,
+            policies={"planner": RequestPolicy(timeout=10.0, retries=2, hedge=not args.no_hedging)},
+        )
+    else:
+        client = FakeChatClient(fake_llm)
+
+    agent = BenchmarkAgent(args, client)
+    agent.embedding_model.warm_up()
+    print(
+        f"{len(conversations)} conversations, {sum(len(c.turns) for c in conversations)} turns, "
+        f"concurrency {args.concurrency}, llm={args.llm} (ttft {args.ttft_ms:g} ms, {args.tokens_per_second:g} tok/s)"
+    )
+
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        report = asyncio.run(run(agent, conversations, args.concurrency))
+    finally:
+        agent.close()
+        if fake_server is not None:
+            client.close()
+            fake_server.stop()
+        if exporter is not None:
+            exporter.close()
+
+    summary = tracer.summary()
+    report["stages"] = summary["spans"]
+    report["counters"] = summary["counters"]
+    report["llm"] = fake_llm.stats()
+    report["planner"] = agent.planner.route_counts
+    report["llm_client"] = client.stats() if fake_server is not None else None
+    report["prompt_prefix"] = agent.llm.prefix_stats()
+    report["embedding"] = agent.embedding_model.stats()
+    report["memory"] = {"peak_rss_mb": peak_rss_mb()}
+    if args.trace_memory:
+        report["memory"]["python_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        tracemalloc.stop()
+    report["config"] = {key: value for key, value in vars(args).items() if key not in ("save", "baseline")}
+    print_report(report)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against", args.baseline)
+            for regression in regressions:
+                print(" -", regression)
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare IVFIndex against exact search on synthetic clustered embeddings.
+Reports build time, recall@k and p50/p99 query latency per configuration.
+
+Use the command below to run
+py -m benchmarks.ann_benchmark --num-docs 200000 --nprobe 4 8 16 32
+"""
+import argparse
+import time
+import numpy as np
+
+import benchmarks  # noqa: F401  (puts src/ on sys.path)
+from agent.retrieval.ivf_index import IVFIndex
+from agent.retrieval.scoring import top_k_scores
+
+
+def synthetic_embeddings(topics: np.ndarray, num: int, rng) -> np.ndarray:
+    """
+    Normalized vectors scattered around topic centres,
+    which is closer to real sentence embeddings than uniform noise.
+    """
+    labels = rng.integers(0, topics.shape[0], num)
+    noise = rng.standard_normal((num, topics.shape[1])).astype(np.float32)
+    vectors = topics[labels] + noise
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q) * 1000)
+
+
+def run_queries(search, queries):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
+
+
+def recall_at_k(approx, exact) -> float:
+    hits = 0
+    total = 0
+    for approx_hits, exact_hits in zip(approx, exact):
+        truth = {row for row, _ in exact_hits}
+        hits += len(truth & {row for row, _ in approx_hits})
+        total += len(truth)
+    return hits / max(total, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-docs", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--num-lists", type=int, default=1024)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--quantization", nargs="+", default=["none", "int8"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    topics = rng.standard_normal((256, args.dim)).astype(np.float32)
+    docs = synthetic_embeddings(topics, args.num_docs, rng)
+    queries = synthetic_embeddings(topics, args.num_queries, rng)
+    print(f"{args.num_docs} docs x {args.dim} dims, {args.num_queries} queries, k={args.top_k}")
+
+    exact, exact_latencies = run_queries(
+        lambda q: top_k_scores(q, docs, args.top_k)[0], queries
+    )
+    print(
+        f"{'exact':<24} recall=1.000  "
+        f"p50={percentile_ms(exact_latencies, 50):7.2f}ms  "
+        f"p99={percentile_ms(exact_latencies, 99):7.2f}ms"
+    )
+
+    for quantization in args.quantization:
+        index = IVFIndex(num_lists=args.num_lists, quantization=quantization, seed=args.seed)
+        start = time.perf_counter()
+        index.build(docs)
+        build_s = time.perf_counter() - start
+        print(f"-- IVF lists={args.num_lists} quantization={quantization} build={build_s:.1f}s")
+
+        for nprobe in args.nprobe:
+            approx, latencies = run_queries(
+                lambda q: index.search(q, args.top_k, nprobe=nprobe)[0], queries
+            )
+            label = f"ivf nprobe={nprobe}"
+            print(
+                f"{label:<24} recall={recall_at_k(approx, exact):.3f}  "
+                f"p50={percentile_ms(latencies, 50):7.2f}ms  "
+                f"p99={percentile_ms(latencies, 99):7.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Allocation cost of audio capture: the old list-of-copies path
+(indata.copy() per block, np.concatenate, astype) versus AudioRingBuffer
+(write into preallocated storage, contiguous view handed to STT).
+
+The audio callback is simulated with a synthetic signal delivered in
+fixed-size blocks from one reused buffer, as PortAudio does.
+
+Use the command below to run
+py -m benchmarks.capture_benchmark --seconds 600
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+
+import benchmarks  # noqa: F401  (puts src/ on sys.path)
+from speech.ring_buffer import AudioRingBuffer
+
+
+def synthetic_blocks(seconds: float, sample_rate: int, block_size: int):
+    """
+    Yield the same (block_size, 1) float32 buffer refilled with a 220 Hz tone + noise.
+    Refilling happens in place, so the generator itself does not allocate per block.
+    """
+    rng = np.random.default_rng(0)
+    indata = np.empty((block_size, 1), dtype=np.float32)
+    t = np.arange(block_size) / sample_rate
+    for i in range(int(seconds * sample_rate / block_size)):
+        offset = i * block_size / sample_rate
+        indata[:, 0] = 0.3 * np.sin(2 * np.pi * 220 * (t + offset))
+        indata[:, 0] += 0.01 * rng.standard_normal(block_size)
+        yield indata
+
+
+def legacy_callbacks(blocks):
+    frames = []
+    for indata in blocks:
+        frames.append(indata.copy())
+    return frames
+
+
+def legacy_handoff(frames):
+    audio = np.concatenate(frames, axis=0)
+    # WhisperSTT.transcribe used to squeeze and astype (another copy)
+    return audio.squeeze(axis=1).astype(np.float32)
+
+
+def ring_callbacks(blocks, ring: AudioRingBuffer):
+    for indata in blocks:
+        ring.write(indata)
+    return ring
+
+
+def ring_handoff(ring: AudioRingBuffer):
+    # Contiguous view, passed through np.asarray/reshape without copying
+    return np.asarray(ring.read(), dtype=np.float32).reshape(-1)
+
+
+def measure(name: str, callbacks, handoff, seconds: float, sample_rate: int, block_size: int):
+    """
+    Callback phase: allocations still live after capture (NumPy reports its
+    buffers to tracemalloc), i.e. per-block copies. Handoff phase: extra
+    bytes allocated while turning the capture into the array given to STT.
+    """
+    blocks = synthetic_blocks(seconds, sample_rate, block_size)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    captured = callbacks(blocks)
+    callback_time = time.perf_counter() - start
+    after = tracemalloc.take_snapshot()
+    live_allocations = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "lineno"))
+    live_bytes = sum(max(stat.size_diff, 0) for stat in after.compare_to(before, "lineno"))
+
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    audio = handoff(captured)
+    handoff_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{name:<7} samples={audio.shape[0]:>9}  "
+        f"allocations/s audio={live_allocations / seconds:7.2f}  "
+        f"capture bytes/s audio={live_bytes / seconds / 1e3:7.1f} KB  "
+        f"handoff copies={(peak - current) / 1e6:6.2f} MB  "
+        f"time={(callback_time + handoff_time) * 1000 / seconds:6.3f} ms/s audio"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=300.0)
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--block-size", type=int, default=512)
+    args = parser.parse_args()
+
+    print(f"{args.seconds:.0f}s of audio at {args.sample_rate} Hz in blocks of {args.block_size}")
+    measure("legacy", legacy_callbacks, legacy_handoff, args.seconds, args.sample_rate, args.block_size)
+
+    # Preallocated once, before capture starts
+    ring = AudioRingBuffer(int(args.seconds * args.sample_rate))
+    measure(
+        "ring",
+        lambda blocks: ring_callbacks(blocks, ring),
+        ring_handoff,
+        args.seconds,
+        args.sample_rate,
+        args.block_size,
+    )
+
+
+if __name__ == "__main__":
+    main()
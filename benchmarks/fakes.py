@@ -0,0 +1,470 @@
+"""
+Deterministic local stand-ins for the agent's external backends, so the
+agent can be benchmarked without a Hugging Face token, a microphone or
+Windows TTS:
+
+- FakeLLM: canned planner plans and filler replies with a latency model
+  (time to first token + token rate), served over HTTP by FakeOpenAIServer
+  (OpenAI-compatible, plain and streamed) or in-process by FakeChatClient
+- HashingEncoder: feature-hashed bag-of-words vectors in place of a
+  sentence-transformers model
+- synthetic_speech + ScriptedSTT: speech-like audio for StreamingRecognizer
+  and a WhisperSTT stand-in that "recognizes" it
+- NullTTS: a speech sink in place of WindowsTTS
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import types
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+import benchmarks  # noqa: F401  (puts src/ on sys.path)
+from agent.context.prefix import PrefixTracker
+from agent.context.tokens import TokenEstimator
+from agent.tracing import tracer
+from server import STATUS_TEXT, read_request  # the agent server's HTTP/1.1 helpers
+
+PLANNER_MARKER = "You are a planner"
+TOOL_LINE = re.compile(r"^- (\S+): .*\n  arguments: (\{.*\})$", re.MULTILINE)
+EXPRESSION = re.compile(r"[\d(][\d\s.+\-*/%()]*\d\)?")
+OPERATOR = re.compile(r"\d\s*(\*\*|[+\-*/%])\s*[\d(]")
+
+WORDS = (
+    "the model learns from data and each example helps it improve over time while "
+    "labeled inputs guide training and rewards shape behaviour so patterns emerge "
+    "from structure in the signal that we can measure compare and explain"
+).split()
+
+
+class FakeLLM:
+    """
+    Deterministic chat completions.
+
+    Planner prompts (recognized by the planner's system prompt) get a tool
+    plan when the user input contains arithmetic, using the first tool and
+    argument listed in the prompt, and a "respond" plan otherwise. Any
+    other prompt gets `reply_tokens` words of filler text in sentences,
+    chosen by a hash of the last message.
+
+    A reply of n tokens takes `ttft + n / tokens_per_second` seconds. For
+    fault injection (seeded), a `tail_rate` fraction of requests is
+    `tail_factor` times slower and, over HTTP, an `error_rate` fraction
+    fails with 503.
+
+    With `prefill_tokens_per_second`, prompt processing adds to the time to
+    first token, except for the prefix shared with one of the last
+    `cached_prompts` prompts (a model of an upstream prefix/KV cache).
+    """
+
+    def __init__(
+        self,
+        ttft: float = 0.3,
+        tokens_per_second: float = 50.0,
+        reply_tokens: int = 60,
+        error_rate: float = 0.0,
+        tail_rate: float = 0.0,
+        tail_factor: float = 10.0,
+        seed: int = 0,
+        prefill_tokens_per_second: float = 0.0,
+        cached_prompts: int = 64,
+    ):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.tail_rate = tail_rate
+        self.tail_factor = tail_factor
+        self.estimator = TokenEstimator()
+        self.prefill_tokens_per_second = prefill_tokens_per_second  # 0: prompt length is free
+        self.prefix_cache = PrefixTracker(window=cached_prompts, estimator=self.estimator)
+        self.requests = 0
+        self.errors = 0
+        self.completion_tokens = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def reply(self, messages: List[Dict[str, str]]) -> str:
+        with self._lock:
+            self.requests += 1
+        if messages and messages[0]["role"] == "system" and PLANNER_MARKER in messages[0]["content"]:
+            return json.dumps(self._plan(messages[0]["content"], messages[-1]["content"]))
+        seed = zlib.crc32(messages[-1]["content"].encode("utf-8")) if messages else 0
+        words = [WORDS[(seed + 7 * i) % len(WORDS)] for i in range(self.reply_tokens)]
+        sentences = [" ".join(words[i : i + 12]).capitalize() + "." for i in range(0, len(words), 12)]
+        return " ".join(sentences)
+
+    def tokens(self, text: str) -> List[str]:
+        """
+        Split text into stream deltas: one word (with its leading space) per token.
+        """
+        return re.findall(r"\s*\S+", text)
+
+    def draw(self) -> Tuple[bool, float]:
+        """
+        Per request: whether it fails and its latency multiplier.
+        """
+        with self._lock:
+            fails = self._rng.random() < self.error_rate
+            slowdown = self.tail_factor if self._rng.random() < self.tail_rate else 1.0
+            self.errors += fails
+        return fails, slowdown
+
+    def prefill(self, messages: List[Dict[str, str]]) -> float:
+        """
+        Seconds to process the part of the prompt that misses the prefix cache.
+        """
+        if self.prefill_tokens_per_second <= 0:
+            return 0.0
+        shared, prompt = self.prefix_cache.observe("prompt", messages)
+        return (prompt - shared) / self.prefill_tokens_per_second
+
+    def delay(self, tokens: int, slowdown: float = 1.0, prefill: float = 0.0) -> float:
+        return slowdown * (self.ttft + prefill + tokens / self.tokens_per_second)
+
+    def usage(self, messages: List[Dict[str, str]], tokens: int) -> Dict[str, int]:
+        with self._lock:
+            self.completion_tokens += tokens
+        prompt = self.estimator.count_messages(messages)
+        return {"prompt_tokens": prompt, "completion_tokens": tokens, "total_tokens": prompt + tokens}
+
+    def stats(self) -> Dict:
+        stats = {"requests": self.requests, "errors": self.errors, "completion_tokens": self.completion_tokens}
+        if self.prefill_tokens_per_second > 0:
+            stats["prefix_cache"] = self.prefix_cache.stats().get("prompt", {})
+        return stats
+
+    @staticmethod
+    def _plan(system_prompt: str, user_input: str) -> Dict:
+        tool = TOOL_LINE.search(system_prompt)
+        expressions = [m.group(0).strip() for m in EXPRESSION.finditer(user_input)]
+        expression = next((e for e in expressions if OPERATOR.search(e)), None)
+        if tool is None or expression is None:
+            return {"action": "respond", "tool_name": None, "arguments": {}}
+        argument = next(iter(json.loads(tool.group(2))), "expression")
+        return {"action": "tool", "tool_name": tool.group(1), "arguments": {argument: expression}}
+
+
+class _Completions:
+    def __init__(self, llm: FakeLLM):
+        self.llm = llm
+
+    def create(self, model: str, messages: List[Dict[str, str]], stream: bool = False, **kwargs):
+        text = self.llm.reply(messages)
+        tokens = self.llm.tokens(text)
+        _, slowdown = self.llm.draw()
+        prefill = self.llm.prefill(messages)
+        if stream:
+            return self._stream(model, messages, tokens, slowdown, prefill)
+        time.sleep(self.llm.delay(len(tokens), slowdown, prefill))
+        message = types.SimpleNamespace(role="assistant", content=text)
+        return types.SimpleNamespace(
+            model=model,
+            choices=[types.SimpleNamespace(index=0, message=message, finish_reason="stop")],
+            usage=types.SimpleNamespace(**self.llm.usage(messages, len(tokens))),
+        )
+
+    def _stream(
+        self, model: str, messages: List[Dict[str, str]], tokens: List[str], slowdown: float, prefill: float
+    ) -> Iterator:
+        start = time.perf_counter()
+        for i, token in enumerate(tokens):
+            _sleep_until(start + self.llm.delay(i, slowdown, prefill))
+            delta = types.SimpleNamespace(role="assistant", content=token)
+            yield types.SimpleNamespace(model=model, choices=[types.SimpleNamespace(index=0, delta=delta)])
+        self.llm.usage(messages, len(tokens))
+
+
+class FakeChatClient:
+    """
+    In-process stand-in for `openai.OpenAI`: `chat.completions.create`
+    returns FakeLLM replies without HTTP, isolating the agent's own cost.
+    Slow tails are simulated; errors are not.
+    """
+
+    def __init__(self, llm: FakeLLM):
+        self.chat = types.SimpleNamespace(completions=_Completions(llm))
+
+
+def _sleep_until(deadline: float):
+    remaining = deadline - time.perf_counter()
+    if remaining > 0:
+        time.sleep(remaining)
+
+
+class FakeOpenAIServer:
+    """
+    OpenAI-compatible endpoint (POST /v1/chat/completions, with and
+    without "stream") serving FakeLLM replies from a background thread.
+    Requests wait on asyncio timers, so any number can be in flight at once.
+
+        with FakeOpenAIServer(FakeLLM()) as server:
+            client = OpenAI(base_url=server.url, api_key="benchmark")
+    """
+
+    def __init__(self, llm: FakeLLM, host: str = "127.0.0.1", port: int = 0):
+        self.llm = llm
+        self.host = host
+        self.port = port
+        self.url: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        self._writers = set()
+
+    def start(self) -> "FakeOpenAIServer":
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle_connection, self.host, self.port)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            self.url = f"http://{self.host}:{self.port}/v1"
+            started.set()
+            self._loop.run_forever()
+            # Clients may still hold keep-alive connections; closing them ends their handlers
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            tasks = asyncio.all_tasks(self._loop)
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="fake-openai", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if method != "POST" or not path.endswith("/chat/completions"):
+                    error = {"error": {"message": f"No route for {path}"}}
+                    self._write(writer, 404, "application/json", json.dumps(error))
+                else:
+                    payload = json.loads(body or b"{}")
+                    fails, slowdown = self.llm.draw()
+                    payload["slowdown"] = slowdown
+                    payload["prefill"] = self.llm.prefill(payload.get("messages", []))
+                    if fails:
+                        await asyncio.sleep(self.llm.ttft * slowdown)
+                        error = {"error": {"message": "Injected failure", "type": "server_error"}}
+                        self._write(writer, 503, "application/json", json.dumps(error))
+                    elif payload.get("stream"):
+                        await self._stream(writer, payload)
+                    else:
+                        await self._complete(writer, payload)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _complete(self, writer: asyncio.StreamWriter, payload: Dict):
+        messages = payload.get("messages", [])
+        text = self.llm.reply(messages)
+        tokens = len(self.llm.tokens(text))
+        await asyncio.sleep(self.llm.delay(tokens, payload["slowdown"], payload["prefill"]))
+        body = {
+            "id": f"chatcmpl-{self.llm.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": self.llm.usage(messages, tokens),
+        }
+        self._write(writer, 200, "application/json", json.dumps(body))
+
+    async def _stream(self, writer: asyncio.StreamWriter, payload: Dict):
+        messages = payload.get("messages", [])
+        tokens = self.llm.tokens(self.llm.reply(messages))
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+        )
+        chunk = {
+            "id": f"chatcmpl-{self.llm.requests}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+        }
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for i, token in enumerate(tokens):
+            delay = self.llm.delay(i, payload["slowdown"], payload["prefill"])
+            await asyncio.sleep(max(0.0, start + delay - loop.time()))
+            delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+            chunk["choices"] = [{"index": 0, "delta": delta, "finish_reason": None}]
+            self._write_event(writer, json.dumps(chunk))
+            await writer.drain()
+        chunk["choices"] = [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        self._write_event(writer, json.dumps(chunk))
+        self._write_event(writer, "[DONE]")
+        writer.write(b"0\r\n\r\n")
+        self.llm.usage(messages, len(tokens))
+
+    @staticmethod
+    def _write_event(writer: asyncio.StreamWriter, data: str):
+        event = f"data: {data}\n\n".encode("utf-8")
+        writer.write(f"{len(event):x}\r\n".encode("latin-1") + event + b"\r\n")
+
+    @staticmethod
+    def _write(writer: asyncio.StreamWriter, status: int, content_type: str, text: str):
+        body = text.encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+
+
+class HashingEncoder:
+    """
+    Stand-in for a SentenceTransformer (pass it as EmbeddingModel(model=...)):
+    words are hashed into a signed bag-of-words vector, so texts sharing
+    words are similar. Each encode call sleeps `seconds_per_batch +
+    seconds_per_text * len(texts)` to simulate model cost.
+    """
+
+    def __init__(self, dimension: int = 384, seconds_per_batch: float = 0.0, seconds_per_text: float = 0.0):
+        self.dimension = dimension
+        self.seconds_per_batch = seconds_per_batch
+        self.seconds_per_text = seconds_per_text
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True) -> np.ndarray:
+        start = time.perf_counter()
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                h = zlib.crc32(word.encode("utf-8"))
+                vectors[row, h % self.dimension] += 1.0 if h & 0x80000000 else -1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms > 0, norms, 1.0)
+        _sleep_until(start + self.seconds_per_batch + self.seconds_per_text * len(texts))
+        return vectors
+
+
+def synthetic_speech(
+    text: str,
+    sample_rate: int = 16000,
+    seconds_per_word: float = 0.3,
+    leading_silence: float = 0.3,
+    trailing_silence: float = 1.0,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Speech-like float32 audio for `text`: one voiced burst (a harmonic tone
+    with an attack/decay envelope) per word, separated by short gaps that
+    stay below StreamingRecognizer's pause threshold, over low background
+    noise. The trailing silence ends the utterance.
+    """
+    rng = np.random.default_rng(seed)
+    word_samples = int(seconds_per_word * sample_rate)
+    voiced = int(0.8 * word_samples)
+    t = np.arange(voiced) / sample_rate
+    envelope = np.minimum(1.0, np.minimum(t, t[::-1]) / 0.02)
+
+    words = text.split()
+    lead = int(leading_silence * sample_rate)
+    audio = np.zeros(lead + len(words) * word_samples + int(trailing_silence * sample_rate), dtype=np.float32)
+    for i in range(len(words)):
+        f0 = rng.uniform(110.0, 220.0)
+        burst = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in (1, 2, 3))
+        start = lead + i * word_samples
+        audio[start : start + voiced] = 0.2 * envelope * burst
+    audio += 0.002 * rng.standard_normal(audio.shape[0]).astype(np.float32)
+    return audio
+
+
+class ScriptedSTT:
+    """
+    WhisperSTT stand-in for synthetic_speech audio. `expect(text)` sets the
+    transcript of the next utterance; a clip transcribes to the words that
+    fit its duration, so partial hypotheses grow as the user "speaks".
+    Decoding takes `overhead + realtime_factor * clip seconds`.
+
+    Utterances are assumed to fit StreamingRecognizer's window (one segment).
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        seconds_per_word: float = 0.3,
+        realtime_factor: float = 0.1,
+        overhead: float = 0.02,
+    ):
+        self.sample_rate = sample_rate
+        self.seconds_per_word = seconds_per_word
+        self.realtime_factor = realtime_factor
+        self.overhead = overhead
+        self.calls = 0
+        self._words: List[str] = []
+
+    def expect(self, text: str):
+        self._words = text.split()
+
+    @tracer.traced("stt.transcribe")
+    def transcribe(self, audio: np.ndarray) -> str:
+        start = time.perf_counter()
+        self.calls += 1
+        seconds = np.asarray(audio).shape[0] / self.sample_rate
+        spoken = min(len(self._words), int(seconds / self.seconds_per_word + 0.5))
+        _sleep_until(start + self.overhead + self.realtime_factor * seconds)
+        return " ".join(self._words[:spoken])
+
+
+class NullTTS:
+    """
+    WindowsTTS stand-in that discards speech. With `words_per_second`,
+    `speak` blocks for the playback time, as the real engine does, and
+    stops early when its `cancel` event is set.
+    """
+
+    def __init__(self, words_per_second: float = 0.0):
+        self.words_per_second = words_per_second
+        self.chunks = 0
+        self.words = 0
+
+    @tracer.traced("tts.speak")
+    def speak(self, text: str, cancel: Optional[threading.Event] = None):
+        words = len(text.split())
+        self.chunks += 1
+        self.words += words
+        if self.words_per_second:
+            if cancel is None:
+                time.sleep(words / self.words_per_second)
+            else:
+                cancel.wait(words / self.words_per_second)  # returns at once on barge-in
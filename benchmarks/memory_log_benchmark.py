@@ -0,0 +1,88 @@
+"""
+Write throughput and resume time of the durable memory log (MemoryJournal).
+
+Writes `--records` memory items through Memory + MemoryJournal (batched
+fsync, snapshots every `--snapshot-every` records, compaction off so the log
+really holds every record), then measures:
+- resume: snapshot + records after it, into a fresh Memory/ContextController
+- tail: the last 100 records read backwards from the end of the log
+- full replay: decoding the whole log, i.e. what resume would cost without snapshots
+
+Use the command below to run
+py -m benchmarks.memory_log_benchmark --records 1000000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import benchmarks  # noqa: F401  (puts src/ on sys.path)
+from agent.context.controller import ContextController
+from agent.context.packet import ContextPacket
+from agent.memory import Memory
+from agent.memory_log import MemoryJournal
+
+
+def write(path: str, records: int, max_items: int, snapshot_every: int) -> float:
+    memory = Memory(max_items=max_items)
+    controller = ContextController()
+    journal = MemoryJournal(path, memory, controller, snapshot_every=snapshot_every, compact_bytes=2**62)
+    journal.resume()
+
+    start = time.perf_counter()
+    for i in range(records):
+        role = "user" if i % 2 == 0 else "assistant"
+        memory.add(role, f"Message {i}: what does supervised learning need? It needs labeled examples.")
+        if i % 20 == 0:
+            controller.add(ContextPacket("reflection", f"Summary up to {i}", "reflection", ttl=30, priority=20))
+        if i % 2 == 1:
+            controller.step()
+    journal.close()  # includes the final fsync
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--max-items", type=int, default=1000)
+    parser.add_argument("--snapshot-every", type=int, default=1000)
+    parser.add_argument("--last-n", type=int, default=100)
+    parser.add_argument("--dir", default=None, help="where to write the log (default: a temp dir)")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="memory_log_")
+    path = os.path.join(directory, "bench")
+    try:
+        elapsed = write(path, args.records, args.max_items, args.snapshot_every)
+        journal_records = args.records + args.records // 20 + args.records // 2
+        size = os.path.getsize(path + ".log")
+        print(
+            f"write   {args.records} memory items ({journal_records} log records) in {elapsed:.2f}s  "
+            f"{journal_records / elapsed:,.0f} records/s  log={size / 1e6:.1f} MB"
+        )
+
+        memory = Memory(max_items=args.max_items)
+        controller = ContextController()
+        journal = MemoryJournal(path, memory, controller)
+        stats = journal.resume(last_n=args.last_n)
+        print(
+            f"resume  last {len(memory)} items + {len(controller.packets)} packets in "
+            f"{stats['seconds'] * 1000:.2f} ms (replayed {stats['replayed']} records after the snapshot)"
+        )
+
+        start = time.perf_counter()
+        tail = journal.log.tail(args.last_n)
+        print(f"tail    last {len(tail)} records in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        start = time.perf_counter()
+        replayed = sum(1 for _ in journal.log.read_from())
+        print(f"replay  all {replayed} records in {(time.perf_counter() - start) * 1000:.0f} ms (no snapshot)")
+        journal.close()
+    finally:
+        if args.dir is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Sequence
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent callers for up to `max_wait_ms`
+    and runs them through `batch_fn` as one batch on a background thread.
+    `batch_fn` takes a list of items and returns a result per item, in order.
+    After `close`, submitting raises RuntimeError; items queued before it
+    still run.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = "micro-batcher",
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()  # no item is queued after the stop sentinel
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items: Sequence[Any]) -> List[Future]:
+        futures = []
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            for item in items:
+                future: Future = Future()
+                self._queue.put((item, future))
+                futures.append(future)
+        return futures
+
+    def map(self, items: Sequence[Any]) -> List[Any]:
+        """
+        Blocking helper: submit items and wait for all results.
+        """
+        return [future.result() for future in self.submit_many(items)]
+
+    def close(self):
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._thread.join()
+        # Only left over if the worker died; never leave a caller waiting
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None and entry[1].set_running_or_notify_cancel():
+                entry[1].set_exception(RuntimeError("MicroBatcher is closed"))
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._queue.put(None)  # finish this batch, then stop
+                    break
+                batch.append(entry)
+
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        # Futures cancelled while queued are dropped; the rest can no longer be cancelled
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = list(self.batch_fn([item for item, _ in batch]))
+            if len(results) != len(batch):
+                raise ValueError(f"batch_fn returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -1,46 +1,280 @@
-from typing import List
+from bisect import insort
+from heapq import merge
+from typing import Any, Dict, List, Optional, Tuple
 from agent.context.packet import ContextPacket
+from agent.context.tokens import TokenEstimator
+
+
+PROMPT_LAYOUTS = ("priority", "prefix")
+
+# Order of packet types in the "prefix" layout: static first, most volatile last
+_LAYOUT_RANKS = {"system": 0, "conversation": 1, "reflection": 2, "retrieved_knowledge": 3, "audio_state": 4}
+
+
+def _priority_key(packet: ContextPacket) -> int:
+    return -packet.priority
+
+
+def _layout_rank(placed: Tuple[ContextPacket, List[dict]]) -> int:
+    return _LAYOUT_RANKS.get(placed[0].type, 3)
 
 
 class ContextController:
     """
     Manages context packets and assembles LLM-ready messages.
+
+    Packets are kept sorted by priority as they are added, and assembly fills
+    `token_budget` greedily from the highest priority down: packets that no
+    longer fit are truncated (text packets, or the oldest messages of a
+    conversation) or dropped. Rendered packets are cached, so unchanged
+    packets are not re-rendered or re-counted every turn.
+
+    Layouts decide the order of the assembled messages (the budget is
+    always filled by priority):
+
+    - "priority": highest priority first
+    - "prefix": for upstream prefix (KV) caching. Static packets ("system":
+      instructions) come first, then conversations, reflection summaries,
+      retrieval and audio state last, so consecutive prompts share a long
+      prefix. Conversations are kept append-only: they start at the same
+      message as in the previous build until it no longer fits, and are then
+      cut to `prefix_headroom` of the room, so that later turns append again.
+
+    With a `journal` (see agent.memory_log.MemoryJournal) added packets and
+    steps are also written to disk.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        estimator: Optional[TokenEstimator] = None,
+        min_truncated_tokens: int = 32,
+        layout: str = "priority",
+        prefix_headroom: float = 0.5,
+    ):
+        if layout not in PROMPT_LAYOUTS:
+            raise ValueError(f"Unknown prompt layout {layout!r}, expected one of {PROMPT_LAYOUTS}")
         self._packets: List[ContextPacket] = []
+        self.token_budget = token_budget  # None = no limit
+        self.estimator = estimator or TokenEstimator()
+        self.min_truncated_tokens = min_truncated_tokens  # smaller remnants are dropped instead
+        # id(packet) -> (content, content length, messages, per-message tokens)
+        self._render_cache: Dict[int, Tuple[Any, int, List[dict], List[int]]] = {}
+        self.layout = layout
+        self.prefix_headroom = prefix_headroom
+        # (packet type, source) or ("window", key) -> first message kept last time
+        self._anchors: Dict[Tuple[str, str], dict] = {}
+        self.last_build: Dict[str, Any] = {}
+        self.journal = None
+
+    @property
+    def packets(self) -> List[ContextPacket]:
+        return self._packets
 
     def add(self, packet: ContextPacket):
-        self._packets.append(packet)
+        if self.journal is None:
+            # Equal priorities keep insertion order
+            insort(self._packets, packet, key=_priority_key)
+            return
+        with self.journal.lock:
+            insort(self._packets, packet, key=_priority_key)
+            self.journal.packet_added(packet)
+
+    def replace(self, packet: ContextPacket):
+        """
+        Swap in `packet` for any packets with the same type and source.
+        A packet with empty content only removes them.
+        """
+        if self.journal is None:
+            self._replace(packet)
+            return
+        with self.journal.lock:
+            self._replace(packet)
+            self.journal.packet_added(packet, replace=True)
+
+    def _replace(self, packet: ContextPacket):
+        self._packets = [
+            p for p in self._packets if (p.type, p.source) != (packet.type, packet.source)
+        ]
+        if packet.content:
+            insort(self._packets, packet, key=_priority_key)
 
     def step(self):
         """
         Advance context lifecycle by one turn.
         Decrements TTLs and removes expired packets.
         """
+        if self.journal is None:
+            self._step()
+            return
+        with self.journal.lock:
+            self._step()
+            self.journal.stepped()
+
+    def _step(self):
         for packet in self._packets:
             packet.step()
 
         self._packets = [
             packet for packet in self._packets if not packet.is_expired()
         ]
+        live = {id(packet) for packet in self._packets}
+        for key in [key for key in self._render_cache if key not in live]:
+            del self._render_cache[key]
 
-    def build_messages(self) -> List[dict]:
+    def build_messages(
+        self,
+        packets: Optional[List[ContextPacket]] = None,
+        suffix: Optional[List[dict]] = None,
+        token_budget: Optional[int] = None,
+    ) -> List[dict]:
         """
-        Assemble messages for LLM consumption.
+        Assemble messages for LLM consumption, ordered by the layout.
+        packets: extra packets for this call only (e.g. this turn's retrieval)
+        suffix: messages always appended last (e.g. the current user turn);
+                their tokens are reserved before any packet is placed
+        token_budget: overrides the controller's budget for this call
         """
-        messages = []
+        budget = self.token_budget if token_budget is None else token_budget
+        suffix = suffix or []
+        remaining = None
+        if budget is not None:
+            remaining = budget - self.estimator.count_messages(suffix)
+
+        ordered = self._packets
+        if packets:
+            ordered = merge(self._packets, sorted(packets, key=_priority_key), key=_priority_key)
 
-        # Sort packets by priority (descending)
-        packets = sorted(self._packets, key=lambda p: p.priority, reverse=True)
+        placed: List[Tuple[ContextPacket, List[dict]]] = []
+        truncated = dropped = 0
+        for packet in ordered:
+            rendered, tokens = self._rendered(packet)
+            if not rendered:
+                continue
+            if self.layout == "prefix" and packet.type == "conversation":
+                kept = self._anchored((packet.type, packet.source), rendered, tokens, remaining)
+                if kept:
+                    placed.append((packet, kept))
+                    if remaining is not None:
+                        remaining -= sum(tokens[len(rendered) - len(kept):])
+                truncated += 0 < len(kept) < len(rendered)
+                dropped += not kept
+                continue
 
-        for packet in packets:
-            rendered = self._render_packet(packet)
-            if rendered:
-                messages.extend(rendered)
+            cost = sum(tokens)
+            if remaining is None or cost <= remaining:
+                placed.append((packet, rendered))
+                if remaining is not None:
+                    remaining -= cost
+                continue
 
+            fitted = self._fit(packet, rendered, tokens, remaining)
+            if fitted:
+                placed.append((packet, fitted))
+                remaining -= self.estimator.count_messages(fitted)
+                truncated += 1
+            else:
+                dropped += 1
+
+        if self.layout == "prefix":
+            placed.sort(key=_layout_rank)  # stable: priority order within a rank
+        messages = [message for _, rendered in placed for message in rendered]
+        messages.extend(suffix)
+        for packet in packets or []:
+            self._render_cache.pop(id(packet), None)  # one-off packets are not reused
+        self.last_build = {
+            "budget": budget,
+            "tokens": self.estimator.count_messages(messages),
+            "messages": len(messages),
+            "truncated": truncated,
+            "dropped": dropped,
+        }
         return messages
 
+    def window(self, key: str, messages: List[dict], token_budget: Optional[int] = None) -> List[dict]:
+        """
+        Append-only view of a growing message list outside of packets
+        (e.g. the planner's history), kept the same way as conversations in
+        the "prefix" layout. `key` names the list.
+        """
+        tokens = [self.estimator.count_message(m) for m in messages]
+        return self._anchored(("window", key), messages, tokens, token_budget)
+
+    def _anchored(
+        self, key: Tuple[str, str], rendered: List[dict], tokens: List[int], remaining: Optional[int]
+    ) -> List[dict]:
+        """
+        Keep messages from the anchor (the first message kept last time) while
+        they fit in `remaining`. Otherwise, or when the anchor is gone (e.g.
+        evicted from memory), move the anchor forward far enough to leave
+        headroom for the next turns. [] if nothing should be kept.
+        """
+        anchor = self._anchors.get(key)
+        start = 0
+        if anchor is not None:
+            # Same dict while memory holds it; equal content after a reload
+            start = next((i for i, m in enumerate(rendered) if m is anchor), None)
+            if start is None:
+                start = next((i for i, m in enumerate(rendered) if m == anchor), None)
+
+        if start is None or (remaining is not None and sum(tokens[start:]) > remaining):
+            lost = start is None
+            if remaining is None:
+                start = len(rendered) // 2
+            elif remaining < self.min_truncated_tokens:
+                start = len(rendered)
+            else:
+                room = remaining * self.prefix_headroom
+                start = len(rendered)
+                while start > 0 and tokens[start - 1] <= room:
+                    start -= 1
+                    room -= tokens[start]
+                if lost:
+                    start = max(start, len(rendered) // 2)
+
+        if start >= len(rendered):
+            self._anchors.pop(key, None)
+            return []
+        self._anchors[key] = rendered[start]
+        return rendered[start:]
+
+    def _rendered(self, packet: ContextPacket) -> Tuple[List[dict], List[int]]:
+        size = len(packet.content) if isinstance(packet.content, list) else -1
+        cached = self._render_cache.get(id(packet))
+        if cached is not None and cached[0] is packet.content and cached[1] == size:
+            return cached[2], cached[3]
+        rendered = self._render_packet(packet)
+        tokens = [self.estimator.count_message(m) for m in rendered]
+        self._render_cache[id(packet)] = (packet.content, size, rendered, tokens)
+        return rendered, tokens
+
+    def _fit(
+        self, packet: ContextPacket, rendered: List[dict], tokens: List[int], remaining: int
+    ) -> List[dict]:
+        """
+        Shrink a packet's messages to `remaining` tokens; [] if it should be dropped.
+        """
+        if remaining < self.min_truncated_tokens:
+            return []
+
+        if packet.type == "conversation":
+            # Keep the most recent messages that fit
+            kept = 0
+            for cost in reversed(tokens):
+                if cost > remaining:
+                    break
+                remaining -= cost
+                kept += 1
+            return rendered[len(rendered) - kept:] if kept else []
+
+        if len(rendered) == 1:
+            content = self.estimator.truncate(
+                rendered[0]["content"], remaining - self.estimator.message_overhead
+            )
+            if content:
+                return [{"role": rendered[0]["role"], "content": content}]
+        return []
+
     def _render_packet(self, packet: ContextPacket) -> List[dict]:
         """
         Convert a ContextPacket into LLM messages.
@@ -51,10 +285,26 @@ class ContextController:
                 "content": packet.content
             }]
 
+        if packet.type == "system":
+            # Static instructions: byte-identical across turns
+            return [{
+                "role": "system",
+                "content": packet.content
+            }]
+
         if packet.type == "conversation":
             # content is already a list of messages
             return packet.content
 
+        if packet.type == "audio_state":
+            metadata = packet.metadata or {}
+            if not metadata.get("audio_state"):
+                return []
+            content = f"Audio state: {metadata['audio_state']}"
+            if any(t.get("event") == "interrupt" for t in metadata.get("transitions", [])):
+                content += "\nThe user interrupted your previous response, so it was cut off."
+            return [{"role": "system", "content": content}]
+
         # Unknown packet type → ignore safely
         return []
 
@@ -6,7 +6,7 @@ class ContextPacket:
     """
     Represents a unit of context with explicit lifetime and source.
     """
-    type: str                # e.g. "conversation", "retrieved_knowledge", "reflection"
+    type: str                # e.g. "conversation", "retrieved_knowledge", "reflection", "system", "audio_state"
     content: Any             # str or structured data
     source: str              # e.g. "memory", "retriever", "reflection"
     ttl: int                 # -1 = persistent, >0 = decrement each turn
@@ -0,0 +1,84 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from agent.context.tokens import TokenEstimator
+
+
+def serialize_prompt(messages: List[Dict[str, str]]) -> str:
+    """
+    Flatten chat messages roughly the way a chat template does, so a common
+    string prefix approximates a common token prefix upstream.
+    """
+    return "".join(f"<|{m['role']}|>\n{m['content']}\n" for m in messages)
+
+
+def shared_prefix_length(a: str, b: str) -> int:
+    """
+    Length of the common prefix of two strings.
+    Binary search over slice comparisons, which run in C.
+    """
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class _PrefixStats:
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.shared_tokens = 0
+        self.last_shared_tokens = 0
+
+    def as_dict(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "mean_prompt_tokens": round(self.prompt_tokens / self.requests, 1) if self.requests else 0.0,
+            "mean_shared_tokens": round(self.shared_tokens / self.requests, 1) if self.requests else 0.0,
+            "shared_ratio": round(self.shared_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            "last_shared_tokens": self.last_shared_tokens,
+        }
+
+
+class PrefixTracker:
+    """
+    Measures how much of each prompt repeats the start of a recent prompt of
+    the same kind, i.e. how much an upstream prefix (KV) cache could reuse.
+
+    Each prompt is compared with the last `window` prompts of its kind and
+    the longest shared prefix counts, since a server caches many prefixes
+    (and sessions interleave). Token counts are estimates.
+    """
+
+    def __init__(self, window: int = 8, estimator: Optional[TokenEstimator] = None):
+        self.window = window
+        self.estimator = estimator or TokenEstimator()
+        self._recent: Dict[str, Deque[str]] = {}
+        self._stats: Dict[str, _PrefixStats] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind: str, messages: List[Dict[str, str]]) -> Tuple[int, int]:
+        """
+        Record one request; returns (shared prefix tokens, prompt tokens).
+        """
+        prompt = serialize_prompt(messages)
+        with self._lock:
+            recent = self._recent.setdefault(kind, deque(maxlen=self.window))
+            shared = max((shared_prefix_length(prompt, previous) for previous in recent), default=0)
+            recent.append(prompt)
+            stats = self._stats.setdefault(kind, _PrefixStats())
+            shared_tokens = self.estimator.count(prompt[:shared])
+            prompt_tokens = self.estimator.count(prompt)
+            stats.requests += 1
+            stats.prompt_tokens += prompt_tokens
+            stats.shared_tokens += shared_tokens
+            stats.last_shared_tokens = shared_tokens
+        return shared_tokens, prompt_tokens
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {kind: stats.as_dict() for kind, stats in self._stats.items()}
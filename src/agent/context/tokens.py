@@ -0,0 +1,49 @@
+import math
+from typing import Dict, List, Optional
+
+
+class TokenEstimator:
+    """
+    Counts prompt tokens.
+
+    Uses `tokenizer` (anything with encode/decode, e.g. a tiktoken encoding or
+    a HuggingFace tokenizer) when given, otherwise a fast local estimate of
+    ~4 characters per token, which is close for English text on BPE models.
+    """
+
+    def __init__(self, tokenizer=None, chars_per_token: float = 4.0, message_overhead: int = 4):
+        self.tokenizer = tokenizer
+        self.chars_per_token = chars_per_token
+        self.message_overhead = message_overhead  # role + separators per chat message
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text))
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def count_message(self, message: Dict[str, str]) -> int:
+        return self.count(message["content"]) + self.message_overhead
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        return sum(self.count_message(m) for m in messages)
+
+    def truncate(self, text: str, max_tokens: int, marker: str = " ...") -> Optional[str]:
+        """
+        Cut `text` to at most `max_tokens` tokens (marker included).
+        Returns None if not even the marker fits.
+        """
+        if self.count(text) <= max_tokens:
+            return text
+        budget = max_tokens - self.count(marker)
+        if budget <= 0:
+            return None
+        if self.tokenizer is not None:
+            return self.tokenizer.decode(self.tokenizer.encode(text)[:budget]) + marker
+        cut = int(budget * self.chars_per_token)
+        # Prefer ending on a word boundary
+        space = text.rfind(" ", 0, cut)
+        if space > cut // 2:
+            cut = space
+        return text[:cut] + marker
@@ -0,0 +1,322 @@
+import asyncio
+import inspect
+import queue
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from agent.tracing import tracer
+
+RETRY_STATUS = {408, 409, 429}  # plus every 5xx
+CANCEL_POLL_S = 0.05  # how often a blocked stream reader checks its cancel event
+
+
+@dataclass
+class RequestPolicy:
+    timeout: float = 30.0  # seconds per attempt (streams: until the first token)
+    retries: int = 2
+    hedge: bool = False  # send a second request if the first is slower than the recent p95
+
+
+DEFAULT_POLICIES = {
+    "planner": RequestPolicy(timeout=10.0, retries=2, hedge=True),
+    "response": RequestPolicy(timeout=30.0, retries=1),
+    "reflection": RequestPolicy(timeout=60.0, retries=3),
+}
+
+
+class _KindStats:
+    def __init__(self, window: int = 256):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def quantile(self, q: float) -> float:
+        recent = sorted(self.recent)
+        return recent[min(len(recent) - 1, int(q * len(recent)))] if recent else 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50_ms": round(1000 * self.quantile(0.50), 2),
+            "p95_ms": round(1000 * self.quantile(0.95), 2),
+        }
+
+
+def _retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    from openai import APIConnectionError, APIStatusError  # loaded with the client
+
+    if isinstance(error, APIConnectionError):  # includes APITimeoutError
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code in RETRY_STATUS or error.status_code >= 500)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+_DONE = object()
+
+
+class LLMClient:
+    """
+    Async OpenAI-compatible client shared by every session.
+
+    One AsyncOpenAI client (one connection pool) runs on a private event
+    loop thread, so both blocking callers (LLMWrapper in worker threads) and
+    async callers (`acomplete`) share its connections and limits:
+
+    - at most `max_concurrency` requests are in flight upstream; the rest wait
+    - each request kind ("planner", "response", "reflection") has its own
+      RequestPolicy: timeout per attempt and number of retries
+    - timeouts, connection errors, 408/409/429 and 5xx are retried with
+      full-jitter exponential backoff. A server's Retry-After is followed up
+      to `retry_after_cap` (and the attempt's timeout); a longer one is not
+      waited out: the error is raised so the caller can fall back
+    - kinds with `hedge` send a second request when the first has not
+      answered within the p95 of recent requests of that kind; the first
+      answer wins and the other is cancelled. No hedge is sent while every
+      slot is busy, so hedging does not add load to a saturated upstream.
+
+    Streams are retried only until their first token.
+    `client` may be any AsyncOpenAI-compatible object (e.g. for tests).
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        max_concurrency: int = 16,
+        policies: Optional[Dict[str, RequestPolicy]] = None,
+        backoff_base: float = 0.25,
+        backoff_cap: float = 4.0,
+        retry_after_cap: float = 30.0,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_initial_delay: Optional[float] = None,
+        http_client=None,
+        client=None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.policies = dict(DEFAULT_POLICIES)
+        self.policies.update(policies or {})
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_after_cap = retry_after_cap
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_initial_delay = hedge_initial_delay  # hedge delay until enough samples (None: no hedging)
+        if client is None:
+            from openai import AsyncOpenAI  # deferred: a slow import
+            client = AsyncOpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                max_retries=0,  # retries are ours
+                timeout=max(policy.timeout for policy in self.policies.values()),
+                http_client=http_client,
+            )
+        self.client = client
+        self._stats: Dict[str, _KindStats] = {}
+        self._rng = random.Random()
+
+        self._loop = asyncio.new_event_loop()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="llm-io", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def complete(self, model: str, messages: List[Dict[str, str]], kind: str = "response"):
+        """
+        Blocking chat completion (returns the API response object).
+        """
+        return asyncio.run_coroutine_threadsafe(self._complete(model, messages, kind), self._loop).result()
+
+    async def acomplete(self, model: str, messages: List[Dict[str, str]], kind: str = "response"):
+        """
+        Chat completion for callers on any event loop.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._complete(model, messages, kind), self._loop)
+        return await asyncio.wrap_future(future)
+
+    def stream(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        kind: str = "response",
+        cancel: Optional[threading.Event] = None,
+    ) -> Iterator[Any]:
+        """
+        Blocking iterator over stream chunks. Closing it early cancels the
+        request; so does setting `cancel`, which ends the iteration (within
+        CANCEL_POLL_S, even while waiting for the first token).
+        """
+        chunks: "queue.Queue" = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._pump(model, messages, kind, chunks), self._loop)
+        try:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    return
+                try:
+                    chunk = chunks.get(timeout=None if cancel is None else CANCEL_POLL_S)
+                except queue.Empty:
+                    continue
+                if chunk is _DONE:
+                    break
+                yield chunk
+            future.result()  # raises the request's error, if any
+        finally:
+            future.cancel()
+
+    def stats(self) -> Dict[str, Dict]:
+        return {kind: stats.as_dict() for kind, stats in self._stats.items()}
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        close = getattr(self.client, "close", None)
+        if close is not None:
+
+            async def close_client():
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+
+            asyncio.run_coroutine_threadsafe(close_client(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _run_loop(self, ready: threading.Event):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        ready.set()
+        self._loop.run_forever()
+
+    def _policy(self, kind: str) -> RequestPolicy:
+        return self.policies.get(kind) or self.policies["response"]
+
+    def _kind_stats(self, kind: str) -> _KindStats:
+        stats = self._stats.get(kind)
+        if stats is None:
+            stats = self._stats[kind] = _KindStats()
+        return stats
+
+    async def _complete(self, model: str, messages: List[Dict[str, str]], kind: str):
+        policy = self._policy(kind)
+        stats = self._kind_stats(kind)
+        stats.requests += 1
+
+        async def attempt():
+            async with self._semaphore:
+                return await asyncio.wait_for(
+                    self.client.chat.completions.create(model=model, messages=messages), policy.timeout
+                )
+
+        start = time.perf_counter()
+        response = await self._with_retries(
+            kind, policy, stats, lambda: self._hedged(kind, stats, attempt) if policy.hedge else attempt()
+        )
+        stats.recent.append(time.perf_counter() - start)
+        return response
+
+    async def _pump(self, model: str, messages: List[Dict[str, str]], kind: str, chunks: "queue.Queue"):
+        policy = self._policy(kind)
+        stats = self._kind_stats(kind)
+        stats.requests += 1
+
+        async def first_chunk():
+            stream = await asyncio.wait_for(
+                self.client.chat.completions.create(model=model, messages=messages, stream=True), policy.timeout
+            )
+            try:
+                return stream, await asyncio.wait_for(stream.__anext__(), policy.timeout)
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                await stream.close()
+                raise
+
+        try:
+            async with self._semaphore:  # held for the whole stream
+                start = time.perf_counter()
+                stream, chunk = await self._with_retries(kind, policy, stats, first_chunk)
+                stats.recent.append(time.perf_counter() - start)
+                try:
+                    while chunk is not None:
+                        chunks.put(chunk)
+                        chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    pass
+                finally:
+                    await stream.close()
+        finally:
+            chunks.put(_DONE)
+
+    async def _with_retries(self, kind: str, policy: RequestPolicy, stats: _KindStats, call):
+        for attempt in range(policy.retries + 1):
+            try:
+                return await call()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    stats.timeouts += 1
+                retry = attempt < policy.retries and _retryable(e)
+                retry_after = _retry_after(e) if retry else None
+                if retry_after is not None and retry_after > min(self.retry_after_cap, policy.timeout):
+                    retry = False  # the server asks for a longer wait than this request has
+                if not retry:
+                    stats.errors += 1
+                    raise
+                stats.retries += 1
+                tracer.count("llm_retries", kind=kind)
+                delay = self._rng.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                await asyncio.sleep(delay)
+
+    async def _hedged(self, kind: str, stats: _KindStats, attempt):
+        if len(stats.recent) >= self.hedge_min_samples:
+            delay = stats.quantile(self.hedge_quantile)
+        else:
+            delay = self.hedge_initial_delay
+        tasks = [asyncio.ensure_future(attempt())]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and not self._semaphore.locked():
+                    stats.hedges += 1
+                    tracer.count("llm_hedges", kind=kind)
+                    tasks.append(asyncio.ensure_future(attempt()))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            stats.hedge_wins += 1
+                        return task.result()
+            return tasks[0].result()  # every attempt failed: raise the first one's error
+        finally:
+            for task in tasks:
+                task.cancel()
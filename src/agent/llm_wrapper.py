@@ -1,25 +1,140 @@
-from openai import OpenAI
-from typing import List, Dict
+import threading
+import time
+from typing import TYPE_CHECKING, List, Dict, Iterator, Optional
+from agent.context.prefix import PrefixTracker
+from agent.context.tokens import TokenEstimator
+from agent.tracing import tracer
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 class LLMWrapper:
     """
     A wrapper for OpenAI-compatible API.
+    Calls are traced as "llm.generate" / "llm.stream" spans, with token counts.
+    `client` is an OpenAI client or an LLMClient (pooled, with per-kind
+    timeouts, retries and hedging; see agent.llm_client).
+    Every upstream request is measured for the prompt prefix it shares with
+    recent requests of its kind (see `prefix_stats`).
     """
 
-    def __init__(self, client: OpenAI, model: str, embedding_model: str):
+    def __init__(self, client: "OpenAI", model: str, embedding_model: str, response_cache=None):
         self.client = client
         self.model = model
         self.embedding_model = embedding_model
+        self.response_cache = response_cache  # optional ResponseCache
+        self.estimator = TokenEstimator()  # token counts when the API reports no usage
+        self.prefix_tracker = PrefixTracker(estimator=self.estimator)
+
+    def generate(self, messages: List[Dict[str, str]], use_cache: bool = False, kind: str = "response") -> str:
+        """
+        messages: [{"role": "system|user|assistant", "content": "..."}]
+        use_cache: consult/populate the response cache (final answers only,
+                   not planner or reflection calls)
+        kind: "planner", "response" or "reflection" (selects the LLMClient policy)
+        """
+        with tracer.span("llm.generate", kind=kind) as span:
+            cache = self.response_cache if use_cache else None
+            if cache is not None:
+                cached: Optional[str] = cache.lookup(messages)
+                if cached is not None:
+                    span.set(cached=True)
+                    return cached
+
+            self._observe_prefix(span, messages, kind)
+            start = time.perf_counter()
+            response = self._create(messages, kind)
+            # return response.choices[0].message["content"]
+            # HuggingFace ChatCompletion returns ChatCompletionMessage object
+            content = response.choices[0].message.content
 
-    def generate(self, messages: List[Dict[str, str]]) -> str:
+            if tracer.enabled:
+                self._count_tokens(span, messages, content, getattr(response, "usage", None))
+            if cache is not None:
+                cache.store(messages, content, latency=time.perf_counter() - start)
+            return content
+
+    def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        use_cache: bool = False,
+        kind: str = "response",
+        cancel: Optional[threading.Event] = None,
+    ) -> Iterator[str]:
         """
+        Stream the completion as text deltas as they arrive.
         messages: [{"role": "system|user|assistant", "content": "..."}]
+        A cache hit is yielded as a single chunk.
+        cancel: when set, the stream ends early and the request is cancelled
+                (e.g. on barge-in); a cancelled answer is not cached
         """
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages
-        )
-        # return response.choices[0].message["content"]
-        # HuggingFace ChatCompletion returns ChatCompletionMessage object
-        return response.choices[0].message.content
-    
\ No newline at end of file
+        with tracer.span("llm.stream", kind=kind) as span:
+            cache = self.response_cache if use_cache else None
+            if cache is not None:
+                cached = cache.lookup(messages)
+                if cached is not None:
+                    span.set(cached=True)
+                    yield cached
+                    return
+
+            self._observe_prefix(span, messages, kind)
+            start = time.perf_counter()
+            stream = self._create(messages, kind, stream=True, cancel=cancel)
+            parts = []
+            try:
+                for chunk in stream:
+                    if cancel is not None and cancel.is_set():
+                        break
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if not parts:
+                            span.set(first_token_ms=round(1000 * (time.perf_counter() - start), 1))
+                        parts.append(delta)
+                        yield delta
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()  # stops the upstream request if it is still running
+
+            if tracer.enabled:
+                self._count_tokens(span, messages, "".join(parts), None)
+            if cancel is not None and cancel.is_set():
+                span.set(cancelled=True)
+                tracer.count("llm_cancelled", kind=kind)
+                return
+            if cache is not None:
+                cache.store(messages, "".join(parts), latency=time.perf_counter() - start)
+
+    def prefix_stats(self) -> Dict[str, Dict]:
+        """
+        Per kind: mean prompt and shared-prefix tokens (estimated) and their ratio.
+        """
+        return self.prefix_tracker.stats()
+
+    def _observe_prefix(self, span, messages: List[Dict[str, str]], kind: str):
+        shared, _ = self.prefix_tracker.observe(kind, messages)
+        span.set(shared_prefix_tokens=shared)
+        tracer.count("llm_shared_prefix_tokens", shared, kind=kind)
+
+    def _create(
+        self, messages: List[Dict[str, str]], kind: str, stream: bool = False, cancel: Optional[threading.Event] = None
+    ):
+        if hasattr(self.client, "complete"):  # LLMClient
+            if stream:
+                return self.client.stream(self.model, messages, kind=kind, cancel=cancel)
+            return self.client.complete(self.model, messages, kind=kind)
+        if stream:
+            return self.client.chat.completions.create(model=self.model, messages=messages, stream=True)
+        return self.client.chat.completions.create(model=self.model, messages=messages)
+
+    def _count_tokens(self, span, messages: List[Dict[str, str]], content: str, usage):
+        if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+            prompt, completion = usage.prompt_tokens, usage.completion_tokens
+        else:
+            prompt = self.estimator.count_messages(messages)
+            completion = self.estimator.count(content or "")
+        span.set(prompt_tokens=prompt, completion_tokens=completion)
+        tracer.count("llm_tokens", prompt, kind="prompt")
+        tracer.count("llm_tokens", completion, kind="completion")
@@ -1,13 +1,75 @@
-from typing import List, Dict, Optional
+import re
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional
 from datetime import datetime
 
+WORD = re.compile(r"\w+")
+
+
+class _Message(dict):
+    """
+    A shared {"role", "content"} message that refuses in-place changes.
+    dict(message) (or copy.copy) gives a plain, mutable copy.
+    """
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Memory messages are shared and read-only; copy with dict(message)")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class _Entry:
+    """
+    One stored memory item plus what the indexes need.
+    """
+    __slots__ = ("seq", "item", "message", "lowered", "words")
+
+    def __init__(self, seq: int, item: Dict):
+        self.seq = seq
+        self.item = item
+        # Built once; get_llm_messages hands out this same (read-only) dict every time
+        self.message = _Message(role=item["role"], content=item["content"])
+        self.lowered = item["content"].lower()
+        self.words = set(WORD.findall(self.lowered))
+
+
 class Memory:
     """
     Stores structured conversation history and supports retrieval.
+
+    Items live in a deque (O(1) eviction of the oldest) and are indexed by
+    role and by word, so `retrieve`, `get_latest` and `get_llm_messages(last_n)`
+    do not rescan the whole history. Items returned by `get`/`retrieve` are
+    shared; treat them as read-only. LLM messages are shared too and raise
+    TypeError if changed in place.
+
+    With a `journal` (see agent.memory_log.MemoryJournal) every added item
+    is also written to disk.
     """
     def __init__(self, max_items: int = 100):
-        self.history: List[Dict] = []
         self.max_items = max_items
+        self.history: Deque[Dict] = deque()
+        self._entries: Deque[_Entry] = deque()
+        self._by_role: Dict[str, Deque[_Entry]] = {}
+        self._by_word: Dict[str, Deque[_Entry]] = {}  # postings in insertion order
+        self._next_seq = 0
+        self.journal = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def total_added(self) -> int:
+        """
+        Items added (or loaded) so far, evicted ones included; a cursor for `messages_since`.
+        """
+        return self._next_seq
 
     def add(self, role: str, content: str, tags: Optional[List[str]] = None):
         """
@@ -19,53 +81,144 @@ class Memory:
             "timestamp": datetime.now().isoformat(),
             "tags": tags or []
         }
+        if self.journal is None:
+            self._append(item)
+        else:
+            with self.journal.lock:
+                self._append(item)
+                self.journal.memory_added(item)
+
+    def load(self, items: List[Dict]):
+        """
+        Append previously stored items as-is (timestamps kept, not journaled).
+        """
+        for item in items:
+            self._append(item)
+
+    def _append(self, item: Dict):
+        entry = _Entry(self._next_seq, item)
+        self._next_seq += 1
+
         self.history.append(item)
+        self._entries.append(entry)
+        self._by_role.setdefault(item["role"], deque()).append(entry)
+        for word in entry.words:
+            self._by_word.setdefault(word, deque()).append(entry)
+
         # Keep memory within max_items
-        if len(self.history) > self.max_items:
-            self.history.pop(0)
+        if len(self._entries) > self.max_items:
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        self.history.popleft()
+        entry = self._entries.popleft()
+        # The oldest entry is also the oldest in each of its postings
+        role_entries = self._by_role[entry.item["role"]]
+        role_entries.popleft()
+        if not role_entries:
+            del self._by_role[entry.item["role"]]
+        for word in entry.words:
+            postings = self._by_word[word]
+            postings.popleft()
+            if not postings:
+                del self._by_word[word]
 
     def get(self) -> List[Dict]:
         """
         Return full memory history.
         """
-        return self.history
+        return list(self.history)
 
     def retrieve(self, keyword: Optional[str] = None, role: Optional[str] = None) -> List[Dict]:
         """
         Retrieve relevant memory items by keyword or role.
+        keyword is a case-insensitive substring match, as before; the word index
+        only narrows the candidates.
         """
-        results = self.history
         if keyword:
-            results = [item for item in results if keyword.lower() in item["content"].lower()]
-        if role:
-            results = [item for item in results if item["role"] == role]
-        return results
+            entries = self._keyword_candidates(keyword.lower())
+            if role:
+                entries = [e for e in entries if e.item["role"] == role]
+        elif role:
+            entries = self._by_role.get(role, ())
+        else:
+            entries = self._entries
+        return [e.item for e in entries]
+
+    def _keyword_candidates(self, needle: str) -> List[_Entry]:
+        matches = list(WORD.finditer(needle))
+        # A word with a non-word character on both sides inside the needle
+        # is a whole word of every matching item: its postings are a superset
+        whole = [
+            m.group() for m in matches if m.start() > 0 and m.end() < len(needle)
+        ]
+        if whole:
+            postings = [self._by_word.get(word, ()) for word in whole]
+            return [e for e in min(postings, key=len) if needle in e.lowered]
+        if not matches:
+            return [e for e in self._entries if needle in e.lowered]
+
+        # Only partial words (e.g. "rout" or "router"): each may sit inside a
+        # longer word, so scan the vocabulary for words containing the longest one
+        anchor = max((m.group() for m in matches), key=len)
+        seen = set()
+        candidates = []
+        for word, postings in self._by_word.items():
+            if anchor in word:
+                for entry in postings:
+                    if entry.seq not in seen:
+                        seen.add(entry.seq)
+                        candidates.append(entry)
+        candidates.sort(key=lambda e: e.seq)
+        return [e for e in candidates if needle in e.lowered]
 
     def get_llm_messages(self, last_n: int = None, roles: list[str] = None) -> List[Dict]:
         """
         Return memory history formatted for LLM (only role and content).
         Can filter by roles and limit to last_n messages.
         Only include roles that are valid for the API: 'user', 'assistant', 'system'.
+        With last_n this is O(last_n), not O(history).
+        The message dicts are shared between calls and read-only; copy one
+        with dict(message) to change it.
         """
         safe_roles = ["user", "assistant", "system"]
         if roles is not None:
             safe_roles = [r for r in roles if r in safe_roles]
 
-        messages = [
-            {"role": m["role"], "content": m["content"]}
-            for m in self.history
-            if m["role"] in safe_roles
-        ]
-        if last_n is not None:
-            messages = messages[-last_n:]
-        return messages
+        if last_n is None:
+            return [e.message for e in self._entries if e.item["role"] in safe_roles]
+        if last_n <= 0:
+            return []
+
+        # Take up to last_n from the tail of each role's index, then merge by age
+        tail: List[_Entry] = []
+        for role in set(safe_roles):
+            entries = self._by_role.get(role)
+            if entries:
+                tail.extend(islice(reversed(entries), last_n))
+        tail.sort(key=lambda e: e.seq)
+        return [e.message for e in tail[-last_n:]]
+
+    def messages_since(self, cursor: int, roles: Optional[List[str]] = None):
+        """
+        LLM messages added at or after `cursor` (see `total_added`), oldest first,
+        plus the cursor to pass next time. O(new items).
+        """
+        new: List[_Entry] = []
+        for entry in reversed(self._entries):
+            if entry.seq < cursor:
+                break
+            new.append(entry)
+        new.reverse()
+        messages = [e.message for e in new if roles is None or e.item["role"] in roles]
+        return messages, self._next_seq
 
     def get_latest(self, role: str):
         """
         Return the content of the most recent message with the given role.
         Returns None if no such message exists.
         """
-        for msg in reversed(self.history):
-            if msg["role"] == role:
-                return msg["content"]
+        entries = self._by_role.get(role)
+        if entries:
+            return entries[-1].item["content"]
         return None
@@ -0,0 +1,358 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from dataclasses import asdict
+from typing import Dict, Iterator, List, Optional
+from agent.context.packet import ContextPacket
+
+MAGIC = b"AGMLOG1\0"
+HEADER = struct.Struct("<8sQ")  # magic, epoch
+PREFIX = struct.Struct("<II")   # payload length, crc32
+SUFFIX = struct.Struct("<I")    # payload length again, so the log can be read backwards
+FRAME = PREFIX.size + SUFFIX.size
+
+
+def _encode(record: Dict) -> bytes:
+    payload = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    return PREFIX.pack(len(payload), zlib.crc32(payload)) + payload + SUFFIX.pack(len(payload))
+
+
+def _fsync_directory(path: str):
+    # Makes a rename durable on POSIX; directories cannot be opened on Windows
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class RecordLog:
+    """
+    Append-only log of JSON records, each framed as
+    [length][crc32][payload][length].
+
+    Every append is written straight to the OS (a process crash loses
+    nothing); fsync is batched: at most `fsync_every` records or
+    `fsync_interval` seconds stay unsynced. A torn or corrupt tail left by a
+    power loss is detected on open and truncated away.
+
+    The trailing length lets `tail` read the newest records without scanning
+    the file. `epoch` (in the header) changes whenever the log is reset by
+    compaction.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 64, fsync_interval: float = 0.2):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.epoch = 0
+        self.recovered_bytes = 0  # bytes truncated by crash recovery
+
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._timer: Optional[threading.Timer] = None
+        self._file = None
+        self._open()
+
+    @property
+    def size(self) -> int:
+        return self._end
+
+    def append(self, record: Dict) -> int:
+        """
+        Append one record; returns the offset just past it.
+        """
+        frame = _encode(record)
+        with self._lock:
+            self._file.write(frame)
+            self._end += len(frame)
+            self._pending += 1
+            if self._pending >= self.fsync_every:
+                self._sync()
+            elif self._timer is None and self.fsync_interval is not None:
+                self._timer = threading.Timer(self.fsync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+            return self._end
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None and self._pending:
+                self._sync()
+
+    def read_from(self, offset: int = HEADER.size) -> Iterator[Dict]:
+        """
+        Yield records from `offset` to the end of the log.
+        """
+        with self._lock:
+            end = self._end
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read(end - offset)
+        pos = 0
+        while pos + FRAME <= len(data):
+            length, crc = PREFIX.unpack_from(data, pos)
+            payload = data[pos + PREFIX.size : pos + PREFIX.size + length]
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                raise ValueError(f"Corrupt record at offset {offset + pos} in {self.path}")
+            pos += FRAME + length
+            yield json.loads(payload)
+
+    def tail(self, n: int) -> List[Dict]:
+        """
+        Return the last `n` records (oldest first), reading backwards from the end.
+        """
+        records = []
+        with self._lock:
+            end = self._end
+        with open(self.path, "rb") as f:
+            while end > HEADER.size and len(records) < n:
+                f.seek(end - SUFFIX.size)
+                (length,) = SUFFIX.unpack(f.read(SUFFIX.size))
+                start = end - FRAME - length
+                f.seek(start + PREFIX.size)
+                records.append(json.loads(f.read(length)))
+                end = start
+        records.reverse()
+        return records
+
+    def reset(self, epoch: int):
+        """
+        Atomically replace the log with an empty one at `epoch`.
+        """
+        with self._lock:
+            self._close_file()
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(HEADER.pack(MAGIC, epoch))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            _fsync_directory(self.path)
+            self._open()
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _close_file(self):
+        if self._file is not None:
+            if self._pending:
+                self._sync()
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER.size:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, self.epoch))
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._file = open(self.path, "r+b", buffering=0)
+        magic, self.epoch = HEADER.unpack(self._file.read(HEADER.size))
+        if magic != MAGIC:
+            self._file.close()
+            self._file = None
+            raise ValueError(f"{self.path} is not a memory log")
+        self._end = self._file.seek(0, os.SEEK_END)
+        self._recover()
+        self._file.seek(self._end)
+
+    def _recover(self):
+        if self._valid_record_ending_at(self._end):
+            return
+        # Torn write: find the end of the last intact record and cut there
+        good = pos = HEADER.size
+        self._file.seek(pos)
+        data = self._file.read()
+        while pos - HEADER.size + FRAME <= len(data):
+            offset = pos - HEADER.size
+            length, crc = PREFIX.unpack_from(data, offset)
+            body = data[offset + PREFIX.size : offset + PREFIX.size + length]
+            trailer = data[offset + PREFIX.size + length : offset + FRAME + length]
+            if len(body) != length or zlib.crc32(body) != crc or trailer != SUFFIX.pack(length):
+                break
+            pos += FRAME + length
+            good = pos
+        self.recovered_bytes = self._end - good
+        self._file.truncate(good)
+        os.fsync(self._file.fileno())
+        self._end = good
+
+    def _valid_record_ending_at(self, end: int) -> bool:
+        if end == HEADER.size:
+            return True
+        if end - HEADER.size < FRAME:
+            return False
+        self._file.seek(end - SUFFIX.size)
+        (length,) = SUFFIX.unpack(self._file.read(SUFFIX.size))
+        start = end - FRAME - length
+        if start < HEADER.size:
+            return False
+        self._file.seek(start)
+        prefix_length, crc = PREFIX.unpack(self._file.read(PREFIX.size))
+        return prefix_length == length and zlib.crc32(self._file.read(length)) == crc
+
+
+class MemoryJournal:
+    """
+    Persists a session's Memory and ContextController.
+
+    Every memory item, added or replaced packet and controller step is appended to a
+    RecordLog. Every `snapshot_every` records the full (bounded) state is
+    written to a snapshot file together with the log offset it covers, so
+    `resume` reads one snapshot plus at most `snapshot_every` records,
+    however long the log has grown. Once the log exceeds `compact_bytes`
+    the snapshot also resets it (compaction).
+
+    Files: `{path}.log` and `{path}.snapshot.json`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        memory,
+        context_controller=None,
+        snapshot_every: int = 1000,
+        compact_bytes: int = 16 * 1024 * 1024,
+        fsync_every: int = 64,
+        fsync_interval: float = 0.2,
+    ):
+        self.memory = memory
+        self.context_controller = context_controller
+        self.snapshot_every = snapshot_every
+        self.compact_bytes = compact_bytes
+        self.snapshot_path = path + ".snapshot.json"
+        self.log = RecordLog(path + ".log", fsync_every=fsync_every, fsync_interval=fsync_interval)
+        # Held around each in-memory change and its log record, so a snapshot
+        # never sees a change whose record lands after the snapshot's offset
+        self.lock = threading.RLock()
+        self._since_snapshot = 0
+
+    def resume(self, last_n: Optional[int] = None) -> Dict:
+        """
+        Restore the newest `last_n` memory items (default: memory.max_items)
+        and the controller's packets, then start journaling.
+        """
+        start = time.perf_counter()
+        snapshot = self._read_snapshot()
+        offset = HEADER.size
+        items: List[Dict] = []
+        packets: List[Dict] = []
+        if snapshot is not None:
+            if snapshot["epoch"] > self.log.epoch:
+                # Crashed between writing a compacted snapshot and resetting the log;
+                # everything in the old log is already in the snapshot
+                self.log.reset(snapshot["epoch"])
+            if snapshot["epoch"] == self.log.epoch:
+                offset = snapshot["offset"]
+                items = snapshot["memory"]
+                packets = snapshot["packets"]
+
+        ops = []
+        replayed = 0
+        for record in self.log.read_from(offset):
+            replayed += 1
+            if record["kind"] == "memory":
+                items.append(record["item"])
+            else:
+                ops.append(record)
+
+        limit = self.memory.max_items if last_n is None else min(last_n, self.memory.max_items)
+        self.memory.load(items[-limit:] if limit else [])
+        if self.context_controller is not None:
+            for packet in packets:
+                self.context_controller.add(ContextPacket(**packet))
+            for op in ops:
+                if op["kind"] == "packet" and op.get("replace"):
+                    self.context_controller.replace(ContextPacket(**op["packet"]))
+                elif op["kind"] == "packet":
+                    self.context_controller.add(ContextPacket(**op["packet"]))
+                elif op["kind"] == "step":
+                    self.context_controller.step()
+
+        self._since_snapshot = replayed
+        self.memory.journal = self
+        if self.context_controller is not None:
+            self.context_controller.journal = self
+        return {
+            "items": len(self.memory),
+            "replayed": replayed,
+            "recovered_bytes": self.log.recovered_bytes,
+            "seconds": time.perf_counter() - start,
+        }
+
+    def memory_added(self, item: Dict):
+        self._record({"kind": "memory", "item": item})
+
+    def packet_added(self, packet: ContextPacket, replace: bool = False):
+        record = {"kind": "packet", "packet": asdict(packet)}
+        if replace:
+            record["replace"] = True
+        self._record(record)
+
+    def stepped(self):
+        self._record({"kind": "step"})
+
+    def snapshot(self, compact: bool = False):
+        """
+        Write the current state; with `compact`, also reset the log.
+        """
+        with self.lock:
+            self.log.sync()
+            epoch = self.log.epoch + 1 if compact else self.log.epoch
+            state = {
+                "epoch": epoch,
+                "offset": HEADER.size if compact else self.log.size,
+                "memory": list(self.memory.history),
+                "packets": [asdict(p) for p in self._packets()],
+            }
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(json.dumps(state, ensure_ascii=False, default=str))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+            _fsync_directory(self.snapshot_path)
+            if compact:
+                self.log.reset(epoch)
+            self._since_snapshot = 0
+
+    def close(self):
+        self.memory.journal = None
+        if self.context_controller is not None:
+            self.context_controller.journal = None
+        self.log.close()
+
+    def _record(self, record: Dict):
+        with self.lock:
+            self.log.append(record)
+            self._since_snapshot += 1
+            if self._since_snapshot >= self.snapshot_every:
+                self.snapshot(compact=self.log.size >= self.compact_bytes)
+
+    def _packets(self) -> List[ContextPacket]:
+        if self.context_controller is None:
+            return []
+        return list(self.context_controller.packets)
+
+    def _read_snapshot(self) -> Optional[Dict]:
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, "r", encoding="utf-8") as f:
+            return json.load(f)
@@ -0,0 +1,279 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from agent.context.controller import ContextController
+from agent.context.packet import ContextPacket
+from agent.memory import Memory
+from agent.planning import Planner
+from agent.reflection import Reflection, ReflectionWorker
+from agent.retrieval.retrieval_helper import CITATION_INSTRUCTIONS, build_retrieval_context
+from agent.tool_runtime import ToolRuntime
+from agent.tool_use import ToolRegistry, parse_calls
+from agent.tracing import tracer
+from agent.worker_pool import WorkerPool, run_blocking
+
+INTERRUPTED_MARKER = " [interrupted]"  # appended to a response cut off by the user in memory
+
+
+class TurnPipeline:
+    """
+    Runs one agent turn as an asyncio pipeline.
+
+    - Retrieval starts speculatively alongside planning and is discarded
+      if the plan picks a tool.
+    - Memory writes are chained (so they stay ordered) on an executor
+      and are only awaited at the start of the next turn.
+    - Reflection folds new messages into running summaries on a background
+      ReflectionWorker and never blocks a turn.
+
+    Turn latency is roughly max(plan, retrieve) + generate.
+
+    The response prompt is assembled by the ContextController: this turn's
+    retrieval and conversation history go in as one-off packets and are
+    fitted to the controller's token budget. With the controller's "prefix"
+    layout the citation instructions are a static system message up front,
+    retrieval (without scores) goes last, and the planner sees an
+    append-only window of the history, so upstream prefix caches hit.
+
+    When many sessions share one process (see server.py), blocking calls go
+    through shared WorkerPools keyed by kind: "llm", "embedding" and "tool".
+
+    Tool calls go through a ToolRuntime (timeouts, per-tool latency); a plan
+    may carry a DAG of "calls", run in parallel where dependencies allow,
+    and all results come back in the same turn.
+    """
+
+    def __init__(
+        self,
+        llm,
+        planner: Planner,
+        memory: Memory,
+        reflection: Reflection,
+        tools: Union[ToolRegistry, Dict[str, Any]],
+        embedding_model,
+        documents: Optional[List[Dict]] = None,
+        document_index=None,
+        top_k: int = 3,
+        score_threshold: float = 0.6,
+        hybrid_retrieval: bool = False,
+        context_window_size: int = 10,
+        reflection_interval: int = 4,
+        reflection_segment_folds: int = 4,
+        session_id: str = "default",
+        pools: Optional[Dict[str, WorkerPool]] = None,
+        memory_executor: Optional[Executor] = None,
+        context_controller: Optional[ContextController] = None,
+        tool_runtime: Optional[ToolRuntime] = None,
+    ):
+        self.llm = llm
+        self.planner = planner
+        self.memory = memory
+        self.reflection = reflection
+        self.tools = tools if isinstance(tools, ToolRegistry) else ToolRegistry(tools)
+        self.embedding_model = embedding_model
+        self.documents = documents
+        self.document_index = document_index
+        self.top_k = top_k
+        self.score_threshold = score_threshold
+        self.hybrid_retrieval = hybrid_retrieval
+        self.context_window_size = context_window_size
+        self.reflection_interval = reflection_interval
+        self.session_id = session_id
+        self.pools = pools or {}
+        self.context_controller = context_controller or ContextController()
+        self.tool_runtime = tool_runtime or ToolRuntime(pool=self.pools.get("tool"))
+        self.stable_prefix = self.context_controller.layout == "prefix"
+        self._instructions = ContextPacket(
+            type="system", content=CITATION_INSTRUCTIONS, source="instructions", ttl=-1, priority=100
+        )
+
+        self._owns_executor = memory_executor is None
+        self._memory_executor = memory_executor or ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="memory"
+        )
+        self._last_memory_op: Optional[asyncio.Future] = None
+        self._pending_writes: List[asyncio.Future] = []
+        self.reflection_worker = ReflectionWorker(
+            reflection,
+            memory,
+            self.context_controller,
+            self._offload,
+            interval=reflection_interval,
+            segment_folds=reflection_segment_folds,
+        )
+
+    async def run_turn(
+        self,
+        user_input: str,
+        respond: Optional[Callable[[List[Dict[str, str]]], str]] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Dict[str, Any]:
+        """
+        Plan, act and respond to one user input.
+        respond: blocking callable that turns LLM messages into the final response
+                 (e.g. streaming + TTS). Defaults to llm.generate with the
+                 response cache enabled.
+        cancel: set when the user interrupts (barge-in). The response is then
+                not requested, or stored with INTERRUPTED_MARKER if `respond`
+                returned part of it; an empty response is not stored.
+        Returns a dict with "action", "response", "interrupted" and turn details.
+        The turn is traced as a "turn" span (see agent.tracing).
+        """
+        with tracer.span("turn", session=self.session_id) as span:
+            result = await self._run_turn(user_input, respond, cancel)
+            span.set(action=result["action"], router=result["plan"].get("router"))
+            return result
+
+    async def _run_turn(
+        self,
+        user_input: str,
+        respond: Optional[Callable[[List[Dict[str, str]]], str]],
+        cancel: Optional[threading.Event],
+    ) -> Dict[str, Any]:
+        # Previous turn's writes must be visible before we read history
+        with tracer.span("memory.flush"):
+            await self._flush_memory()
+        history = self.memory.get_llm_messages(roles=["user", "assistant"])
+
+        planner_history = history
+        if self.stable_prefix:
+            planner_history = self.context_controller.window("planner", history)
+
+        # Speculative retrieval runs while the planner is thinking
+        retrieval = asyncio.ensure_future(self._offload("embedding", self._retrieve, user_input))
+        try:
+            plan = await self._offload("llm", self.planner.plan, user_input, planner_history)
+        except BaseException:
+            retrieval.cancel()
+            raise
+
+        # Tool Execution
+        calls = parse_calls(plan)
+        if any(call.tool_name in self.tools for call in calls):
+            # Discard the speculative retrieval; its thread finishes on its own
+            retrieval.cancel()
+            results = await self.tool_runtime.run_plan(calls, self.tools, session_id=self.session_id)
+            # Store as assistant messages (NOT role=tool)
+            self._write_memory([("user", user_input)] + [
+                ("assistant", f"Tool {result.tool_name} result: {result.text}") for result in results
+            ])
+            if len(results) == 1:
+                tool_response = results[0].text
+            else:
+                tool_response = "\n".join(f"{result.call_id}: {result.text}" for result in results)
+            return {
+                "action": "tool",
+                "plan": plan,
+                "tool_name": results[0].tool_name,
+                "response": tool_response,
+                "tool_results": results,
+                "interrupted": False,
+            }
+
+        retrieval_context = await retrieval
+
+        # LLM Response: retrieval outranks history; the oldest history is cut first
+        turn_packets = [ContextPacket(
+            type="conversation", content=history, source="memory", ttl=1, priority=50
+        )]
+        if self.stable_prefix:
+            turn_packets.append(self._instructions)
+        if retrieval_context:
+            turn_packets.append(ContextPacket(
+                type="retrieved_knowledge", content=retrieval_context,
+                source="retriever", ttl=1, priority=80,
+            ))
+        with tracer.span("context.build") as span:
+            llm_messages = self.context_controller.build_messages(
+                packets=turn_packets, suffix=[{"role": "user", "content": user_input}]
+            )
+            span.set(tokens=self.context_controller.last_build.get("tokens"))
+
+        respond = respond or (lambda messages: self.llm.generate(messages, use_cache=True))
+        llm_response = ""
+        if cancel is None or not cancel.is_set():
+            llm_response = await self._offload("llm", respond, llm_messages)
+        interrupted = cancel is not None and cancel.is_set()
+
+        writes = [("user", user_input)]
+        if llm_response:
+            writes.append(("assistant", llm_response + INTERRUPTED_MARKER if interrupted else llm_response))
+        memory_size = self._write_memory(writes)
+        self.reflection_worker.notify(after=memory_size)
+
+        return {
+            "action": "respond",
+            "plan": plan,
+            "retrieval_context": retrieval_context,
+            "response": llm_response,
+            "interrupted": interrupted,
+        }
+
+    async def drain(self):
+        """
+        Wait for background reflection and pending memory writes (call on shutdown).
+        """
+        await self.reflection_worker.drain()
+        await self._flush_memory()
+
+    def close(self):
+        if self._owns_executor:
+            self._memory_executor.shutdown(wait=True)
+
+    async def _offload(self, kind: str, fn: Callable, *args) -> Any:
+        if kind == "memory":
+            return await self._chain_memory(functools.partial(fn, *args))
+        return await run_blocking(self.pools.get(kind), self.session_id, fn, *args)
+
+    def _retrieve(self, user_input: str) -> str:
+        return build_retrieval_context(
+            query=user_input,
+            documents=self.documents,
+            embedding_model=self.embedding_model,
+            top_k=self.top_k,
+            score_threshold=self.score_threshold,
+            index=self.document_index,
+            instructions=not self.stable_prefix,
+            scores=not self.stable_prefix,
+            hybrid=self.hybrid_retrieval,
+        )
+
+    def _write_memory(self, items: List[Tuple[str, str]]) -> asyncio.Future:
+        """
+        Queue memory writes without blocking the turn.
+        The returned future resolves to the memory size after the writes.
+        """
+        def write():
+            for role, content in items:
+                self.memory.add(role=role, content=content)
+            return len(self.memory)
+
+        future = self._chain_memory(write)
+        self._pending_writes.append(future)
+        return future
+
+    def _chain_memory(self, fn: Callable) -> asyncio.Future:
+        """
+        Run a memory operation after every earlier one of this session, so
+        operations stay ordered even when the executor is shared.
+        """
+        previous = self._last_memory_op
+
+        async def chained():
+            if previous is not None:
+                try:
+                    await previous
+                except Exception:
+                    pass  # reported to whoever awaited it
+            return await asyncio.get_running_loop().run_in_executor(self._memory_executor, fn)
+
+        future = asyncio.ensure_future(chained())
+        self._last_memory_op = future
+        return future
+
+    async def _flush_memory(self):
+        pending, self._pending_writes = self._pending_writes, []
+        if pending:
+            await asyncio.gather(*pending)
@@ -1,5 +1,7 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from agent.llm_wrapper import LLMWrapper
+from agent.tool_use import ToolRegistry
+from agent.tracing import tracer
 import json
 
 class Planner:
@@ -18,26 +20,53 @@ Return ONLY JSON in the following format:
   "tool_name": null | string,
   "arguments": {}
 }
-Available tools:
-- SimpleCalculatorTool: arguments = {"expression": "<math expression>"}
-- Other tools can be added similarly.
+If the request needs several tool calls, plan them all at once: set "action": "tool" and
+"calls": [{"id": "a", "tool_name": string, "arguments": {}, "depends_on": []}, ...].
+An argument may contain "{a}" to use the result of call "a" (list "a" in "depends_on").
+Calls that do not depend on each other run in parallel.
+{tools}
 Be concise and valid in JSON format.
 """
 
-    def __init__(self, llm: LLMWrapper):
+    def __init__(self, llm: LLMWrapper, router=None, registry: Optional[ToolRegistry] = None):
         self.llm = llm
+        self.router = router  # optional IntentRouter tried before the LLM
+        self.registry = registry if registry is not None else ToolRegistry()
+        self.route_counts = {"local": 0, "llm": 0}
+        self._prompt_key = None
+        self._system_prompt = None
 
+    @property
+    def system_prompt(self) -> str:
+        """
+        SYSTEM_PROMPT with the registry's tool section (rebuilt only when the registry changes).
+        """
+        section = self.registry.prompt_section()
+        if section is not self._prompt_key:
+            self._system_prompt = self.SYSTEM_PROMPT.replace("{tools}", section)
+            self._prompt_key = section
+        return self._system_prompt
+
+    @tracer.traced("plan")
     def plan(self, user_input: str, memory: List[Dict[str, str]]) -> Dict[str, Any]:
         """
         user_input: latest user message
         memory: list of dicts with "role" and "content"
         """
-        messages = [{"role": "system", "content": self.SYSTEM_PROMPT}]
+        # Fast path: obvious intents skip the LLM round-trip
+        if self.router is not None:
+            plan: Optional[Dict[str, Any]] = self.router.route(user_input)
+            if plan is not None:
+                self.route_counts["local"] += 1
+                return plan
+        self.route_counts["llm"] += 1
+
+        messages = [{"role": "system", "content": self.system_prompt}]
         messages.extend(memory)  # Add conversation history
         messages.append({"role": "user", "content": user_input})
 
         # Ask the LLM for a plan
-        response_text = self.llm.generate(messages)
+        response_text = self.llm.generate(messages, kind="planner")
 
         # Convert LLM JSON output to Python dict
         try:
@@ -46,6 +75,8 @@ Be concise and valid in JSON format.
             # fallback to default safe action
             plan = {"action": "respond", "tool_name": None, "arguments": {}}
 
+        plan["router"] = "llm"
+
         # Ensure all required keys exist
         for key in ["action", "tool_name", "arguments"]:
             if key not in plan:
@@ -1,5 +1,14 @@
-from typing import List, Dict
+import asyncio
+from typing import Any, Awaitable, Callable, List, Dict, Optional
+from agent.context.packet import ContextPacket
 from agent.llm_wrapper import LLMWrapper
+from agent.tracing import tracer
+
+
+def _flatten(messages: List[Dict]) -> str:
+    # Flatten conversation into plain text (more reliable for summarization)
+    return "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+
 
 class Reflection:
     """
@@ -13,6 +22,7 @@ class Reflection:
         self.llm = llm
         self.CONTEXT_WINDOW_SIZE = context_window_size
 
+    @tracer.traced("reflection.reflect")
     def reflect(self, memory: List[Dict]) -> str:
         """
         Reflection is implemented as an explicit user-level summarization task
@@ -28,10 +38,7 @@ class Reflection:
         # Limit context window
         recent_memory = memory[-self.CONTEXT_WINDOW_SIZE :]
 
-        # Flatten conversation into plain text (more reliable for summarization)
-        conversation_text = "\n".join(
-            f"{m['role'].upper()}: {m['content']}" for m in recent_memory
-        )
+        conversation_text = _flatten(recent_memory)
 
         prompt = (
             "Summarize the following conversation in 2–4 sentences. "
@@ -47,6 +54,168 @@ class Reflection:
             }
         ]
 
-        summary = self.llm.generate(messages)
+        summary = self.llm.generate(messages, kind="reflection")
 
         return summary.strip()
+
+    @tracer.traced("reflection.fold")
+    def fold(self, summary: str, new_messages: List[Dict]) -> str:
+        """
+        Fold only the new messages into a running summary (turn -> segment).
+        """
+        if not new_messages:
+            return summary
+
+        prompt = (
+            "Update the running summary of a conversation with the new messages below. "
+            "Keep it to 2–4 sentences. Focus on key questions, answers, and any tool usage. "
+            "Keep earlier points unless the new messages supersede them.\n\n"
+            f"Current summary:\n{summary or '(none yet)'}\n\n"
+            f"New messages:\n{_flatten(new_messages)}"
+        )
+        return self.llm.generate([{"role": "user", "content": prompt}], kind="reflection").strip()
+
+    @tracer.traced("reflection.roll_up")
+    def roll_up(self, session_summary: str, segment_summary: str) -> str:
+        """
+        Merge a finished segment summary into the session summary (segment -> session).
+        """
+        if not segment_summary:
+            return session_summary
+        if not session_summary:
+            return segment_summary
+
+        prompt = (
+            "Merge the summary of the latest part of a conversation into the summary "
+            "of the whole session. Keep it to 3–6 sentences. Keep durable facts "
+            "(user goals, preferences, decisions, results) and drop passing details.\n\n"
+            f"Session summary:\n{session_summary}\n\n"
+            f"Latest part:\n{segment_summary}"
+        )
+        return self.llm.generate([{"role": "user", "content": prompt}], kind="reflection").strip()
+
+
+class ReflectionWorker:
+    """
+    Incremental, hierarchical reflection for one session, off the turn path.
+
+    - Every `interval` new user/assistant messages are folded into the
+      running segment summary (only the new messages are sent to the LLM).
+    - Every `segment_folds` folds, the segment is rolled up into the session
+      summary and a new segment starts.
+
+    Both summaries are kept as "reflection" ContextPackets (sources
+    "reflection:session" and "reflection:segment"), so they reach the prompt
+    through the ContextController and are journaled with it.
+
+    Requests go through a bounded queue drained by one background task.
+    When it is full a request is dropped; nothing is lost, since the next
+    fold picks up every message after the cursor.
+    """
+
+    SESSION_SOURCE = "reflection:session"
+    SEGMENT_SOURCE = "reflection:segment"
+
+    def __init__(
+        self,
+        reflection: Reflection,
+        memory,
+        context_controller,
+        offload: Callable[..., Awaitable[Any]],
+        interval: int = 4,
+        segment_folds: int = 4,
+        max_queue: int = 8,
+    ):
+        self.reflection = reflection
+        self.memory = memory
+        self.context_controller = context_controller
+        self.offload = offload  # offload(kind, fn, *args): "llm" or "memory"
+        self.interval = interval
+        self.segment_folds = segment_folds
+        self.max_queue = max_queue
+
+        # Resume from journaled summaries; messages already in memory count as folded
+        self.session_summary = self._restored(self.SESSION_SOURCE)
+        self.segment_summary = self._restored(self.SEGMENT_SOURCE)
+        self.cursor = memory.total_added
+        self.folds = 0
+        self.dropped = 0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self, after: Optional[Awaitable] = None):
+        """
+        Ask for a fold once `after` (e.g. the turn's memory write) completes.
+        Never blocks.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            # Its spans are traces of their own, not part of the turn that started it
+            with tracer.detached():
+                self._task = asyncio.ensure_future(self._run())
+        try:
+            self._queue.put_nowait(after)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def drain(self):
+        """
+        Finish queued folds and stop the background task.
+        """
+        if self._queue is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        self._queue = self._task = None
+
+    async def _run(self):
+        while True:
+            after = await self._queue.get()
+            try:
+                if after is not None:
+                    await after
+                await self._fold()
+            except Exception as e:
+                print(f"[DEBUG] Reflection failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _fold(self):
+        messages, cursor = await self.offload(
+            "memory", self.memory.messages_since, self.cursor, ["user", "assistant"]
+        )
+        if len(messages) < self.interval:
+            return
+
+        self.segment_summary = await self.offload(
+            "llm", self.reflection.fold, self.segment_summary, messages
+        )
+        self.cursor = cursor
+        self.folds += 1
+
+        if self.folds % self.segment_folds == 0:
+            self.session_summary = await self.offload(
+                "llm", self.reflection.roll_up, self.session_summary, self.segment_summary
+            )
+            self.segment_summary = ""
+            self._publish(self.SESSION_SOURCE, self.session_summary, priority=60)
+        self._publish(self.SEGMENT_SOURCE, self.segment_summary, priority=55)
+        print(f"[DEBUG] Reflection Summary:\n{self.segment_summary or self.session_summary}\n")
+
+    def _publish(self, source: str, summary: str, priority: int):
+        label = "Session summary" if source == self.SESSION_SOURCE else "Recent summary"
+        self.context_controller.replace(ContextPacket(
+            type="reflection",
+            content=f"{label}: {summary}" if summary else "",
+            source=source,
+            ttl=-1,
+            priority=priority,
+            metadata={"raw": summary},
+        ))
+
+    def _restored(self, source: str) -> str:
+        for packet in self.context_controller.packets:
+            if packet.type == "reflection" and packet.source == source:
+                return packet.metadata.get("raw", "")
+        return ""
@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+from agent.tracing import tracer
+
+
+WHITESPACE = re.compile(r"\s+")
+# Retrieval scores vary between near-identical queries; they should not split scopes
+RETRIEVAL_SCORE = re.compile(r"\(score: -?[0-9.]+\)\s*")
+
+
+def normalize_text(text: str) -> str:
+    return WHITESPACE.sub(" ", text).strip().lower()
+
+
+def digest(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    scope: str
+    user_text: str
+    embedding: Optional[np.ndarray]
+    response: str
+    created: float
+    latency: float  # seconds the original generation took
+
+
+class ResponseCache:
+    """
+    Exact + semantic cache for LLM responses.
+
+    - Exact hit: the normalized message list matches a stored one.
+    - Semantic hit: same scope, and the final user turn's embedding is within
+      `similarity_threshold` (cosine) of a stored user turn.
+
+    The scope hashes everything that grounds the answer: system messages
+    (retrieval context, reflections) and the last `scope_history` messages
+    before the final user turn (tool results land there). A request whose
+    retrieval context or tool results differ therefore never reuses an answer.
+
+    Entries expire after `ttl` seconds and the least recently used are evicted
+    beyond `max_items`. With `path`, entries are also kept in SQLite and
+    reloaded on start.
+    """
+
+    def __init__(
+        self,
+        embedding_model=None,
+        similarity_threshold: float = 0.95,
+        ttl: float = 24 * 3600,
+        max_items: int = 5000,
+        scope_history: int = 2,
+        path: Optional[str] = None,
+    ):
+        self.embedding_model = embedding_model
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_items = max_items
+        self.scope_history = scope_history
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # scope -> keys, plus a lazily stacked embedding matrix for that scope
+        self._scopes: Dict[str, List[str]] = {}
+        self._scope_matrix: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, scope TEXT, user_text TEXT, embedding BLOB, "
+                "response TEXT, created REAL, latency REAL)"
+            )
+            self._load()
+
+    def lookup(self, messages: List[Dict[str, str]]) -> Optional[str]:
+        """
+        Return a cached response for `messages`, or None.
+        """
+        key, scope, user_text = self._keys(messages)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove(key)
+            elif entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                self.saved_seconds += entry.latency
+                tracer.count("response_cache_lookups", result="exact_hit")
+                return entry.response
+
+        if self.embedding_model is None or user_text is None:
+            with self._lock:
+                self.misses += 1
+            tracer.count("response_cache_lookups", result="miss")
+            return None
+
+        query = self.embedding_model.embed_array([user_text])[0]
+        with self._lock:
+            entry = self._nearest(scope, query, now)
+            if entry is None:
+                self.misses += 1
+                tracer.count("response_cache_lookups", result="miss")
+                return None
+            self._entries.move_to_end(entry.key)
+            self.semantic_hits += 1
+            self.saved_seconds += entry.latency
+            tracer.count("response_cache_lookups", result="semantic_hit")
+            return entry.response
+
+    def store(self, messages: List[Dict[str, str]], response: str, latency: float = 0.0):
+        """
+        Remember `response` for `messages`; `latency` is what a hit will save.
+        """
+        if not response:
+            return
+        key, scope, user_text = self._keys(messages)
+        embedding = None
+        if self.embedding_model is not None and user_text is not None:
+            embedding = self.embedding_model.embed_array([user_text])[0]
+
+        entry = CacheEntry(key, scope, user_text or "", embedding, response, time.time(), latency)
+        with self._lock:
+            # Written in the same critical section as evictions, so the
+            # INSERT can never land after the DELETE of an evicted entry
+            self._insert(entry)
+            if self._db is not None:
+                self._persist(entry)
+            self._evict()
+
+    def stats(self) -> Dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "items": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _keys(self, messages: List[Dict[str, str]]):
+        normalized = [(m["role"], normalize_text(m["content"])) for m in messages]
+        key = digest(normalized)
+
+        user_text = None
+        body = normalized
+        if normalized and normalized[-1][0] == "user":
+            user_text = messages[-1]["content"].strip()
+            body = normalized[:-1]
+
+        grounding = [
+            (role, RETRIEVAL_SCORE.sub("", content)) for role, content in body if role == "system"
+        ]
+        history = [m for m in body if m[0] != "system"]
+        recent = history[-self.scope_history:] if self.scope_history else []
+        scope = digest([grounding, recent])
+        return key, scope, user_text
+
+    def _nearest(self, scope: str, query: np.ndarray, now: float) -> Optional[CacheEntry]:
+        keys = self._scopes.get(scope)
+        if not keys:
+            return None
+        matrix = self._scope_matrix.get(scope)
+        if matrix is None:
+            matrix = np.stack([self._entries[k].embedding for k in keys])
+            self._scope_matrix[scope] = matrix
+
+        scores = matrix @ query
+        for index in np.argsort(-scores):
+            if scores[index] < self.similarity_threshold:
+                return None
+            entry = self._entries[keys[index]]
+            if not self._expired(entry, now):
+                return entry
+        return None
+
+    def _insert(self, entry: CacheEntry):
+        if entry.key in self._entries:
+            self._remove(entry.key)
+        self._entries[entry.key] = entry
+        if entry.embedding is not None:
+            self._scopes.setdefault(entry.scope, []).append(entry.key)
+            self._scope_matrix.pop(entry.scope, None)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        keys = self._scopes.get(entry.scope)
+        if keys is not None and key in keys:
+            keys.remove(key)
+            self._scope_matrix.pop(entry.scope, None)
+            if not keys:
+                del self._scopes[entry.scope]
+        return entry
+
+    def _evict(self):
+        # Least recently used first; expired entries are dropped lazily on lookup
+        evicted = []
+        while len(self._entries) > self.max_items:
+            evicted.append(self._remove(next(iter(self._entries))).key)
+        if evicted and self._db is not None:
+            with self._db:
+                self._db.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in evicted])
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.created > self.ttl
+
+    def _persist(self, entry: CacheEntry):
+        blob = entry.embedding.astype(np.float32).tobytes() if entry.embedding is not None else None
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry.key, entry.scope, entry.user_text, blob, entry.response, entry.created, entry.latency),
+            )
+
+    def _load(self):
+        cutoff = time.time() - self.ttl
+        rows = self._db.execute(
+            "SELECT key, scope, user_text, embedding, response, created, latency "
+            "FROM responses WHERE created >= ? ORDER BY created DESC LIMIT ?",
+            (cutoff, self.max_items),
+        ).fetchall()
+        for key, scope, user_text, blob, response, created, latency in reversed(rows):
+            embedding = np.frombuffer(blob, dtype=np.float32) if blob is not None else None
+            self._insert(CacheEntry(key, scope, user_text, embedding, response, created, latency))
+        with self._db:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
@@ -0,0 +1,260 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+
+# Identifiers like err_conn_reset, v1.2 or x-ray stay whole; their parts are indexed too
+TOKEN = re.compile(r"[a-z0-9]+(?:[._\-/:][a-z0-9]+)*")
+SEPARATORS = re.compile(r"[._\-/:]")
+STOP_WORDS = frozenset(
+    "a an and are as at be by do does for from how i in is it me my of on or "
+    "so that the this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN.findall(text.lower()):
+        if token in STOP_WORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in SEPARATORS.split(token) if part and part not in STOP_WORDS)
+    return tokens
+
+
+class _PostingList:
+    """
+    Growable (row, term frequency) arrays for one term.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.rows = np.empty(0, dtype=np.int64)
+        self.tfs = np.empty(0, dtype=np.float32)
+
+    def append(self, row: int, tf: int):
+        if self.size == self.rows.shape[0]:
+            capacity = max(4, 2 * self.size)
+            rows = np.empty(capacity, dtype=np.int64)
+            tfs = np.empty(capacity, dtype=np.float32)
+            rows[: self.size] = self.rows[: self.size]
+            tfs[: self.size] = self.tfs[: self.size]
+            self.rows, self.tfs = rows, tfs
+        self.rows[self.size] = row
+        self.tfs[self.size] = tf
+        self.size += 1
+
+    def remove(self, row: int):
+        # Order does not matter, so the last posting fills the gap
+        hits = np.flatnonzero(self.rows[: self.size] == row)
+        if not hits.size:
+            return
+        last = self.size - 1
+        self.rows[hits[0]] = self.rows[last]
+        self.tfs[hits[0]] = self.tfs[last]
+        self.size = last
+
+
+class BM25Index:
+    """
+    In-process BM25 inverted index over DocumentIndex rows.
+
+    Each term's postings are compact NumPy arrays, so scoring a query is a
+    few vectorized passes over the postings of its terms. Rows can be added
+    and removed one at a time (the caller passes the text again on removal).
+
+    `search` also reports each hit's term coverage: the IDF-weighted share
+    of the query's terms the document contains. Query words the corpus has
+    never seen weigh heavily, so small talk scores low while a query that is
+    mostly an identifier, error code or product name scores high.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._terms: Dict[str, int] = {}
+        self._postings: List[_PostingList] = []
+        self._doc_len = np.zeros(0, dtype=np.float32)  # 0 for absent rows
+        self._num_docs = 0
+        self._total_len = 0.0
+
+    def __len__(self) -> int:
+        return self._num_docs
+
+    def build(self, texts: Iterable[str]):
+        """
+        Index `texts` as rows 0..n-1 (replacing any previous content).
+        Postings are collected as flat (term, row, tf) arrays and split per
+        term after one stable sort, instead of growing each list per document.
+        """
+        terms: Dict[str, int] = {}
+        term_ids: List[int] = []
+        rows: List[int] = []
+        tfs: List[int] = []
+        doc_len: List[int] = []
+        for row, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                term_ids.append(terms.setdefault(term, len(terms)))
+                rows.append(row)
+                tfs.append(tf)
+            doc_len.append(sum(counts.values()))
+
+        # Stable: each term's rows stay ascending, as incremental adds leave them
+        order = np.argsort(np.array(term_ids, dtype=np.int64), kind="stable")
+        sorted_rows = np.array(rows, dtype=np.int64)[order]
+        sorted_tfs = np.array(tfs, dtype=np.float32)[order]
+        bounds = np.cumsum(np.bincount(np.array(term_ids, dtype=np.int64), minlength=len(terms)))
+
+        self._terms = terms
+        self._postings = []
+        start = 0
+        for end in bounds.tolist():
+            postings = _PostingList()
+            postings.rows = sorted_rows[start:end]
+            postings.tfs = sorted_tfs[start:end]
+            postings.size = end - start
+            self._postings.append(postings)
+            start = end
+        self._doc_len = np.array(doc_len, dtype=np.float32)
+        self._num_docs = len(doc_len)
+        self._total_len = float(sum(doc_len))
+
+    def add(self, row: int, text: str):
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            term_id = self._terms.get(term)
+            if term_id is None:
+                term_id = self._terms[term] = len(self._postings)
+                self._postings.append(_PostingList())
+            self._postings[term_id].append(row, tf)
+
+        if row >= self._doc_len.shape[0]:
+            doc_len = np.zeros(max(row + 1, 2 * self._doc_len.shape[0], 16), dtype=np.float32)
+            doc_len[: self._doc_len.shape[0]] = self._doc_len
+            self._doc_len = doc_len
+        length = sum(counts.values())
+        self._doc_len[row] = length
+        self._num_docs += 1
+        self._total_len += length
+
+    def remove(self, row: int, text: str):
+        """
+        Remove a row; `text` must be what it was added with.
+        """
+        for term in set(tokenize(text)):
+            term_id = self._terms.get(term)
+            if term_id is not None:
+                self._postings[term_id].remove(row)
+        self._total_len -= float(self._doc_len[row])
+        self._doc_len[row] = 0
+        self._num_docs -= 1
+
+    def move(self, src: int, dst: int, text: str):
+        """
+        Relabel row `src` as `dst` (DocumentIndex fills removed rows with its last row).
+        """
+        self.remove(src, text)
+        self.add(dst, text)
+
+    def idf(self, df: int) -> float:
+        return math.log(1.0 + (self._num_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float, float]]:
+        """
+        Returns up to `top_k` (row, bm25 score, term coverage) sorted by score.
+        """
+        terms = set(tokenize(query))
+        if not terms or self._num_docs == 0 or top_k <= 0:
+            return []
+
+        avg_len = self._total_len / self._num_docs
+        rows, contributions, weights = [], [], []
+        total_idf = 0.0
+        for term in terms:
+            term_id = self._terms.get(term)
+            postings = self._postings[term_id] if term_id is not None else None
+            df = postings.size if postings is not None else 0
+            idf = self.idf(df)
+            total_idf += idf
+            if not df:
+                continue
+            term_rows = postings.rows[: postings.size]
+            tfs = postings.tfs[: postings.size]
+            norm = self.k1 * (1.0 - self.b + self.b * self._doc_len[term_rows] / avg_len)
+            rows.append(term_rows)
+            contributions.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+            weights.append(np.full(df, idf, dtype=np.float32))
+        if not rows:
+            return []
+
+        # Sum per row without a dense score array over the whole corpus
+        unique_rows, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        coverage = np.bincount(inverse, weights=np.concatenate(weights)) / total_idf
+
+        k = min(top_k, unique_rows.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k] if k < unique_rows.shape[0] else np.arange(k)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return list(zip(unique_rows[top].tolist(), scores[top].tolist(), coverage[top].tolist()))
+
+    def save(self, path: str):
+        """
+        Persist to `<path>.npz` (packed postings) and `<path>.json` (config + vocabulary).
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        sizes = np.array([p.size for p in self._postings], dtype=np.int64)
+        tmp_arrays = f"{path}.tmp.npz"
+        np.savez(
+            tmp_arrays,
+            sizes=sizes,
+            rows=np.concatenate([p.rows[: p.size] for p in self._postings] or [np.empty(0, np.int64)]),
+            tfs=np.concatenate([p.tfs[: p.size] for p in self._postings] or [np.empty(0, np.float32)]),
+            doc_len=self._doc_len,
+        )
+        os.replace(tmp_arrays, f"{path}.npz")
+
+        meta = {
+            "k1": self.k1,
+            "b": self.b,
+            "terms": sorted(self._terms, key=self._terms.get),
+            "num_docs": self._num_docs,
+        }
+        tmp_meta = f"{path}.json.tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, f"{path}.json")
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(k1=meta["k1"], b=meta["b"])
+
+        with np.load(f"{path}.npz") as data:
+            sizes, rows, tfs = data["sizes"], data["rows"], data["tfs"]
+            index._doc_len = data["doc_len"].astype(np.float32)
+
+        offset = 0
+        for term, size in zip(meta["terms"], sizes.tolist()):
+            postings = _PostingList()
+            postings.rows = rows[offset : offset + size].copy()
+            postings.tfs = tfs[offset : offset + size].copy()
+            postings.size = size
+            index._terms[term] = len(index._postings)
+            index._postings.append(postings)
+            offset += size
+        index._num_docs = meta["num_docs"]
+        index._total_len = float(index._doc_len.sum())
+        return index
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(f"{path}.npz") and os.path.exists(f"{path}.json")
@@ -0,0 +1,381 @@
+import glob
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from agent.retrieval.scoring import reciprocal_rank_fusion, top_k_scores, weighted_fusion
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class DocumentIndex:
+    """
+    Keeps one normalized embedding per document in a contiguous float32 matrix.
+    Documents are keyed by id and content hash, so only added or changed
+    documents are sent through the embedding model.
+
+    An optional ANN backend (e.g. IVFIndex) can be attached; it is kept in
+    sync with the matrix and used for search instead of exact scoring.
+
+    An optional sparse index (BM25Index) makes search hybrid when query
+    texts are given: dense and BM25 candidates are fused (reciprocal-rank
+    fusion or a weighted blend), and a document that misses the cosine
+    threshold is still kept if it covers most of the query's terms
+    (identifiers, error codes, product names).
+    """
+
+    def __init__(self, embedding_model, dim: Optional[int] = None, backend=None, sparse=None):
+        self.embedding_model = embedding_model
+        self.dim = dim
+        self.backend = backend
+        self.sparse = sparse
+        self.fusion = "rrf"  # or "weighted"
+        self.rrf_k = 60
+        self.alpha = 0.5  # dense weight for "weighted" fusion
+        self.min_term_coverage = 0.5
+        self.candidate_factor = 4  # candidates per retriever = top_k * factor
+        self.prefilter = False
+        self._documents: List[Dict] = []
+        self._hashes: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._vectors = np.empty((0, dim or 0), dtype=np.float32)
+        self._size = 0
+        self._version = 0  # of the last save/load; names the vectors file
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._rows
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """
+        Embedding matrix of shape (len(self), dim); row i belongs to document i.
+        """
+        return self._vectors[: self._size]
+
+    @property
+    def documents(self) -> List[Dict]:
+        return self._documents
+
+    def get(self, row: int) -> Dict:
+        return self._documents[row]
+
+    def attach_backend(self, backend):
+        """
+        Build an ANN backend over the current matrix and route searches through it.
+        A backend attached to an empty index is trained on the first write;
+        searches stay exact until then.
+        """
+        backend.build(self.matrix)
+        self.backend = backend
+
+    def attach_sparse(
+        self,
+        sparse,
+        fusion: str = "rrf",
+        min_term_coverage: float = 0.5,
+        prefilter: bool = False,
+    ):
+        """
+        Index the current documents in `sparse` (BM25Index) and search hybrid from now on.
+        prefilter: when the query is lexically anchored (some document covers
+                   `min_term_coverage` of its terms), score embeddings only for
+                   the BM25 candidates instead of the whole corpus
+        """
+        if fusion not in {"rrf", "weighted"}:
+            raise ValueError(f"Unsupported fusion: {fusion}")
+        sparse.build(doc["content"] for doc in self._documents)
+        self.sparse = sparse
+        self.fusion = fusion
+        self.min_term_coverage = min_term_coverage
+        self.prefilter = prefilter
+
+    def search(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        score_threshold: Optional[float] = None,
+        query_texts: Optional[Sequence[str]] = None,
+    ) -> List[List[Tuple[float, Dict]]]:
+        """
+        Top-k search for one query vector or a (num_queries, dim) batch.
+        Exact unless an ANN backend is attached; hybrid if a sparse index is
+        attached and `query_texts` (one per query) are given.
+        Returns, per query, (score, document) pairs sorted by relevance;
+        the score is always the cosine similarity.
+        """
+        if self.sparse is not None and query_texts is not None:
+            queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+            hits = [
+                self._hybrid_search(query, text, top_k, score_threshold)
+                for query, text in zip(queries, query_texts)
+            ]
+        elif self._backend_ready():
+            hits = self.backend.search(query_embeddings, top_k, score_threshold)
+        else:
+            hits = top_k_scores(query_embeddings, self.matrix, top_k, score_threshold)
+        return [
+            [(score, self._documents[row]) for row, score in query_hits]
+            for query_hits in hits
+        ]
+
+    def _hybrid_search(
+        self,
+        query: np.ndarray,
+        text: str,
+        top_k: int,
+        score_threshold: Optional[float],
+    ) -> List[Tuple[int, float]]:
+        depth = top_k * self.candidate_factor
+        sparse_hits = self.sparse.search(text, depth)
+        coverage = {row: cov for row, _, cov in sparse_hits}
+
+        if self.prefilter and sparse_hits and max(coverage.values()) >= self.min_term_coverage:
+            rows = np.array([row for row, _, _ in sparse_hits])
+            dense_hits = [
+                (int(rows[i]), score) for i, score in top_k_scores(query, self.matrix[rows], depth)[0]
+            ]
+        elif self._backend_ready():
+            dense_hits = self.backend.search(query, depth)[0]
+        else:
+            dense_hits = top_k_scores(query, self.matrix, depth)[0]
+        dense = dict(dense_hits)
+
+        if self.fusion == "weighted":
+            fused = weighted_fusion(dense, {row: score for row, score, _ in sparse_hits}, self.alpha)
+        else:
+            fused = reciprocal_rank_fusion(
+                [[row for row, _ in dense_hits], [row for row, _, _ in sparse_hits]], k=self.rrf_k
+            )
+
+        results = []
+        for row, _ in fused:
+            score = dense.get(row)
+            if score is None:
+                score = float(self.matrix[row] @ query)
+            if (
+                score_threshold is not None
+                and score < score_threshold
+                and coverage.get(row, 0.0) < self.min_term_coverage
+            ):
+                continue
+            results.append((row, score))
+            if len(results) == top_k:
+                break
+        return results
+
+    def sync(self, documents: Iterable[Dict]) -> Dict[str, int]:
+        """
+        Make the index mirror `documents` exactly.
+        Unchanged documents keep their vectors; removed ids are dropped.
+        Returns counts of added, updated, removed and unchanged documents.
+        """
+        documents = list(documents)
+        keep = {doc["id"] for doc in documents}
+        removed = [doc_id for doc_id in self._rows if doc_id not in keep]
+        self.remove(removed)
+
+        stats = self.upsert(documents)
+        stats["removed"] = len(removed)
+        return stats
+
+    def upsert(self, documents: Iterable[Dict]) -> Dict[str, int]:
+        """
+        Add new documents and re-embed documents whose content changed.
+        """
+        pending: List[Dict] = []
+        pending_hashes: List[str] = []
+        unchanged = 0
+        updated = 0
+
+        for doc in documents:
+            digest = content_hash(doc["content"])
+            row = self._rows.get(doc["id"])
+            if row is not None and self._hashes[row] == digest:
+                # Metadata may change without touching the embedding
+                self._documents[row] = doc
+                unchanged += 1
+                continue
+            if row is not None:
+                updated += 1
+            pending.append(doc)
+            pending_hashes.append(digest)
+
+        if pending:
+            vectors = self.embedding_model.embed_array([doc["content"] for doc in pending])
+            self._write(pending, pending_hashes, vectors)
+
+        return {
+            "added": len(pending) - updated,
+            "updated": updated,
+            "unchanged": unchanged,
+        }
+
+    def remove(self, doc_ids: Iterable[str]):
+        """
+        Drop documents by id. The last row is moved into the freed slot
+        so the matrix stays contiguous.
+        """
+        for doc_id in doc_ids:
+            row = self._rows.pop(doc_id, None)
+            if row is None:
+                continue
+            self._ensure_writable()
+            last = self._size - 1
+            if self.sparse is not None:
+                self.sparse.remove(row, self._documents[row]["content"])
+            if self.backend is not None:
+                self.backend.remove(np.array([row, last]))
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._documents[row] = self._documents[last]
+                self._hashes[row] = self._hashes[last]
+                self._rows[self._documents[row]["id"]] = row
+                if self.sparse is not None:
+                    self.sparse.move(last, row, self._documents[row]["content"])
+                if self.backend is not None:
+                    self.backend.add(np.array([row]), self._vectors[row : row + 1])
+            self._documents.pop()
+            self._hashes.pop()
+            self._size -= 1
+
+    def _write(self, documents: List[Dict], hashes: List[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._vectors = np.empty((0, self.dim), dtype=np.float32)
+
+        new_rows = sum(1 for doc in documents if doc["id"] not in self._rows)
+        self._reserve(self._size + new_rows)
+
+        written = np.empty(len(documents), dtype=np.int64)
+        for i, (doc, digest, vector) in enumerate(zip(documents, hashes, vectors)):
+            row = self._rows.get(doc["id"])
+            if row is None:
+                row = self._size
+                self._size += 1
+                self._rows[doc["id"]] = row
+                self._documents.append(doc)
+                self._hashes.append(digest)
+            else:
+                if self.sparse is not None:
+                    self.sparse.remove(row, self._documents[row]["content"])
+                self._documents[row] = doc
+                self._hashes[row] = digest
+            if self.sparse is not None:
+                self.sparse.add(row, doc["content"])
+            self._vectors[row] = vector
+            written[i] = row
+
+        if self.backend is not None:
+            if self._backend_ready():
+                self.backend.add(written, vectors)
+            else:
+                self.backend.build(self.matrix)
+
+    def _backend_ready(self) -> bool:
+        return self.backend is not None and getattr(self.backend, "is_trained", True)
+
+    def _reserve(self, capacity: int):
+        """
+        Grow the backing buffer geometrically so appends are amortized O(1).
+        """
+        self._ensure_writable()
+        if capacity <= self._vectors.shape[0]:
+            return
+        new_capacity = max(capacity, 2 * self._vectors.shape[0], 16)
+        buffer = np.empty((new_capacity, self.dim), dtype=np.float32)
+        buffer[: self._size] = self._vectors[: self._size]
+        self._vectors = buffer
+
+    def _ensure_writable(self):
+        # Vectors loaded with mmap_mode="r" are read-only until first mutation
+        if not self._vectors.flags.writeable:
+            self._vectors = np.array(self._vectors[: self._size], dtype=np.float32)
+
+    def save(self, path: str):
+        """
+        Persist to `<path>.<version>.npy` (vectors) and `<path>.json` (ids,
+        hashes, documents and the name of the vectors file).
+        An attached backend is saved under `<path>.ann`, a sparse index under `<path>.bm25`.
+
+        Each save writes a new vectors file and then replaces the JSON, which
+        is the commit point: a crash in between leaves the previous pair
+        intact, and a mapped vectors file (Windows cannot replace one) is never
+        overwritten. Older vectors files are deleted once nothing maps them.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        version = self._version + 1
+        vectors_path = f"{path}.{version}.npy"
+        tmp_vectors = f"{path}.tmp.npy"
+        np.save(tmp_vectors, np.ascontiguousarray(self.matrix))
+        os.replace(tmp_vectors, vectors_path)
+
+        meta = {
+            "dim": self.dim,
+            "version": version,
+            "vectors": os.path.basename(vectors_path),
+            "rows": self._size,
+            "hashes": self._hashes,
+            "documents": self._documents,
+        }
+        tmp_meta = f"{path}.json.tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, f"{path}.json")
+        self._version = version
+
+        if isinstance(self._vectors, np.memmap):
+            # Release the old file's mapping so it can be deleted
+            self._vectors = np.load(vectors_path, mmap_mode="r")
+        for stale in glob.glob(f"{glob.escape(path)}.*.npy") + [f"{path}.npy"]:
+            if stale != vectors_path and os.path.exists(stale):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass  # still mapped by another process (Windows); removed by a later save
+
+        if self._backend_ready():
+            self.backend.save(f"{path}.ann")
+        if self.sparse is not None:
+            self.sparse.save(f"{path}.bm25")
+
+    @classmethod
+    def load(cls, path: str, embedding_model, backend_cls=None, sparse_cls=None) -> "DocumentIndex":
+        """
+        Load an index saved with `save`. Vectors are memory-mapped, not re-encoded.
+        If `backend_cls` / `sparse_cls` is given and a saved backend / sparse
+        index exists, it is loaded too.
+        """
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        # Indexes saved before versioning keep their vectors in `<path>.npy`
+        vectors_path = os.path.join(os.path.dirname(path), meta["vectors"]) if "vectors" in meta else f"{path}.npy"
+
+        index = cls(embedding_model, dim=meta["dim"])
+        index._version = meta.get("version", 0)
+        if backend_cls is not None and backend_cls.exists(f"{path}.ann"):
+            index.backend = backend_cls.load(f"{path}.ann")
+        if sparse_cls is not None and sparse_cls.exists(f"{path}.bm25"):
+            index.sparse = sparse_cls.load(f"{path}.bm25")
+        index._vectors = np.load(vectors_path, mmap_mode="r")
+        rows = meta.get("rows", len(meta["documents"]))
+        if index._vectors.shape[0] != rows:
+            raise ValueError(f"{vectors_path} holds {index._vectors.shape[0]} vectors, {path}.json expects {rows}")
+        index._documents = meta["documents"]
+        index._hashes = meta["hashes"]
+        index._size = len(index._documents)
+        index._rows = {doc["id"]: row for row, doc in enumerate(index._documents)}
+        return index
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(f"{path}.json")
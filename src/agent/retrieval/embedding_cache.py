@@ -0,0 +1,74 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+import numpy as np
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of text embeddings, keyed by a hash of the text.
+    Evicts least recently used entries once either `max_items` or
+    `max_bytes` (vector storage) is exceeded.
+    """
+
+    def __init__(self, max_items: int = 10_000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = text_key(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, text: str, vector: np.ndarray):
+        key = text_key(text)
+        vector = np.array(vector, dtype=np.float32)  # own copy, never a view into a batch
+        vector.flags.writeable = False
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = vector
+            self._bytes += vector.nbytes
+            while self._entries and (
+                len(self._entries) > self.max_items or self._bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
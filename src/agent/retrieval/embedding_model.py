@@ -1,16 +1,113 @@
-from typing import List
-from sentence_transformers import SentenceTransformer
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from agent.batching import MicroBatcher
+from agent.retrieval.embedding_cache import EmbeddingCache
+from agent.tracing import tracer
 
 class EmbeddingModel:
     """
     Wrapper around a sentence-transformers embedding model.
+    Repeated texts are served from an LRU cache; with `micro_batching`
+    enabled, encode requests from concurrent callers are merged into batches.
+
+    The model (and torch, through sentence-transformers) is loaded on first
+    use; `warm_up` loads it ahead of time, e.g. from a background thread.
+    `model` may be an already loaded model with the same `encode` /
+    `get_sentence_embedding_dimension` interface (e.g. a benchmark stand-in).
     """
 
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        cache_size: int = 10_000,
+        cache_bytes: int = 64 * 1024 * 1024,
+        micro_batching: bool = False,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        model=None,
+    ):
+        self.model_name = model_name
+        self._model = model
+        self._model_lock = threading.Lock()
+        self.cache: Optional[EmbeddingCache] = (
+            EmbeddingCache(max_items=cache_size, max_bytes=cache_bytes) if cache_size else None
+        )
+        self.batcher: Optional[MicroBatcher] = None
+        if micro_batching:
+            self.batcher = MicroBatcher(
+                self._encode_batch,
+                max_batch_size=max_batch_size,
+                max_wait_ms=max_wait_ms,
+                name="embedding-batcher",
+            )
 
     def embed(self, texts: List[str]) -> List[List[float]]:
         """
         Generate embeddings for a list of texts.
         """
-        return self.model.encode(texts, normalize_embeddings=True).tolist()
+        return self.embed_array(texts).tolist()
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate normalized embeddings as a float32 matrix of shape (len(texts), dim).
+        """
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        if self.cache is None:
+            return self._encode(texts)
+
+        vectors: List[Optional[np.ndarray]] = [self.cache.get(text) for text in texts]
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if tracer.enabled:
+            hits = sum(v is not None for v in vectors)
+            tracer.count("embedding_cache_lookups", hits, result="hit")
+            tracer.count("embedding_cache_lookups", len(texts) - hits, result="miss")
+        if missing:
+            encoded = dict(zip(missing, self._encode(missing)))
+            for text, vector in encoded.items():
+                self.cache.put(text, vector)
+            vectors = [v if v is not None else encoded[t] for t, v in zip(texts, vectors)]
+
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def warm_up(self):
+        """
+        Load the model and run one encode, so the first real query does not pay for either.
+        """
+        self._encode_batch(["warm up"])
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def stats(self) -> Dict:
+        stats = {"cache": self.cache.stats() if self.cache is not None else None}
+        if self.batcher is not None:
+            stats["batches"] = self.batcher.batches
+            stats["mean_batch_size"] = self.batcher.mean_batch_size
+        return stats
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+            self.batcher = None
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if self.batcher is not None:
+            return np.stack(self.batcher.map(texts))
+        return self._encode_batch(texts)
+
+    @tracer.traced("embed.encode")
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        embeddings = self.model.encode(texts, normalize_embeddings=True)
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
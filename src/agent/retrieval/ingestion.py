@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from agent.context.tokens import TokenEstimator
+
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown")
+JSONL_EXTENSIONS = (".jsonl",)
+WORD = re.compile(r"\S+")
+
+
+@dataclass
+class IngestionReport:
+    files: int = 0
+    bytes: int = 0
+    chunks: int = 0
+    duplicates: int = 0  # identical content already seen in this run
+    unchanged: int = 0   # already in the index with the same content (not re-embedded)
+    embedded: int = 0
+    removed: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self) -> Dict:
+        stats = asdict(self)
+        stats["mb_per_s"] = round(self.bytes / 1e6 / self.seconds, 2) if self.seconds else 0.0
+        stats["chunks_per_s"] = round(self.chunks / self.seconds, 1) if self.seconds else 0.0
+        return stats
+
+    def __str__(self) -> str:
+        stats = self.as_dict()
+        return (
+            f"{self.files} files, {self.bytes / 1e6:.1f} MB -> {self.chunks} chunks "
+            f"({self.duplicates} duplicates, {self.unchanged} unchanged, {self.embedded} embedded, "
+            f"{self.removed} removed) in {self.seconds:.1f}s: "
+            f"{stats['mb_per_s']} MB/s, {stats['chunks_per_s']} chunks/s"
+        )
+
+
+def chunk_text(
+    text: str,
+    chunk_tokens: int = 256,
+    overlap_tokens: int = 32,
+    estimator: Optional[TokenEstimator] = None,
+) -> List[str]:
+    """
+    Split text into chunks of at most ~`chunk_tokens` tokens, each repeating
+    the last ~`overlap_tokens` of the previous one. Chunks end at a sentence
+    boundary when one falls in their second half; whitespace inside a chunk
+    is kept as is.
+    """
+    estimator = estimator or TokenEstimator()
+    words = [(m.start(), m.end(), estimator.count(m.group())) for m in WORD.finditer(text)]
+    chunks = []
+    start = 0
+    while start < len(words):
+        end = start
+        used = 0
+        while end < len(words) and (end == start or used + words[end][2] <= chunk_tokens):
+            used += words[end][2]
+            end += 1
+
+        if end < len(words):
+            for cut in range(end - 1, start + (end - start) // 2, -1):
+                if text[words[cut][1] - 1] in ".!?":
+                    end = cut + 1
+                    break
+
+        chunks.append(text[words[start][0] : words[end - 1][1]])
+        if end >= len(words):
+            break
+
+        back = end
+        carried = 0
+        while back > start + 1 and carried + words[back - 1][2] <= overlap_tokens:
+            back -= 1
+            carried += words[back][2]
+        start = back
+    return chunks
+
+
+def iter_files(root: str) -> Iterator[str]:
+    """
+    Yield supported files under `root` in a stable order.
+    """
+    for directory, subdirs, files in os.walk(root):
+        subdirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(TEXT_EXTENSIONS + JSONL_EXTENSIONS):
+                yield os.path.join(directory, name)
+
+
+def plan_shards(paths: Iterable[str], shard_bytes: int) -> Iterator[Tuple[str, int, int]]:
+    """
+    Split work into (path, start, end) byte ranges, so one huge file is
+    parsed by several workers and no worker holds more than about
+    `shard_bytes` of it. Files up to `shard_bytes` are one shard.
+    """
+    for path in paths:
+        size = os.path.getsize(path)
+        if size <= shard_bytes:
+            yield path, 0, size
+            continue
+        for start in range(0, size, shard_bytes):
+            yield path, start, min(start + shard_bytes, size)
+
+
+def _owned_lines(f, start: int, end: int) -> Iterator[Tuple[int, bytes]]:
+    """
+    (offset, line) for the lines of binary file `f` that start inside [start, end).
+    A line crossing `end` is read whole, so a shard can exceed its range by one line.
+    """
+    if start:
+        f.seek(start - 1)
+        f.readline()
+    while f.tell() < end:
+        offset = f.tell()
+        line = f.readline()
+        if not line:
+            break
+        yield offset, line
+
+
+def parse_shard(shard: Tuple[str, int, int], root: str, chunk_tokens: int, overlap_tokens: int) -> List[Dict]:
+    """
+    Read one shard and return its chunks as documents for DocumentIndex.
+    Runs in a worker process, so it only takes and returns plain data.
+
+    Chunk ids are "<record id>#<n>" for JSONL and "<path>#<n>" for text; a
+    text file split into several shards gets "<path>@<shard start>#<n>",
+    and chunks do not overlap across its shard boundaries.
+    """
+    path, start, end = shard
+    source = os.path.relpath(path, root).replace(os.sep, "/")
+    estimator = TokenEstimator()
+    chunks = []
+
+    def add(doc_id: str, content: str):
+        for i, chunk in enumerate(chunk_text(content, chunk_tokens, overlap_tokens, estimator)):
+            chunks.append({"id": f"{doc_id}#{i}", "content": chunk, "source": source})
+
+    with open(path, "rb") as f:
+        if not path.lower().endswith(JSONL_EXTENSIONS):
+            whole = start == 0 and end >= os.fstat(f.fileno()).st_size
+            content = b"".join(line for _, line in _owned_lines(f, start, end))
+            add(source if whole else f"{source}@{start}", content.decode("utf-8", errors="replace"))
+            return chunks
+
+        for offset, line in _owned_lines(f, start, end):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            content = record.get("content") or record.get("text")
+            if content:
+                add(str(record.get("id") or f"{source}@{offset}"), content)
+    return chunks
+
+
+def _bounded_map(fn: Callable, items: Iterable, workers: int, max_pending: int) -> Iterator[Tuple]:
+    """
+    Ordered (item, fn(item)) over a process pool with at most `max_pending`
+    results in flight. workers=0 runs in-process.
+    """
+    if not workers:
+        for item in items:
+            yield item, fn(item)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append((item, pool.submit(fn, item)))
+            if len(pending) >= max_pending:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def ingest_directory(
+    root: str,
+    index,
+    chunk_tokens: int = 256,
+    overlap_tokens: int = 32,
+    batch_size: int = 256,
+    workers: Optional[int] = None,
+    shard_bytes: int = 8 * 1024 * 1024,
+    prune: bool = False,
+    progress: Optional[Callable[[IngestionReport], None]] = None,
+) -> IngestionReport:
+    """
+    Stream txt/markdown/JSONL files under `root` into a DocumentIndex.
+
+    files -> shards -> parse + chunk (process pool) -> dedupe -> batches -> index.upsert
+
+    Only a bounded number of shards (each about `shard_bytes`, plus at most
+    one line) and one embedding batch are held at a time, so corpus size is
+    limited by the index, not by this pipeline.
+    Chunks already indexed with the same content are not re-embedded; a
+    chunk dropped as a duplicate of earlier content loses any older
+    version indexed under its id.
+    workers: parser processes (None = CPU count, 0 = in-process)
+    prune: drop indexed chunks that no longer come from `root`
+    """
+    start = time.perf_counter()
+    report = IngestionReport()
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    seen_hashes = set()
+    seen_ids = set()
+    stale_duplicates: List[str] = []
+    batch: List[Dict] = []
+
+    def flush():
+        stats = index.upsert(batch)
+        report.embedded += stats["added"] + stats["updated"]
+        report.unchanged += stats["unchanged"]
+        batch.clear()
+        report.seconds = time.perf_counter() - start
+        if progress is not None:
+            progress(report)
+
+    def counted(paths: Iterable[str]) -> Iterator[str]:
+        for path in paths:
+            report.files += 1
+            yield path
+
+    shards = plan_shards(counted(iter_files(root)), shard_bytes)
+    parse = partial(parse_shard, root=root, chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
+    for (_, shard_start, shard_end), chunks in _bounded_map(parse, shards, workers, max_pending=2 * max(workers, 1)):
+        report.bytes += shard_end - shard_start
+        for chunk in chunks:
+            report.chunks += 1
+            if chunk["id"] in seen_ids:
+                # Repeated record id (e.g. the same JSONL id twice): first one wins
+                report.duplicates += 1
+                continue
+            seen_ids.add(chunk["id"])
+            # 8-byte digests keep the dedupe set small on big corpora
+            digest = hashlib.blake2b(chunk["content"].encode("utf-8"), digest_size=8).digest()
+            if digest in seen_hashes:
+                report.duplicates += 1
+                if chunk["id"] in index:
+                    # Indexed from an older version with other content; keeping it would be stale
+                    stale_duplicates.append(chunk["id"])
+                continue
+            seen_hashes.add(digest)
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+    if stale_duplicates:
+        index.remove(stale_duplicates)
+        report.removed += len(stale_duplicates)
+
+    if prune:
+        stale = [doc["id"] for doc in index.documents if doc["id"] not in seen_ids]
+        index.remove(stale)
+        report.removed += len(stale)
+
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,353 @@
+import json
+import os
+from typing import List, Optional, Tuple
+import numpy as np
+
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    num_clusters: int,
+    num_iters: int = 20,
+    seed: int = 0,
+    batch_size: int = 65536,
+) -> np.ndarray:
+    """
+    K-means on the unit sphere (cosine similarity), in plain NumPy.
+    Returns normalized centroids of shape (min(num_clusters, num_points), dim).
+    """
+    rng = np.random.default_rng(seed)
+    num_points = vectors.shape[0]
+    if num_points == 0:
+        raise ValueError("Cannot cluster zero vectors")
+    num_clusters = min(num_clusters, num_points)
+    centroids = vectors[rng.choice(num_points, num_clusters, replace=False)].copy()
+
+    for _ in range(num_iters):
+        assignments = assign_to_centroids(vectors, centroids, batch_size)
+        counts = np.bincount(assignments, minlength=num_clusters)
+
+        # Per-cluster sums via one sort + reduceat (np.add.at is much slower)
+        order = np.argsort(assignments, kind="stable")
+        non_empty = np.flatnonzero(counts)
+        starts = (np.cumsum(counts) - counts)[non_empty]
+        sums = np.zeros_like(centroids)
+        sums[non_empty] = np.add.reduceat(vectors[order], starts, axis=0)
+
+        # Re-seed empty clusters from random points
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = vectors[rng.choice(num_points, empty.size, replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    return centroids
+
+
+def assign_to_centroids(
+    vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 65536
+) -> np.ndarray:
+    assignments = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], batch_size):
+        block = vectors[start : start + batch_size]
+        assignments[start : start + batch_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+class _InvertedList:
+    """
+    Growable posting list of (row, code[, scale]) for one coarse centroid.
+    """
+
+    def __init__(self, dim: int, code_dtype):
+        self.size = 0
+        self.rows = np.empty(0, dtype=np.int64)
+        self.codes = np.empty((0, dim), dtype=code_dtype)
+        self.scales = np.empty(0, dtype=np.float32)
+
+    def reserve(self, capacity: int):
+        if capacity <= self.rows.shape[0]:
+            return
+        capacity = max(capacity, 2 * self.rows.shape[0], 8)
+        rows = np.empty(capacity, dtype=np.int64)
+        codes = np.empty((capacity, self.codes.shape[1]), dtype=self.codes.dtype)
+        scales = np.empty(capacity, dtype=np.float32)
+        rows[: self.size] = self.rows[: self.size]
+        codes[: self.size] = self.codes[: self.size]
+        scales[: self.size] = self.scales[: self.size]
+        self.rows, self.codes, self.scales = rows, codes, scales
+
+
+class IVFIndex:
+    """
+    Approximate nearest-neighbour backend for DocumentIndex.
+
+    Vectors are bucketed by their nearest k-means centroid (inverted file).
+    A query only scores the `nprobe` closest buckets, trading recall for
+    latency. With quantization="int8" vectors are stored as int8 codes with
+    a per-vector scale, cutting memory by 4x.
+    """
+
+    def __init__(
+        self,
+        num_lists: int = 1024,
+        nprobe: int = 8,
+        quantization: str = "none",
+        train_size: int = 256,
+        kmeans_iters: int = 20,
+        seed: int = 0,
+    ):
+        if quantization not in {"none", "int8"}:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.num_lists = num_lists
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.train_size = train_size  # training points per list
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[_InvertedList] = []
+        # row -> (list id, position in list); -1 when the row is absent
+        self._list_of = np.full(0, -1, dtype=np.int64)
+        self._pos = np.full(0, -1, dtype=np.int64)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray):
+        """
+        Learn coarse centroids from (a sample of) the vectors.
+        With no vectors the index stays untrained (DocumentIndex then trains
+        it on its first write).
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._list_of = np.full(0, -1, dtype=np.int64)
+        self._pos = np.full(0, -1, dtype=np.int64)
+        self._count = 0
+        if vectors.shape[0] == 0:
+            self.centroids = None
+            self._lists = []
+            return
+        num_lists = max(1, min(self.num_lists, vectors.shape[0]))
+        sample_size = min(vectors.shape[0], num_lists * self.train_size)
+        rng = np.random.default_rng(self.seed)
+        if sample_size < vectors.shape[0]:
+            sample = vectors[np.sort(rng.choice(vectors.shape[0], sample_size, replace=False))]
+        else:
+            sample = vectors
+
+        self.centroids = spherical_kmeans(sample, num_lists, self.kmeans_iters, self.seed)
+        dim = self.centroids.shape[1]
+        code_dtype = np.int8 if self.quantization == "int8" else np.float32
+        self._lists = [_InvertedList(dim, code_dtype) for _ in range(num_lists)]
+
+    def build(self, vectors: np.ndarray):
+        """
+        Train on `vectors` and add them with rows 0..n-1.
+        """
+        self.train(vectors)
+        if self.is_trained:
+            self.add(np.arange(vectors.shape[0]), vectors)
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        """
+        Insert or overwrite vectors for the given rows.
+        A row given twice keeps its last vector.
+        """
+        if not self.is_trained:
+            raise RuntimeError("IVFIndex must be trained before adding vectors")
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(rows), -1)
+        if rows.size == 0:
+            return
+        unique_rows, last = np.unique(rows[::-1], return_index=True)
+        if unique_rows.size != rows.size:
+            rows, vectors = unique_rows, vectors[::-1][last]
+
+        known = rows[rows < self._list_of.shape[0]]
+        self.remove(known[self._list_of[known] >= 0])
+        self._grow_row_maps(int(rows.max()) + 1)
+
+        codes, scales = self._encode(vectors)
+        assignments = assign_to_centroids(vectors, self.centroids)
+
+        # Group rows by list with one sort instead of a scan per list
+        order = np.argsort(assignments, kind="stable")
+        list_ids, starts = np.unique(assignments[order], return_index=True)
+        ends = np.append(starts[1:], order.size)
+        for list_id, start_idx, end_idx in zip(list_ids.tolist(), starts, ends):
+            members = order[start_idx:end_idx]
+            inv = self._lists[list_id]
+            inv.reserve(inv.size + members.size)
+            start, end = inv.size, inv.size + members.size
+            inv.rows[start:end] = rows[members]
+            inv.codes[start:end] = codes[members]
+            inv.scales[start:end] = scales[members]
+            inv.size = end
+            self._list_of[rows[members]] = list_id
+            self._pos[rows[members]] = np.arange(start, end)
+
+        self._count += rows.size  # present rows were removed above, so all are new
+
+    def remove(self, rows: np.ndarray):
+        """
+        Delete rows; the tail entry of each affected list fills the gap.
+        """
+        for row in np.asarray(rows, dtype=np.int64).tolist():
+            if row >= self._list_of.shape[0] or self._list_of[row] < 0:
+                continue
+            inv = self._lists[self._list_of[row]]
+            pos = self._pos[row]
+            last = inv.size - 1
+            if pos != last:
+                moved = inv.rows[last]
+                inv.rows[pos] = moved
+                inv.codes[pos] = inv.codes[last]
+                inv.scales[pos] = inv.scales[last]
+                self._pos[moved] = pos
+            inv.size -= 1
+            self._list_of[row] = -1
+            self._pos[row] = -1
+            self._count -= 1
+
+    def search(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        score_threshold: Optional[float] = None,
+        nprobe: Optional[int] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Approximate top-k search. Same return format as scoring.top_k_scores.
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if not self.is_trained or self._count == 0 or top_k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        nprobe = min(nprobe or self.nprobe, len(self._lists))
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        results = []
+        for query, probe in zip(queries, probes):
+            rows_parts = []
+            score_parts = []
+            for list_id in probe:
+                inv = self._lists[list_id]
+                if inv.size == 0:
+                    continue
+                rows_parts.append(inv.rows[: inv.size])
+                score_parts.append(self._score(inv, query))
+
+            if not rows_parts:
+                results.append([])
+                continue
+
+            rows = np.concatenate(rows_parts)
+            scores = np.concatenate(score_parts)
+            if score_threshold is not None:
+                keep = scores >= score_threshold
+                rows, scores = rows[keep], scores[keep]
+
+            k = min(top_k, scores.shape[0])
+            if k < scores.shape[0]:
+                best = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[best], scores[best]
+            order = np.argsort(-scores, kind="stable")
+            results.append(list(zip(rows[order].tolist(), scores[order].tolist())))
+
+        return results
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales = np.maximum(scales, 1e-12).astype(np.float32)
+            codes = np.round(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales
+        return vectors, np.ones(vectors.shape[0], dtype=np.float32)
+
+    def _score(self, inv: _InvertedList, query: np.ndarray) -> np.ndarray:
+        codes = inv.codes[: inv.size]
+        if self.quantization == "int8":
+            return (codes.astype(np.float32) @ query) * inv.scales[: inv.size]
+        return codes @ query
+
+    def _grow_row_maps(self, size: int):
+        if size <= self._list_of.shape[0]:
+            return
+        size = max(size, 2 * self._list_of.shape[0])
+        list_of = np.full(size, -1, dtype=np.int64)
+        pos = np.full(size, -1, dtype=np.int64)
+        list_of[: self._list_of.shape[0]] = self._list_of
+        pos[: self._pos.shape[0]] = self._pos
+        self._list_of, self._pos = list_of, pos
+
+    def save(self, path: str):
+        """
+        Persist to `<path>.npz` (centroids + packed lists) and `<path>.json` (config).
+        """
+        if not self.is_trained:
+            raise RuntimeError("Cannot save an untrained IVFIndex")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        sizes = np.array([inv.size for inv in self._lists], dtype=np.int64)
+        tmp_arrays = f"{path}.tmp.npz"
+        np.savez(
+            tmp_arrays,
+            centroids=self.centroids,
+            sizes=sizes,
+            rows=np.concatenate([inv.rows[: inv.size] for inv in self._lists]),
+            codes=np.concatenate([inv.codes[: inv.size] for inv in self._lists]),
+            scales=np.concatenate([inv.scales[: inv.size] for inv in self._lists]),
+        )
+        os.replace(tmp_arrays, f"{path}.npz")
+
+        config = {
+            "num_lists": self.num_lists,
+            "nprobe": self.nprobe,
+            "quantization": self.quantization,
+            "train_size": self.train_size,
+            "kmeans_iters": self.kmeans_iters,
+            "seed": self.seed,
+        }
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump(config, f)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            index = cls(**json.load(f))
+
+        with np.load(f"{path}.npz") as data:
+            index.centroids = data["centroids"]
+            sizes, rows, codes, scales = data["sizes"], data["rows"], data["codes"], data["scales"]
+
+        dim = index.centroids.shape[1]
+        index._lists = []
+        index._grow_row_maps(int(rows.max()) + 1 if rows.size else 0)
+        offset = 0
+        for list_id, size in enumerate(sizes.tolist()):
+            inv = _InvertedList(dim, codes.dtype)
+            inv.reserve(size)
+            inv.rows[:size] = rows[offset : offset + size]
+            inv.codes[:size] = codes[offset : offset + size]
+            inv.scales[:size] = scales[offset : offset + size]
+            inv.size = size
+            index._list_of[inv.rows[:size]] = list_id
+            index._pos[inv.rows[:size]] = np.arange(size)
+            index._lists.append(inv)
+            offset += size
+        index._count = offset
+        return index
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(f"{path}.npz") and os.path.exists(f"{path}.json")
@@ -1,64 +1,91 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional
 import numpy as np
+from agent.retrieval.bm25_index import BM25Index
+from agent.retrieval.document_index import DocumentIndex
+from agent.tracing import tracer
+
+# Static system prompt for the "prefix" prompt layout, where the sources are
+# sent separately at the end of the prompt (see build_retrieval_context)
+CITATION_INSTRUCTIONS = (
+    "When SOURCES are given, answer using them.\n"
+    "Cite facts using bracketed numbers like [1], [2].\n"
+    "If the sources do not contain the answer, say so."
+)
 
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
 
 
+@tracer.traced("retrieve")
 def build_retrieval_context(
     query: str,
-    documents: List[Dict],
+    documents: Optional[List[Dict]],
     embedding_model,
     top_k: int = 3,
     score_threshold: float = 0.6,
+    index: Optional[DocumentIndex] = None,
+    instructions: bool = True,
+    scores: bool = True,
+    hybrid: bool = False,
 ) -> str:
     """
     Build a retrieval-augmented context string using embedding similarity.
     Returns an empty string if no relevant documents are found.
+    Only documents scoring at least `score_threshold` are used, unless
+    hybrid=True: then dense hits are fused with BM25 keyword matches (a
+    sparse index is attached to the one-off index; a prebuilt `index` needs
+    its own), and a document below the threshold is still used when it
+    covers `index.min_term_coverage` of the query's terms.
+    When a prebuilt `index` is given, its embeddings are reused and
+    `documents` is ignored.
+    With instructions=False only the SOURCES block is returned (the caller
+    sends CITATION_INSTRUCTIONS itself); scores=False leaves out the
+    similarity scores, which change from query to query.
     """
 
-    if not documents:
+    if index is None:
+        if not documents:
+            return ""
+        # One-off index: embeds every document for this call only
+        index = DocumentIndex(embedding_model)
+        if hybrid:
+            index.attach_sparse(BM25Index())
+        index.sync(documents)
+
+    if len(index) == 0:
         return ""
 
     # Embed query
-    query_embedding = embedding_model.embed([query])[0]
+    query_embedding = embedding_model.embed_array([query])[0]
 
-    # Embed documents
-    doc_texts = [doc["content"] for doc in documents]
-    doc_embeddings = embedding_model.embed(doc_texts)
-    
-    # Score documents + filter documents
-    scored_docs: List[Tuple[float, Dict]] = []
-    for doc, emb in zip(documents, doc_embeddings):
-        score = cosine_similarity(query_embedding, emb)
-        if score >= score_threshold:
-            scored_docs.append((score, doc))
+    # Score, filter and select top-K documents
+    query_texts = [query] if hybrid else None
+    top_docs = index.search(query_embedding, top_k, score_threshold, query_texts=query_texts)[0]
 
     # No relevant documents
-    if not scored_docs:
+    if not top_docs:
         return ""
 
-    # Sort by relevance
-    scored_docs.sort(key=lambda x: x[0], reverse=True)
-
-    # Select top-K
-    top_docs = scored_docs[:top_k]
-
     # Build context prompt without citation.
     """context = (
         "Use the following information to answer the user's question.\n"
         "If the information is insufficient, say so.\n\n"
     )"""
     # Build context with citation instructions
-    context = (
-        "You are answering using the sources below.\n"
-        "Cite facts using bracketed numbers like [1], [2].\n"
-        "If the sources do not contain the answer, say so.\n\n"
-        "SOURCES:\n"
-    )
+    context = ""
+    if instructions:
+        context = (
+            "You are answering using the sources below.\n"
+            "Cite facts using bracketed numbers like [1], [2].\n"
+            "If the sources do not contain the answer, say so.\n\n"
+        )
+    context += "SOURCES:\n"
 
     for i, (score, doc) in enumerate(top_docs, 1):
-        context += f"[{i}] (score: {score:.2f}) {doc['content']}\n"
+        if scores:
+            context += f"[{i}] (score: {score:.2f}) {doc['content']}\n"
+        else:
+            context += f"[{i}] {doc['content']}\n"
 
     return context
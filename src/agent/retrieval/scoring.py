@@ -0,0 +1,78 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+
+def top_k_scores(
+    query_embeddings: np.ndarray,
+    doc_matrix: np.ndarray,
+    top_k: int,
+    score_threshold: Optional[float] = None,
+) -> List[List[Tuple[int, float]]]:
+    """
+    Score one or more queries against every document in a single matrix product.
+    Embeddings must already be normalized, so the dot product is the cosine score.
+    Returns, per query, up to `top_k` (row, score) pairs sorted by descending score.
+    """
+    queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+    num_docs = doc_matrix.shape[0]
+    if num_docs == 0 or top_k <= 0:
+        return [[] for _ in range(queries.shape[0])]
+
+    # (num_queries, num_docs)
+    scores = queries @ doc_matrix.T
+
+    k = min(top_k, num_docs)
+    if k < num_docs:
+        # Partial selection instead of sorting every score
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(num_docs), (scores.shape[0], num_docs))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+    results = []
+    for rows, row_scores in zip(candidates, candidate_scores):
+        if score_threshold is not None:
+            keep = row_scores >= score_threshold
+            rows, row_scores = rows[keep], row_scores[keep]
+        results.append(list(zip(rows.tolist(), row_scores.tolist())))
+    return results
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[int]],
+    k: int = 60,
+    weights: Optional[Sequence[float]] = None,
+) -> List[Tuple[int, float]]:
+    """
+    Fuse ranked row lists: score(row) = sum_i weight_i / (k + rank_i(row)), ranks from 1.
+    Only ranks are used, so scores on different scales (cosine, BM25) combine safely.
+    Returns (row, fused score) sorted by descending score.
+    """
+    fused: Dict[int, float] = {}
+    for i, ranking in enumerate(rankings):
+        weight = 1.0 if weights is None else weights[i]
+        for rank, row in enumerate(ranking, 1):
+            fused[row] = fused.get(row, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def weighted_fusion(
+    dense: Dict[int, float],
+    sparse: Dict[int, float],
+    alpha: float = 0.5,
+) -> List[Tuple[int, float]]:
+    """
+    Blend alpha * cosine + (1 - alpha) * BM25 / max BM25 per row (missing scores count as 0).
+    Returns (row, blended score) sorted by descending score.
+    """
+    top_sparse = max(sparse.values(), default=0.0) or 1.0
+    rows = set(dense) | set(sparse)
+    blended = {
+        row: alpha * dense.get(row, 0.0) + (1.0 - alpha) * sparse.get(row, 0.0) / top_sparse
+        for row in rows
+    }
+    return sorted(blended.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,178 @@
+import re
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+
+CALCULATOR_PREFIX = re.compile(
+    r"^\s*(what\s+is|what's|whats|calculate|compute|evaluate|solve)\s+", re.IGNORECASE
+)
+ARITHMETIC = re.compile(r"^[\d\s.+\-*/%()]+$")
+OPERATOR = re.compile(r"\d\s*(\*\*|[+\-*/%])\s*[\d(]")
+TIMES = re.compile(r"(?<=\d)\s*[x×]\s*(?=\d)")
+# Digits with separators that are not arithmetic: dates, phone numbers, zero-padded numbers
+NOT_ARITHMETIC = [
+    re.compile(r"\b\d{4}[-/.]\d{1,2}[-/.]\d{1,2}\b"),  # 2024-01-05
+    re.compile(r"\b\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}\b"),  # 10/12/2024
+    re.compile(r"(^|[^\d-])(\+?\d{1,3}-)?(\d{3}-)?\d{3}-\d{4}\b"),  # 555-1234, 1-800-555-0199
+    re.compile(r"(?<![\d.])0\d"),  # 007, 05
+]
+# Spoken arithmetic ("12 times 7", "divide 144 by 12"), rewritten to symbols
+NUMBER = r"\d+(?:\.\d+)?"
+SPOKEN_COMMANDS = [
+    (re.compile(rf"^add ({NUMBER}) (?:and|to) ({NUMBER})$"), r"\1 + \2"),
+    (re.compile(rf"^subtract ({NUMBER}) from ({NUMBER})$"), r"\2 - \1"),
+    (re.compile(rf"^multiply ({NUMBER}) (?:and|by) ({NUMBER})$"), r"\1 * \2"),
+    (re.compile(rf"^divide ({NUMBER}) by ({NUMBER})$"), r"\1 / \2"),
+]
+SPOKEN_OPERATORS = [
+    (re.compile(rf"({NUMBER}) (?:percent|%) of "), r"\1 / 100 * "),
+    (re.compile(r" to the power of "), " ** "),
+    (re.compile(r" squared\b"), " ** 2"),
+    (re.compile(r" cubed\b"), " ** 3"),
+    (re.compile(r" (?:times|multiplied by) "), " * "),
+    (re.compile(r" divided by "), " / "),
+    (re.compile(r" plus "), " + "),
+    (re.compile(r" minus "), " - "),
+]
+CHIT_CHAT = re.compile(
+    r"^\s*(hi|hello|hey|good (morning|afternoon|evening)|thanks?|thank you|bye|goodbye|"
+    r"how are you|ok(ay)?|cool|great)\b[\s!.?]*$",
+    re.IGNORECASE,
+)
+
+
+def extract_expression(user_input: str) -> Optional[Dict[str, str]]:
+    """
+    Pull a bare arithmetic expression out of inputs like "what is 12*7?".
+    Dates, phone numbers and zero-padded numbers are left to the LLM.
+    """
+    text = CALCULATOR_PREFIX.sub("", user_input).strip().rstrip("?=. ")
+    text = TIMES.sub("*", text).replace("÷", "/")
+    if not (text and ARITHMETIC.match(text) and OPERATOR.search(text)):
+        return None
+    if any(pattern.search(text) for pattern in NOT_ARITHMETIC):
+        return None
+    return {"expression": text}
+
+
+def extract_spoken_expression(user_input: str) -> Optional[Dict[str, str]]:
+    """
+    Like extract_expression, but also reads operators spelled out in words
+    ("12 times 7", "15 percent of 200", "divide 144 by 12"). Used once the
+    embedding tier has picked the calculator, so words alone never route.
+    """
+    text = CALCULATOR_PREFIX.sub("", user_input).strip().rstrip("?=. ").lower()
+    text = re.sub(r"\s+", " ", text)
+    for pattern, replacement in SPOKEN_COMMANDS:
+        text = pattern.sub(replacement, text)
+    for pattern, replacement in SPOKEN_OPERATORS:
+        text = pattern.sub(replacement, text)
+    return extract_expression(text)
+
+
+class IntentRouter:
+    """
+    Cheap local routing tier in front of the LLM planner.
+
+    Rules catch unambiguous inputs (bare arithmetic, greetings); otherwise the
+    input is compared against exemplar utterances per route with the embedding
+    model, which is how spoken arithmetic ("12 times 7") reaches the calculator. A plan is returned only when the best route clears
+    `confidence_threshold` and beats the runner-up by `margin`; tool routes
+    also need an argument extractor that succeeds. Otherwise returns None and
+    the caller falls back to the LLM.
+    """
+
+    DEFAULT_EXEMPLARS = {
+        "respond": [
+            "hello",
+            "how are you doing today",
+            "thanks for the help",
+            "what is supervised learning",
+            "explain reinforcement learning to me",
+            "what is the difference between supervised and unsupervised learning",
+            "can you summarize what we talked about",
+            "tell me more about that",
+            "why does that work",
+        ],
+        "SimpleCalculatorTool": [
+            "what is 12 times 7",
+            "calculate 15 percent of 200",
+            "add 3 and 4",
+            "what is 2 to the power of 10",
+            "divide 144 by 12",
+        ],
+    }
+
+    def __init__(
+        self,
+        embedding_model,
+        exemplars: Optional[Dict[str, List[str]]] = None,
+        extractors: Optional[Dict[str, Callable[[str], Optional[Dict]]]] = None,
+        confidence_threshold: float = 0.75,
+        margin: float = 0.05,
+    ):
+        self.embedding_model = embedding_model
+        self.exemplars = exemplars or self.DEFAULT_EXEMPLARS
+        self.extractors = extractors if extractors is not None else {
+            "SimpleCalculatorTool": extract_spoken_expression,
+        }
+        self.confidence_threshold = confidence_threshold
+        self.margin = margin
+
+        self._labels: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def route(self, user_input: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a plan dict (same shape as Planner.plan) or None if ambiguous.
+        """
+        # Rules
+        arguments = extract_expression(user_input)
+        if arguments is not None and "SimpleCalculatorTool" in self.exemplars:
+            return self._plan("tool", "SimpleCalculatorTool", arguments, 1.0)
+        if CHIT_CHAT.match(user_input):
+            return self._plan("respond", None, {}, 1.0)
+
+        # Embedding similarity against exemplars
+        scores = self._route_scores(user_input)
+        if len(scores) == 0:
+            return None
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best_route, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+        if best < self.confidence_threshold or best - runner_up < self.margin:
+            return None
+
+        if best_route == "respond":
+            return self._plan("respond", None, {}, best)
+
+        extractor = self.extractors.get(best_route)
+        arguments = extractor(user_input) if extractor else None
+        if arguments is None:
+            return None
+        return self._plan("tool", best_route, arguments, best)
+
+    def _route_scores(self, user_input: str) -> Dict[str, float]:
+        if self._matrix is None:
+            texts = []
+            for label, utterances in self.exemplars.items():
+                texts.extend(utterances)
+                self._labels.extend([label] * len(utterances))
+            self._matrix = self.embedding_model.embed_array(texts)
+
+        query = self.embedding_model.embed_array([user_input])[0]
+        similarities = self._matrix @ query
+        scores: Dict[str, float] = {}
+        for label, score in zip(self._labels, similarities.tolist()):
+            scores[label] = max(score, scores.get(label, -1.0))
+        return scores
+
+    @staticmethod
+    def _plan(action: str, tool_name: Optional[str], arguments: Dict, confidence: float) -> Dict:
+        return {
+            "action": action,
+            "tool_name": tool_name,
+            "arguments": arguments,
+            "confidence": confidence,
+            "router": "local",
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from agent.context.controller import ContextController
+from agent.memory import Memory
+from agent.memory_log import MemoryJournal
+from agent.pipeline import TurnPipeline
+from agent.worker_pool import PoolOverloaded
+
+
+@dataclass
+class Session:
+    """
+    Per-conversation state. Models and pools are shared; these are not.
+    """
+    id: str
+    memory: Memory
+    context_controller: ContextController
+    pipeline: TurnPipeline
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)  # one turn at a time
+    last_active: float = field(default_factory=time.monotonic)
+    turns: int = 0
+    journal: Optional[MemoryJournal] = None  # set when sessions are persisted
+
+
+class SessionManager:
+    """
+    Creates sessions on demand, caps how many are open and evicts idle ones.
+    A closing session stays registered until its pipeline is drained and its
+    journal closed; `get` for that id waits, so two journals never share a file.
+    """
+
+    def __init__(
+        self,
+        create_session: Callable[[str], Session],
+        max_sessions: int = 1000,
+        idle_timeout: float = 30 * 60,
+    ):
+        self.create_session = create_session
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[str, Session] = {}
+        self._closing: Dict[str, asyncio.Event] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def get(self, session_id: str) -> Session:
+        while session_id in self._closing:
+            await self._closing[session_id].wait()
+        session = self._sessions.get(session_id)
+        if session is None:
+            if len(self._sessions) >= self.max_sessions:
+                raise PoolOverloaded(f"Session limit reached ({self.max_sessions})")
+            session = self.create_session(session_id)
+            self._sessions[session_id] = session
+        session.last_active = time.monotonic()
+        return session
+
+    async def close(self, session_id: str) -> bool:
+        closing = self._closing.get(session_id)
+        if closing is not None:
+            await closing.wait()
+            return False
+        session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        closing = self._closing[session_id] = asyncio.Event()
+        try:
+            async with session.lock:
+                await session.pipeline.drain()
+            session.pipeline.close()
+            if session.journal is not None:
+                session.journal.close()
+        finally:
+            del self._sessions[session_id]
+            del self._closing[session_id]
+            closing.set()
+        return True
+
+    async def evict_idle(self) -> List[str]:
+        now = time.monotonic()
+        idle = [
+            sid for sid, s in self._sessions.items()
+            if now - s.last_active > self.idle_timeout and not s.lock.locked() and sid not in self._closing
+        ]
+        for sid in idle:
+            await self.close(sid)
+        return idle
+
+    async def close_all(self):
+        for sid in list(self._sessions):
+            await self.close(sid)
@@ -0,0 +1,118 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+
+class Lazy:
+    """
+    Stand-in for an object that is expensive to create (heavy imports, model
+    loading). The factory runs once, on first attribute access or `get()`,
+    and is thread-safe, so a warm-up thread and the first real caller can race.
+    Attribute access is forwarded, so a Lazy can be passed where the object is expected.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> Any:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self._factory()
+                    self._loaded = True
+        return self._value
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+class Startup:
+    """
+    Records how long each startup component takes.
+
+    `measure` times a step on the calling thread; `warm_up` runs a loader
+    (model load + dummy inference) on a background thread, so components
+    load in parallel while the agent already accepts input.
+    `timings` and `errors` are written from those threads: read them via `report`.
+    """
+
+    def __init__(self, verbose: bool = True):
+        self.verbose = verbose
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()  # guards timings, errors and _threads
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def measure(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def warm_up(self, name: str, loader: Callable[[], Any]):
+        def run():
+            start = time.perf_counter()
+            try:
+                loader()
+            except BaseException as e:
+                # Not fatal here: the component retries (and raises) on first real use
+                with self._lock:
+                    self.errors[name] = e
+                if self.verbose:
+                    print(f"\n[DEBUG] Warm-up {name} failed: {e}")
+                return
+            seconds = self._record(name, time.perf_counter() - start)
+            if self.verbose:
+                print(f"\n[DEBUG] Warm-up {name}: {seconds:.2f}s")
+
+        thread = threading.Thread(target=run, name=f"warm-up-{name}", daemon=True)
+        with self._lock:
+            self._threads[name] = thread
+        thread.start()
+
+    def ready(self) -> float:
+        """
+        Mark the agent as ready for input; returns seconds since construction.
+        """
+        return self._record("ready", time.perf_counter() - self._start)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for all warm-ups; returns False if some are still running after `timeout`.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._lock:
+            threads = list(self._threads.values())
+        for thread in threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.perf_counter()))
+        return not any(thread.is_alive() for thread in threads)
+
+    def report(self) -> Dict[str, Any]:
+        # Snapshot under the lock: warm-up threads may still be recording.
+        # Liveness first, so a warm-up that just finished has its timing copied.
+        with self._lock:
+            loading = {name for name, thread in self._threads.items() if thread.is_alive()}
+            timings = dict(self.timings)
+            failed = set(self.errors)
+        report: Dict[str, Any] = {name: round(seconds, 3) for name, seconds in timings.items()}
+        for name in loading:
+            report[name] = "loading"
+        for name in failed - loading:
+            report[name] = "failed"
+        return report
+
+    def _record(self, name: str, seconds: float) -> float:
+        with self._lock:
+            self.timings[name] = seconds
+        return seconds
@@ -0,0 +1,283 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from agent.tool_use import ToolCall, resolve_arguments
+from agent.tracing import tracer
+from agent.worker_pool import WorkerPool, run_blocking
+
+
+class ToolTimeout(TimeoutError):
+    """
+    Raised inside ToolRuntime when a tool call exceeds its timeout.
+    """
+
+
+@dataclass
+class ToolResult:
+    tool_name: str
+    output: Optional[str] = None  # text form of `value`
+    error: Optional[str] = None
+    seconds: float = 0.0
+    timed_out: bool = False
+    value: Any = None  # what the tool returned; substituted into dependent calls
+    call_id: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def text(self) -> str:
+        """
+        What the agent shows / stores: the output, or a short error message.
+        """
+        if self.ok:
+            return self.output
+        return f"Error running {self.tool_name}: {self.error}"
+
+
+class _ToolStats:
+    def __init__(self, window: int = 256):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def record(self, result: ToolResult):
+        self.calls += 1
+        self.errors += 0 if result.ok else 1
+        self.timeouts += 1 if result.timed_out else 0
+        self.total_seconds += result.seconds
+        self.max_seconds = max(self.max_seconds, result.seconds)
+        self.recent.append(result.seconds)
+
+    def as_dict(self) -> Dict:
+        recent = sorted(self.recent)
+        p95 = recent[min(len(recent) - 1, int(0.95 * len(recent)))] if recent else 0.0
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "mean_ms": round(1000 * self.total_seconds / self.calls, 2) if self.calls else 0.0,
+            "p95_ms": round(1000 * p95, 2),
+            "max_ms": round(1000 * self.max_seconds, 2),
+        }
+
+
+def _call_tool(tool, arguments: Dict) -> Any:
+    return tool.run(**arguments)
+
+
+class _ProcessLane:
+    """
+    Process pool for tools marked `isolated`: a call that times out is
+    actually stopped, by terminating the pool and starting a fresh one.
+    Calls still running in the old pool fail with ToolTimeout too.
+    """
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    async def run(self, tool, arguments: Dict, timeout: float) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def settle(setter, value):
+            loop.call_soon_threadsafe(lambda: future.done() or setter(value))
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.processes)
+            pool = self._pool
+            pool.apply_async(
+                _call_tool, (tool, arguments),
+                callback=lambda value: settle(future.set_result, value),
+                error_callback=lambda error: settle(future.set_exception, error),
+            )
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            await asyncio.to_thread(self._restart, pool)
+            raise ToolTimeout(f"timed out after {timeout:g}s") from None
+
+    def _restart(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self.restarts += 1
+        pool.terminate()
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+
+
+class ToolRuntime:
+    """
+    Executes tool calls off the event loop with per-call timeouts.
+
+    Calls run on the "tool" WorkerPool (or the default thread pool) and are
+    abandoned after `timeout` seconds; the awaiting turn is released at once
+    and cancelling the awaiting task cancels the call. A thread cannot be
+    killed, so tools that may run away should set `isolated = True`: they
+    run in worker processes (`processes` > 0), which are terminated on
+    timeout. Independent calls can be run concurrently with `run_many`, and
+    a plan's DAG of calls with `run_plan`.
+
+    Latency is recorded per tool (see `stats`).
+    """
+
+    def __init__(
+        self,
+        default_timeout: float = 5.0,
+        timeouts: Optional[Dict[str, float]] = None,
+        pool: Optional[WorkerPool] = None,
+        processes: int = 0,
+    ):
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+        self.pool = pool
+        # Created on first use; needs a __main__ guard in the entry script on Windows
+        self._processes = _ProcessLane(processes) if processes else None
+        self._stats: Dict[str, _ToolStats] = {}
+
+    async def run(
+        self,
+        tool_name: str,
+        tool,
+        arguments: Optional[Dict] = None,
+        session_id: str = "default",
+        timeout: Optional[float] = None,
+    ) -> ToolResult:
+        """
+        Run one tool call; errors and timeouts are returned in the ToolResult, not raised.
+        """
+        timeout = timeout or self.timeouts.get(tool_name, self.default_timeout)
+        arguments = arguments or {}
+        result = ToolResult(tool_name)
+        start = time.perf_counter()
+        with tracer.span(f"tool:{tool_name}") as span:
+            try:
+                if self._processes is not None and getattr(tool, "isolated", False):
+                    result.value = await self._processes.run(tool, arguments, timeout)
+                else:
+                    result.value = await asyncio.wait_for(
+                        run_blocking(self.pool, session_id, _call_tool, tool, arguments), timeout
+                    )
+                result.output = result.value if isinstance(result.value, str) else str(result.value)
+            except (asyncio.TimeoutError, ToolTimeout):
+                result.error = f"timed out after {timeout:g}s"
+                result.timed_out = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result.error = str(e) or type(e).__name__
+            if result.error is not None:
+                span.set(error=result.error)
+        result.seconds = time.perf_counter() - start
+        self._stats.setdefault(tool_name, _ToolStats()).record(result)
+        return result
+
+    async def run_many(
+        self,
+        calls: List[Tuple[str, Any, Dict]],
+        session_id: str = "default",
+    ) -> List[ToolResult]:
+        """
+        Run independent (tool_name, tool, arguments) calls concurrently; results keep call order.
+        """
+        return list(await asyncio.gather(*(
+            self.run(tool_name, tool, arguments, session_id=session_id)
+            for tool_name, tool, arguments in calls
+        )))
+
+    async def run_plan(
+        self,
+        calls: List[ToolCall],
+        tools,
+        session_id: str = "default",
+    ) -> List[ToolResult]:
+        """
+        Run a DAG of tool calls. Each call starts as soon as the calls it
+        depends on have succeeded (their results are substituted into its
+        arguments), so independent branches run in parallel. A call whose
+        dependency failed, is unknown or is part of a cycle is not run.
+        `tools` is a ToolRegistry (arguments are validated) or a plain dict.
+        Returns one result per call, in call order.
+        """
+        loop = asyncio.get_running_loop()
+        by_id: Dict[str, ToolCall] = {}
+        pending: Dict[str, asyncio.Future] = {}
+
+        def failed(call: ToolCall, error: str) -> asyncio.Future:
+            future = loop.create_future()
+            future.set_result(ToolResult(call.tool_name, error=error, call_id=call.id))
+            return future
+
+        async def execute(call: ToolCall) -> ToolResult:
+            dependencies = [await pending[dep] for dep in call.depends_on]
+            for dependency in dependencies:
+                if not dependency.ok:
+                    return ToolResult(call.tool_name, error=f"skipped, {dependency.call_id} failed", call_id=call.id)
+            arguments = resolve_arguments(call.arguments, {d.call_id: d.value for d in dependencies})
+            if hasattr(tools, "validate"):
+                arguments = tools.coerce(call.tool_name, arguments)
+                error = tools.validate(call.tool_name, arguments)
+            else:
+                error = None if call.tool_name in tools else f"unknown tool {call.tool_name!r}"
+            if error is not None:
+                return ToolResult(call.tool_name, error=error, call_id=call.id)
+            result = await self.run(call.tool_name, tools[call.tool_name], arguments, session_id=session_id)
+            result.call_id = call.id
+            return result
+
+        duplicates: Dict[int, asyncio.Future] = {}
+        for index, call in enumerate(calls):
+            if call.id in by_id:
+                duplicates[index] = failed(call, f"duplicate call id {call.id!r}")
+            else:
+                by_id[call.id] = call
+
+        # Start calls in topological order, so every dependency has a future first
+        waiting = list(by_id.values())
+        progress = True
+        while waiting and progress:
+            progress = False
+            for call in list(waiting):
+                unknown = [dep for dep in call.depends_on if dep not in by_id]
+                if unknown:
+                    pending[call.id] = failed(call, f"unknown dependency {unknown[0]!r}")
+                elif all(dep in pending for dep in call.depends_on):
+                    pending[call.id] = asyncio.ensure_future(execute(call))
+                else:
+                    continue
+                waiting.remove(call)
+                progress = True
+        for call in waiting:
+            pending[call.id] = failed(call, "dependency cycle")
+
+        return list(await asyncio.gather(*(
+            duplicates[index] if index in duplicates else pending[call.id]
+            for index, call in enumerate(calls)
+        )))
+
+    def stats(self) -> Dict[str, Dict]:
+        stats = {name: tool_stats.as_dict() for name, tool_stats in self._stats.items()}
+        if self._processes is not None:
+            stats["process_restarts"] = self._processes.restarts
+        return stats
+
+    def close(self):
+        if self._processes is not None:
+            self._processes.close()
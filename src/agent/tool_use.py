@@ -0,0 +1,213 @@
+import inspect
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+# "{a}" in an argument refers to the result of the call with id "a"
+REFERENCE = re.compile(r"\{([A-Za-z0-9_\-]+)\}")
+
+JSON_TYPES = {
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+}
+ANNOTATION_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", list: "array", dict: "object"}
+
+
+@dataclass
+class ToolSpec:
+    name: str
+    tool: Any
+    description: str
+    parameters: Dict[str, Any]  # JSON schema of the arguments object
+
+
+@dataclass
+class ToolCall:
+    id: str
+    tool_name: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+    depends_on: List[str] = field(default_factory=list)
+
+
+def _schema_from_signature(fn) -> Dict[str, Any]:
+    properties, required = {}, []
+    for name, param in inspect.signature(fn).parameters.items():
+        if name == "self" or param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+            continue
+        properties[name] = {"type": ANNOTATION_TYPES.get(param.annotation, "string")}
+        if param.default is param.empty:
+            required.append(name)
+    return {"type": "object", "properties": properties, "required": required}
+
+
+class ToolRegistry(Mapping):
+    """
+    Name -> tool mapping plus each tool's description and argument schema.
+
+    Tools declare `description` and `parameters` (a JSON schema object);
+    without `parameters` the schema is derived from the signature of `run`.
+    The planner's tool section is generated from the registry and cached
+    until the next `register`.
+    """
+
+    def __init__(self, tools: Optional[Mapping[str, Any]] = None):
+        self._specs: Dict[str, ToolSpec] = {}
+        self._prompt: Optional[str] = None
+        for name, tool in (tools or {}).items():
+            self.register(tool, name=name)
+
+    def register(
+        self,
+        tool,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+        parameters: Optional[Dict[str, Any]] = None,
+    ) -> ToolSpec:
+        spec = ToolSpec(
+            name=name or type(tool).__name__,
+            tool=tool,
+            description=description or getattr(tool, "description", "") or (inspect.getdoc(tool) or "").split("\n")[0],
+            parameters=parameters or getattr(tool, "parameters", None) or _schema_from_signature(tool.run),
+        )
+        self._specs[spec.name] = spec
+        self._prompt = None
+        return spec
+
+    def __getitem__(self, name: str):
+        return self._specs[name].tool
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._specs)
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def spec(self, name: str) -> ToolSpec:
+        return self._specs[name]
+
+    def coerce(self, name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Turn numbers into strings where the schema wants a string (e.g. a
+        "{a}" reference to a calculator result passed on as an expression).
+        """
+        if name not in self._specs or not isinstance(arguments, dict):
+            return arguments
+        properties = self._specs[name].parameters.get("properties", {})
+        coerced = dict(arguments)
+        for key, value in arguments.items():
+            wants_string = properties.get(key, {}).get("type") == "string"
+            if wants_string and isinstance(value, (int, float)) and not isinstance(value, bool):
+                coerced[key] = str(value)
+        return coerced
+
+    def validate(self, name: str, arguments: Dict[str, Any]) -> Optional[str]:
+        """
+        Check arguments against the tool's schema; returns an error message or None.
+        """
+        if name not in self._specs:
+            return f"unknown tool {name!r}"
+        if not isinstance(arguments, dict):
+            return "arguments must be an object"
+        schema = self._specs[name].parameters
+        properties = schema.get("properties", {})
+        missing = [key for key in schema.get("required", []) if key not in arguments]
+        if missing:
+            return f"missing argument(s): {', '.join(missing)}"
+        for key, value in arguments.items():
+            if key not in properties:
+                return f"unexpected argument {key!r}"
+            expected = JSON_TYPES.get(properties[key].get("type"))
+            # bool is an int in Python, but not a JSON number
+            if expected is not None and (
+                not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool)
+            ):
+                return f"argument {key!r} must be {properties[key]['type']}"
+        return None
+
+    def prompt_section(self) -> str:
+        """
+        The "Available tools" part of the planner prompt (cached).
+        """
+        if self._prompt is None:
+            lines = ["Available tools:"]
+            for spec in self._specs.values():
+                arguments = {}
+                required = set(spec.parameters.get("required", []))
+                for key, prop in spec.parameters.get("properties", {}).items():
+                    text = prop.get("type", "any")
+                    if key not in required:
+                        text += ", optional"
+                    if prop.get("description"):
+                        text += f" - {prop['description']}"
+                    arguments[key] = text
+                lines.append(f"- {spec.name}: {spec.description}")
+                lines.append(f"  arguments: {json.dumps(arguments, ensure_ascii=False)}")
+            if not self._specs:
+                lines.append("(none)")
+            self._prompt = "\n".join(lines)
+        return self._prompt
+
+
+def parse_calls(plan: Dict[str, Any]) -> List[ToolCall]:
+    """
+    Tool calls of a plan: its "calls" list (a DAG via "depends_on" and
+    "{id}" references), or the single top-level tool_name/arguments.
+    """
+    if plan.get("action") != "tool":
+        return []
+    raw = plan.get("calls")
+    if not raw:
+        raw = [{"tool_name": plan.get("tool_name"), "arguments": plan.get("arguments")}]
+
+    calls = [
+        ToolCall(
+            id=str(item.get("id") or f"call{i}"),
+            tool_name=item["tool_name"],
+            arguments=item.get("arguments") or {},
+            depends_on=[str(dep) for dep in item.get("depends_on") or []],
+        )
+        for i, item in enumerate(raw)
+        if isinstance(item, dict) and item.get("tool_name")
+    ]
+    # A reference to another call implies a dependency, even when the planner forgot to list it
+    ids = {call.id for call in calls}
+    for call in calls:
+        for ref in references(call.arguments):
+            if ref in ids and ref != call.id and ref not in call.depends_on:
+                call.depends_on.append(ref)
+    return calls
+
+
+def references(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return REFERENCE.findall(value)
+    if isinstance(value, dict):
+        return [ref for item in value.values() for ref in references(item)]
+    if isinstance(value, list):
+        return [ref for item in value for ref in references(item)]
+    return []
+
+
+def resolve_arguments(value: Any, results: Dict[str, Any]) -> Any:
+    """
+    Replace "{id}" references with call results. An argument that is
+    exactly one reference gets the result itself (keeping its type);
+    references inside longer strings are formatted into them.
+    """
+    if isinstance(value, str):
+        whole = REFERENCE.fullmatch(value)
+        if whole and whole.group(1) in results:
+            return results[whole.group(1)]
+        return REFERENCE.sub(
+            lambda m: str(results[m.group(1)]) if m.group(1) in results else m.group(0), value
+        )
+    if isinstance(value, dict):
+        return {key: resolve_arguments(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_arguments(item, results) for item in value]
+    return value
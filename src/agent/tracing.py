@@ -0,0 +1,385 @@
+import contextvars
+import functools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Histogram buckets: 0.1 ms .. ~105 s, 4 per doubling (quantile error < 10%)
+BUCKET_BOUNDS = [0.0001 * 2 ** (i / 4) for i in range(81)]
+
+_current: contextvars.ContextVar = contextvars.ContextVar("agent_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "children", "parent", "thread")
+
+    def __init__(self, name: str, attrs: Dict[str, Any], parent: Optional["Span"]):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.children: List["Span"] = []
+        self.thread = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+
+    @property
+    def seconds(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        origin = self.start if origin is None else origin
+        record = {
+            "name": self.name,
+            "start_ms": round(1000 * (self.start - origin), 3),
+            "ms": round(1000 * self.seconds, 3),
+        }
+        if self.attrs:
+            record["attrs"] = self.attrs
+        if self.thread != "MainThread":
+            record["thread"] = self.thread
+        if self.children:
+            record["children"] = [child.to_dict(origin) for child in self.children]
+        return record
+
+
+class _NullSpan:
+    """
+    Returned by a disabled tracer: entering, exiting and set() do nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Histogram:
+    """
+    Log-bucketed latency histogram (seconds); quantiles are interpolated within a bucket.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        if seconds <= BUCKET_BOUNDS[0]:
+            index = 0
+        else:
+            index = min(len(BUCKET_BOUNDS), math.ceil(4 * math.log2(seconds / BUCKET_BOUNDS[0])))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                upper = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+                lower = BUCKET_BOUNDS[index - 1] if index else 0.0
+                return min(self.max, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+
+class _Span:
+    """
+    Context manager that opens a Span as a child of the current one.
+    """
+    __slots__ = ("tracer", "name", "attrs", "span", "token")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self) -> Span:
+        parent = _current.get()
+        self.span = Span(self.name, self.attrs, parent)
+        if parent is not None:
+            parent.children.append(self.span)
+        else:
+            self.tracer._root_started(self.span)
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.end = time.perf_counter()
+        if exc_type is not None:
+            span.attrs["error"] = exc_type.__name__
+        try:
+            _current.reset(self.token)
+        except ValueError:
+            # Closed in another context (e.g. a generator finished elsewhere)
+            _current.set(span.parent)
+        self.tracer._finished(span)
+        return False
+
+
+class Tracer:
+    """
+    Lightweight span tracing and metrics.
+
+    `span(name, **attrs)` opens a child of the current span (tracked with
+    contextvars, so it follows asyncio tasks and asyncio.to_thread); a span
+    without a parent is the root of a trace, e.g. one agent turn. Finished
+    spans feed a latency histogram per span name; `count` keeps counters
+    (tokens, cache hits). Finished traces go to `exporters` (callables
+    taking the trace dict, e.g. JsonlExporter).
+
+    Disabled (the default), `span` returns a shared no-op object and `count`
+    returns at once, so instrumented code pays one attribute check.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.exporters: List[Callable[[Dict[str, Any]], None]] = []
+        self.profiler: Optional["SlowTraceProfiler"] = None
+        self.last_trace: Optional[Dict[str, Any]] = None
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, attrs)
+
+    def traced(self, name: Optional[str] = None):
+        """
+        Decorator: run the function inside a span (named after it by default).
+        """
+        def decorate(fn):
+            span_name = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Span(self, span_name, {}):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def count(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def current(self) -> Optional[Span]:
+        return _current.get()
+
+    @contextmanager
+    def detached(self):
+        """
+        Run without a current span, e.g. while starting a background task
+        that must not attach its spans to the turn that happened to start it.
+        """
+        token = _current.set(None)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Per-span latency quantiles (ms) and counters.
+        """
+        with self._lock:
+            spans = {
+                name: {
+                    "count": h.count,
+                    "p50_ms": round(1000 * h.quantile(0.50), 2),
+                    "p95_ms": round(1000 * h.quantile(0.95), 2),
+                    "p99_ms": round(1000 * h.quantile(0.99), 2),
+                    "max_ms": round(1000 * h.max, 2),
+                }
+                for name, h in sorted(self._histograms.items())
+            }
+            counters = {_metric_key(name, labels): value for (name, labels), value in sorted(self._counters.items())}
+        return {"spans": spans, "counters": counters}
+
+    def prometheus(self, prefix: str = "agent") -> str:
+        """
+        Metrics in the Prometheus text exposition format.
+        """
+        lines = [f"# TYPE {prefix}_span_seconds histogram"]
+        with self._lock:
+            for name, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for index, count in enumerate(h.counts[:-1]):
+                    cumulative += count
+                    if index % 4 == 0:  # export one bound per doubling
+                        lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="{BUCKET_BOUNDS[index]:.6g}"}} {cumulative}')
+                lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="+Inf"}} {h.count}')
+                lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {h.sum:.6f}')
+                lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {h.count}')
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = f"{prefix}_{name}_total"
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} counter")
+                    typed.add(metric)
+                lines.append(f"{metric}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def _root_started(self, span: Span):
+        if self.profiler is not None:
+            self.profiler.started(span)
+
+    def _finished(self, span: Span):
+        with self._lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = Histogram()
+            histogram.observe(span.seconds)
+        if span.parent is not None:
+            return
+
+        trace = span.to_dict()
+        trace["time"] = time.time()
+        if self.profiler is not None:
+            profile = self.profiler.finished(span)
+            if profile is not None:
+                trace["profile"] = profile
+        self.last_trace = trace
+        for exporter in self.exporters:
+            try:
+                exporter(trace)
+            except Exception as e:
+                print(f"[TRACE] Export failed: {e}")
+
+
+def _labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def _metric_key(name: str, labels: Tuple) -> str:
+    return name + _labels(labels)
+
+
+def format_trace(trace: Dict[str, Any], min_ms: float = 0.0) -> str:
+    """
+    One-line view of a trace, e.g. "turn 812ms [plan 301ms, llm.generate 490ms [...]]".
+    """
+    children = [format_trace(c, min_ms) for c in trace.get("children", []) if c["ms"] >= min_ms]
+    text = f"{trace['name']} {trace['ms']:.0f}ms"
+    return f"{text} [{', '.join(children)}]" if children else text
+
+
+class JsonlExporter:
+    """
+    Appends every finished trace as one JSON line.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, trace: Dict[str, Any]):
+        line = json.dumps(trace, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class SlowTraceProfiler:
+    """
+    Opt-in sampling profiler for slow traces.
+
+    While a root span named in `spans` is open, a background thread samples
+    the stacks of every thread each `interval` seconds. If the trace ends up
+    slower than `threshold` seconds, the samples are returned as collapsed
+    stacks ("frame;frame;frame count", flamegraph input) and attached to
+    the trace; faster traces discard them.
+    """
+
+    def __init__(self, threshold: float = 2.0, interval: float = 0.005, spans=("turn",), max_stacks: int = 200):
+        self.threshold = threshold
+        self.interval = interval
+        self.spans = set(spans)
+        self.max_stacks = max_stacks
+        self._active: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def started(self, span: Span):
+        if span.name not in self.spans:
+            return
+        with self._lock:
+            self._active[id(span)] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name="trace-profiler", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def finished(self, span: Span) -> Optional[List[str]]:
+        with self._lock:
+            samples = self._active.pop(id(span), None)
+        if samples is None or span.seconds < self.threshold:
+            return None
+        return [f"{stack} {count}" for stack, count in samples.most_common(self.max_stacks)]
+
+    def _sample(self):
+        me = threading.get_ident()
+        names = {}
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._wake.wait()
+                active = list(self._active.values())
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                collapsed = ";".join(reversed(stack))
+                for samples in active:
+                    samples[collapsed] += 1
+            time.sleep(self.interval)
+
+
+# Process-wide tracer; main.py / server.py enable it
+tracer = Tracer()
@@ -0,0 +1,106 @@
+import asyncio
+import contextvars
+import functools
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+
+class PoolOverloaded(RuntimeError):
+    """
+    Raised when a WorkerPool's queue is full; callers should shed load (e.g. HTTP 503).
+    """
+
+
+class WorkerPool:
+    """
+    Bounded, fair pool for blocking work shared by many sessions.
+
+    At most `max_concurrency` jobs run at once on the pool's threads and at
+    most `max_queue` wait. Waiting jobs are kept per session and dispatched
+    round-robin, so one chatty session cannot starve the others.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int = 1024):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.completed = 0
+        self.rejected = 0
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=name)
+        self._queues: "OrderedDict[str, Deque[Tuple]]" = OrderedDict()
+        self._queued = 0
+        self._running = 0
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    async def run(self, session_id: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) on the pool on behalf of `session_id`.
+        """
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise PoolOverloaded(f"{self.name} pool is full ({self._queued} queued)")
+
+        future = asyncio.get_running_loop().create_future()
+        # The caller's context (e.g. its trace span) goes with the job to the worker thread
+        job = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        self._queues.setdefault(session_id, deque()).append((job, future))
+        self._queued += 1
+        self._dispatch()
+        return await future
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": self._running,
+            "queued": self._queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self._running < self.max_concurrency and self._queues:
+            # Round-robin: take the head session, then move it to the back
+            session_id, jobs = next(iter(self._queues.items()))
+            fn, future = jobs.popleft()
+            if jobs:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self._queued -= 1
+
+            if future.cancelled():
+                continue
+            self._running += 1
+            job = loop.run_in_executor(self._executor, fn)
+            job.add_done_callback(lambda done, target=future: self._finish(done, target))
+
+    def _finish(self, done: asyncio.Future, target: asyncio.Future):
+        self._running -= 1
+        self.completed += 1
+        if not target.cancelled():
+            if done.exception() is not None:
+                target.set_exception(done.exception())
+            else:
+                target.set_result(done.result())
+        self._dispatch()
+
+
+async def run_blocking(pool: Optional[WorkerPool], session_id: str, fn: Callable, *args) -> Any:
+    """
+    Run blocking work on `pool` if given, else on the default thread pool.
+    """
+    if pool is None:
+        return await asyncio.to_thread(fn, *args)
+    return await pool.run(session_id, fn, *args)
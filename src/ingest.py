@@ -0,0 +1,67 @@
+"""
+Bulk corpus ingestion into the document index used by main.py.
+
+Streams txt/markdown/JSONL files (JSONL records: {"id": ..., "content" or "text": ...})
+from a directory, chunks them in worker processes and embeds the chunks in
+batches. Re-running only embeds new or changed chunks.
+
+Run from the project root
+py ./src/ingest.py data/corpus --workers 8
+"""
+import argparse
+import os
+from agent.retrieval.embedding_model import EmbeddingModel
+from agent.retrieval.bm25_index import BM25Index
+from agent.retrieval.document_index import DocumentIndex
+from agent.retrieval.ingestion import ingest_directory
+from agent.retrieval.ivf_index import IVFIndex
+
+
+DOCUMENT_INDEX_PATH = os.path.join("data", "document_index")
+ANN_MIN_DOCUMENTS = 100_000
+ANN_NPROBE = 8
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a corpus directory into the document index")
+    parser.add_argument("corpus", help="directory with .txt/.md/.jsonl files")
+    parser.add_argument("--index", default=DOCUMENT_INDEX_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--chunk-tokens", type=int, default=256)
+    parser.add_argument("--overlap-tokens", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=256, help="chunks per embedding call")
+    parser.add_argument("--keep-missing", action="store_true", help="keep indexed chunks no longer in the corpus")
+    args = parser.parse_args()
+
+    embedding_model = EmbeddingModel()
+    if DocumentIndex.exists(args.index):
+        index = DocumentIndex.load(args.index, embedding_model, backend_cls=IVFIndex, sparse_cls=BM25Index)
+    else:
+        index = DocumentIndex(embedding_model, sparse=BM25Index())
+
+    def progress(report):
+        print(f"\r[DEBUG] {report}", end="", flush=True)
+
+    report = ingest_directory(
+        args.corpus,
+        index,
+        chunk_tokens=args.chunk_tokens,
+        overlap_tokens=args.overlap_tokens,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        prune=not args.keep_missing,
+        progress=progress,
+    )
+    print()
+    print("[DEBUG] Ingested corpus:", report)
+
+    if index.sparse is None:
+        index.attach_sparse(BM25Index())
+    if index.backend is None and len(index) >= ANN_MIN_DOCUMENTS:
+        index.attach_backend(IVFIndex(nprobe=ANN_NPROBE))
+    index.save(args.index)
+    print(f"[DEBUG] Saved {len(index)} chunks to {args.index}")
+
+
+if __name__ == "__main__":
+    main()
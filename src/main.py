@@ -1,175 +1,345 @@
+import asyncio
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from agent.llm_client import LLMClient
 from agent.llm_wrapper import LLMWrapper
 from agent.planning import Planner
+from agent.response_cache import ResponseCache
+from agent.routing import IntentRouter
+from agent.startup import Lazy, Startup
+from agent.tool_runtime import ToolRuntime
+from agent.tool_use import ToolRegistry
+from agent.tracing import JsonlExporter, SlowTraceProfiler, format_trace, tracer
 from agent.memory import Memory
+from agent.memory_log import MemoryJournal
 from agent.reflection import Reflection
 from tools.simple_tool import SimpleCalculatorTool
 from agent.retrieval.embedding_model import EmbeddingModel
-from agent.retrieval.retrieval_helper import build_retrieval_context
+from agent.retrieval.bm25_index import BM25Index
+from agent.retrieval.document_index import DocumentIndex
+from agent.retrieval.ingestion import ingest_directory
+from agent.retrieval.ivf_index import IVFIndex
 from agent.context.controller import ContextController
 from agent.context.packet import ContextPacket
+from agent.pipeline import TurnPipeline
 from speech.audio_controller import AudioController
-from speech.mic_capture import record_until_enter
+from speech.audio_sources import MicrophoneSource
+from speech.duplex import DuplexListener
+from speech.streaming_stt import StreamingRecognizer
 from speech.stt import WhisperSTT
 from speech.tts import WindowsTTS
+from speech.streaming_tts import TTSWorker, speak_stream
+from speech.vad import EnergyVAD
 
 
-REFLECTION_INTERVAL = 4  # reflection generation period
+REFLECTION_INTERVAL = 4  # new messages folded into the running summary at a time
+REFLECTION_SEGMENT_FOLDS = 4  # folds per segment before it rolls up into the session summary
 CONTEXT_WINDOW_SIZE = 10  # how many messages to include in reflection
+CONTEXT_TOKEN_BUDGET = 3000  # prompt tokens for the response call (excl. completion)
 TOP_K_RETRIEVAL = 3
 RETRIEVAL_SCORE_THRESHOLD = 0.6
+HYBRID_RETRIEVAL = True  # BM25 matches covering most query terms are kept below the score threshold
+ROUTER_CONFIDENCE_THRESHOLD = 0.75  # below this, the LLM planner decides
+RESPONSE_CACHE_PATH = os.path.join("data", "response_cache.sqlite")
+SESSION_LOG_PATH = os.path.join("data", "sessions", "default")
+RESPONSE_CACHE_SIMILARITY = 0.95  # cosine similarity for a semantic cache hit
+DOCUMENT_INDEX_PATH = os.path.join("data", "document_index")
+CORPUS_DIR = os.path.join("data", "corpus")  # txt/markdown/JSONL; big corpora: py ./src/ingest.py
+ANN_MIN_DOCUMENTS = 100_000  # below this, exact search is fast enough
+ANN_NPROBE = 8  # IVF lists scanned per query (recall vs latency)
+TOOL_TIMEOUT = 5.0  # seconds per tool call
+TOOL_PROCESSES = 1  # worker processes for isolated tools (killed on timeout)
+LLM_CONCURRENCY = 8  # LLM requests in flight at once (planner, response, reflection)
+DUPLEX_AUDIO = True  # mic stays open while the agent responds; talking over it interrupts (barge-in)
+DUPLEX_IDLE_TIMEOUT = 30.0  # seconds of silence before hands-free audio returns to the mode prompt
+BARGE_IN_VAD_THRESHOLD = 0.03  # above the default, so the agent's own voice is less likely to interrupt it
+WARM_UP_AUDIO = True  # load STT and TTS in the background at startup (False: on the first audio turn)
+TRACING = True  # per-stage latency spans for every turn (see agent/tracing.py)
+TRACE_PATH = os.path.join("data", "traces.jsonl")  # one JSON span tree per turn
+PROMPT_LAYOUT = "prefix"  # static prompt first, volatile content last (upstream prefix caching); "priority": by priority
+PROFILE_SLOW_TURNS = None  # seconds; sample stacks of turns slower than this (None: off)
 
 
-load_dotenv()
-
-client = OpenAI(
-    base_url="https://router.huggingface.co/v1",
-    api_key=os.environ["HF_TOKEN"]
-)
-
-llm = LLMWrapper(
-    client=client,
-    model="moonshotai/Kimi-K2-Instruct-0905",
-    embedding_model="sentence-transformers/all-MiniLM-L6-v2",
-)
-
-planner = Planner(llm)
-memory = Memory()
-reflection = Reflection(llm, context_window_size=CONTEXT_WINDOW_SIZE)
-embedding_model = EmbeddingModel()
-tools = {"SimpleCalculatorTool": SimpleCalculatorTool()}
-
-context_controller = ContextController()
-
-# Temporary document store
-DOCUMENTS = [
-    {"id": "supervised", "content": "Supervised learning uses labeled data where each input has a known output."},
-    {"id": "unsupervised", "content": "Unsupervised learning finds patterns in unlabeled data."},
-    {"id": "reinforcement", "content": "Reinforcement learning trains agents using rewards and penalties."},
-]
-
-# Initialize speech
-audio = AudioController()
-stt = WhisperSTT(model_size="base")
-tts = WindowsTTS(rate=150)
-
-print("Agent is running. Press ENTER to talk, type 'exit' to quit.\n")
-
-# Agent loop
-
-while True:
-    # Input mode selection
-    mode = input("\nChoose input mode ([A]udio / [T]ext, type 'exit' to quit): ").strip().lower()
-    if mode in {"exit", "quit"}:
-        break
-
-    # Audio input
-    if mode in {"a", "audio"}:
-        print("Press ENTER to start talking...")
-        input()  # Wait for push-to-talk
-        audio.begin_listening()
-        audio_data = record_until_enter()
-        audio.end_listening()
-        user_input = stt.transcribe(audio_data)
-        print(f"User (transcribed): {user_input}")
-    # Text input
-    elif mode in {"t", "text"}:
-        user_input = input("User: ").strip()
-        if not user_input:
-            continue
-    else:
-        print("Invalid input mode. Please choose 'A' or 'T'.")
-        continue
-
-    # Record audio state in MCP
-    audio_packet = ContextPacket(
-        type="conversation",
-        content=[],
-        source="audio",
-        ttl=1,  # lasts 1 turn
-        priority=10,
-        metadata={"audio_state": audio.state}
+def main():
+    # Everything runs here, not at import: isolated tools run in worker
+    # processes, which import this module again on Windows (spawn)
+    startup = Startup()
+    load_dotenv()
+    HF_TOKEN = os.environ["HF_TOKEN"]
+
+    trace_exporter = None
+    if TRACING:
+        tracer.enabled = True
+        trace_exporter = JsonlExporter(TRACE_PATH)
+        tracer.exporters.append(trace_exporter)
+        if PROFILE_SLOW_TURNS is not None:
+            tracer.profiler = SlowTraceProfiler(threshold=PROFILE_SLOW_TURNS)
+
+    def create_client():
+        # Pooled async client: concurrency limit, per-kind timeouts, retries, planner hedging
+        return LLMClient(
+            base_url="https://router.huggingface.co/v1",
+            api_key=HF_TOKEN,
+            max_concurrency=LLM_CONCURRENCY,
+        )
+
+    # Heavy models load on first use; warm-up threads load them in parallel
+    # while the prompt is already up
+    client = Lazy(create_client)
+    embedding_model = EmbeddingModel()
+    startup.warm_up("llm_client", client.get)
+    startup.warm_up("embeddings", embedding_model.warm_up)
+    response_cache = ResponseCache(
+        embedding_model=embedding_model,
+        similarity_threshold=RESPONSE_CACHE_SIMILARITY,
+        path=RESPONSE_CACHE_PATH,
     )
-    context_controller.add(audio_packet)
 
-    # Planning
-    plan = planner.plan(
-        user_input=user_input,
-        memory=memory.get_llm_messages(roles=["user", "assistant"])
+    llm = LLMWrapper(
+        client=client,
+        model="moonshotai/Kimi-K2-Instruct-0905",
+        embedding_model="sentence-transformers/all-MiniLM-L6-v2",
+        response_cache=response_cache,
     )
-    # Tool Execution
-    if plan["action"] == "tool" and plan["tool_name"] in tools:
-        tool = tools[plan["tool_name"]]
-        tool_result = tool.run(**plan["arguments"])
-
-        memory.add(role="user", content=user_input)
-        # Store as assistant message (NOT role=tool)
-        memory.add(
-            role="assistant",
-            content=f"Tool {plan['tool_name']} result: {tool_result}"
-        )
 
-        print(f"Agent (tool result): {tool_result}")
-        continue
-    
-    # RAG Retrieval
-    retrieval_context = build_retrieval_context(
-        query=user_input,
-        documents=DOCUMENTS,
+    # Tools declare their argument schemas; the planner prompt is generated from the registry
+    tools = ToolRegistry()
+    tools.register(SimpleCalculatorTool())
+    router = IntentRouter(embedding_model, confidence_threshold=ROUTER_CONFIDENCE_THRESHOLD)
+    planner = Planner(llm, router=router, registry=tools)
+    memory = Memory()
+    reflection = Reflection(llm, context_window_size=CONTEXT_WINDOW_SIZE)
+    tool_runtime = ToolRuntime(default_timeout=TOOL_TIMEOUT, processes=TOOL_PROCESSES)
+
+    context_controller = ContextController(token_budget=CONTEXT_TOKEN_BUDGET, layout=PROMPT_LAYOUT)
+
+    # Restore the previous conversation, then log every change to disk
+    journal = MemoryJournal(SESSION_LOG_PATH, memory, context_controller)
+    with startup.measure("session"):
+        print("[DEBUG] Session resumed:", journal.resume())
+
+    # Fallback document store when there is no corpus directory
+    DOCUMENTS = [
+        {"id": "supervised", "content": "Supervised learning uses labeled data where each input has a known output."},
+        {"id": "unsupervised", "content": "Unsupervised learning finds patterns in unlabeled data."},
+        {"id": "reinforcement", "content": "Reinforcement learning trains agents using rewards and penalties."},
+    ]
+
+    # Embed documents once; later runs only re-embed added or changed documents
+    with startup.measure("document_index"):
+        if DocumentIndex.exists(DOCUMENT_INDEX_PATH):
+            document_index = DocumentIndex.load(
+                DOCUMENT_INDEX_PATH, embedding_model, backend_cls=IVFIndex, sparse_cls=BM25Index
+            )
+        else:
+            document_index = DocumentIndex(embedding_model)
+        if os.path.isdir(CORPUS_DIR):
+            # Parsed in-process; big corpora: py ./src/ingest.py
+            report = ingest_directory(CORPUS_DIR, document_index, workers=0, prune=True)
+            print("[DEBUG] Ingested corpus:", report)
+            index_stats = report.as_dict()
+            index_changed = report.embedded or report.removed
+        else:
+            index_stats = document_index.sync(DOCUMENTS)
+            index_changed = index_stats["added"] or index_stats["updated"] or index_stats["removed"]
+        # BM25 next to the embeddings catches exact identifiers, error codes and names
+        if document_index.sparse is None:
+            document_index.attach_sparse(BM25Index())
+            index_changed = True
+        # On big corpora, lexically anchored queries only score embeddings of BM25 candidates
+        document_index.prefilter = len(document_index) >= ANN_MIN_DOCUMENTS
+        if document_index.backend is None and len(document_index) >= ANN_MIN_DOCUMENTS:
+            document_index.attach_backend(IVFIndex(nprobe=ANN_NPROBE))
+            index_changed = True
+        if index_changed:
+            document_index.save(DOCUMENT_INDEX_PATH)
+    print("[DEBUG] Document index:", index_stats)
+
+    # Initialize speech
+    audio = AudioController(duplex=DUPLEX_AUDIO)
+    stt = WhisperSTT(model_size="base")
+    # Transcribes while the user speaks; VAD detects the end of the utterance
+    recognizer = StreamingRecognizer(stt)
+    # TTS runs on its own thread so sentences play while tokens are still streaming
+    tts_worker = Lazy(lambda: TTSWorker(lambda: WindowsTTS(rate=150)))
+    if WARM_UP_AUDIO:
+        startup.warm_up("stt", stt.warm_up)
+        startup.warm_up("tts", tts_worker.get)
+
+    def stop_playback():
+        if tts_worker.loaded:
+            tts_worker.cancel()
+        print("\n[DEBUG] Barge-in: playback stopped, response cancelled")
+
+    # Full duplex: listens (with 30 ms blocks) while the agent thinks and speaks
+    listener = DuplexListener(
+        StreamingRecognizer(stt, vad=EnergyVAD(threshold=BARGE_IN_VAD_THRESHOLD)),
+        lambda: MicrophoneSource(block_size=480),
+        audio=audio,
+        on_barge_in=stop_playback,
+        on_partial=lambda hypothesis: print(f"\r... {hypothesis.text}", end="", flush=True),
+    )
+
+    pipeline = TurnPipeline(
+        llm=llm,
+        planner=planner,
+        memory=memory,
+        reflection=reflection,
+        tools=tools,
         embedding_model=embedding_model,
+        documents=DOCUMENTS,
+        document_index=document_index,
         top_k=TOP_K_RETRIEVAL,
         score_threshold=RETRIEVAL_SCORE_THRESHOLD,
+        hybrid_retrieval=HYBRID_RETRIEVAL,
+        context_window_size=CONTEXT_WINDOW_SIZE,
+        reflection_interval=REFLECTION_INTERVAL,
+        reflection_segment_folds=REFLECTION_SEGMENT_FOLDS,
+        context_controller=context_controller,
+        tool_runtime=tool_runtime,
     )
-    print("[DEBUG] Retrieval context:\n", retrieval_context)
 
-    # LLM Response
-    llm_messages = []
+    def speak_response(llm_messages):
+        """
+        Stream the LLM response, speaking each sentence as soon as it is complete.
+        """
+        # Record audio state before speaking
+        audio_packet = ContextPacket(
+            type="audio_state",
+            content=[],
+            source="audio",
+            ttl=1,
+            priority=10,
+            metadata={"audio_state": audio.state}  # should be SPEAKING
+        )
+        context_controller.add(audio_packet)
 
-    if retrieval_context:
-        llm_messages.append({"role": "system", "content": retrieval_context})
+        # Set on barge-in (duplex audio only)
+        cancel = listener.response_cancel
+        if cancel is not None and cancel.is_set():
+            return ""  # interrupted before the response started: no request
 
-    llm_messages.extend(
-        memory.get_llm_messages(
-            roles=["user", "assistant"],
-            last_n=CONTEXT_WINDOW_SIZE
+        print("Agent: ", end="", flush=True)
+        llm_response = speak_stream(
+            llm.generate_stream(llm_messages, use_cache=True, cancel=cancel),
+            tts_worker,
+            audio=audio,
+            on_token=lambda token: print(token, end="", flush=True),
+            cancel=cancel,
         )
-    )
+        print()
+        return llm_response
 
-    llm_messages.append({"role": "user", "content": user_input})
+    async def run_agent_turn(user_input: str):
+        # Record audio state (and state changes since the last turn, e.g. a barge-in) in MCP
+        audio_packet = ContextPacket(
+            type="audio_state",
+            content=[],
+            source="audio",
+            ttl=1,  # lasts 1 turn
+            priority=10,
+            metadata={"audio_state": audio.state, "transitions": audio.take_transitions()}
+        )
+        context_controller.add(audio_packet)
 
-    llm_response = llm.generate(llm_messages)
-    memory.add(role="user", content=user_input)
-    memory.add(role="assistant", content=llm_response)
+        # Planning + speculative retrieval, then tool execution or streamed response
+        cancel = listener.begin_response() if listener.running else None
+        try:
+            result = await pipeline.run_turn(user_input, respond=speak_response, cancel=cancel)
+        finally:
+            listener.end_response()
+        print(f"[DEBUG] Plan routed by {result['plan']['router']}; totals: {planner.route_counts}")
+        if tracer.last_trace is not None and tracer.last_trace["name"] == "turn":
+            print("[DEBUG] Trace:", format_trace(tracer.last_trace, min_ms=1.0))
+
+        # Step MCP packets
+        context_controller.step()
+        print("[MCP] Active packets:", context_controller.dump())
+
+        if result["action"] == "tool":
+            print(f"Agent (tool result): {result['response']}")
+            print("[DEBUG] Tool latency:", tool_runtime.stats())
+            return
+
+        print("[DEBUG] Retrieval context:\n", result["retrieval_context"])
+        print("[DEBUG] Prompt:", context_controller.last_build)
+        print("[DEBUG] Prompt prefix reuse:", llm.prefix_stats())
+        print("[DEBUG] Response cache:", response_cache.stats())
+
+    async def duplex_conversation():
+        """
+        Hands-free audio turns. The mic stays open while the agent responds:
+        talking over the agent stops playback and the LLM request, and the
+        interrupting utterance becomes the next turn.
+        """
+        print("Listening... (talk any time, even over the agent; stay silent to stop)")
+        listener.start()
+        try:
+            while True:
+                user_input = await asyncio.to_thread(listener.next_utterance, DUPLEX_IDLE_TIMEOUT)
+                if not user_input:
+                    break
+                print(f"\nUser (transcribed): {user_input}")
+                await run_agent_turn(user_input)
+        finally:
+            await asyncio.to_thread(listener.stop)
+
+    async def agent_loop():
+        print(f"[DEBUG] Ready in {startup.ready():.2f}s:", startup.report())
+        print("Agent is running. Choose audio to talk, type 'exit' to quit.\n")
+
+        while True:
+            # Input mode selection
+            mode = (await asyncio.to_thread(
+                input, "\nChoose input mode ([A]udio / [T]ext, type 'exit' to quit): "
+            )).strip().lower()
+            if mode in {"exit", "quit"}:
+                break
+
+            # Audio input
+            if mode in {"a", "audio"} and DUPLEX_AUDIO:
+                await duplex_conversation()
+                continue
+            if mode in {"a", "audio"}:
+                print("Listening... (stop talking to finish)")
+                audio.begin_listening()
+                user_input = await asyncio.to_thread(
+                    recognizer.transcribe_utterance,
+                    MicrophoneSource(),
+                    lambda hypothesis: print(f"\r... {hypothesis.text}", end="", flush=True),
+                )
+                audio.end_listening()
+                print(f"\nUser (transcribed): {user_input}")
+                if not user_input:
+                    continue
+            # Text input
+            elif mode in {"t", "text"}:
+                user_input = (await asyncio.to_thread(input, "User: ")).strip()
+                if not user_input:
+                    continue
+            else:
+                print("Invalid input mode. Please choose 'A' or 'T'.")
+                continue
+
+            await run_agent_turn(user_input)
+
+        # Let background reflection and memory writes finish
+        await pipeline.drain()
+        if tracer.enabled:
+            print("[DEBUG] Latency summary:", tracer.summary())
+
+    asyncio.run(agent_loop())
+    pipeline.close()
+    tool_runtime.close()
+    journal.close()
+    response_cache.close()
+    if client.loaded:
+        client.close()
+    if trace_exporter is not None:
+        trace_exporter.close()
+    if tts_worker.loaded:
+        tts_worker.close()
 
-    # Record audio state before speaking
-    audio_packet = ContextPacket(
-        type="conversation",
-        content=[],
-        source="audio",
-        ttl=1,
-        priority=10,
-        metadata={"audio_state": audio.state}  # should be SPEAKING
-    )
-    context_controller.add(audio_packet)
-
-    # Speech Output (TTS)
-    audio.begin_speaking()
-    tts.speak(llm_response)
-    audio.end_speaking()
-
-    # Reflection Generation
-    if len(memory.get()) % REFLECTION_INTERVAL == 0:
-        summary = reflection.reflect(
-            memory.get_llm_messages(
-                roles=["user", "assistant"],
-                last_n=CONTEXT_WINDOW_SIZE
-            )
-        )
-        memory.add(role="reflection", content=summary)
-        print(f"[DEBUG] Reflection Summary:\n{summary}\n")
 
-    # Step MCP packets
-    context_controller.step()
-    print("[MCP] Active packets:", context_controller.dump())
\ No newline at end of file
+if __name__ == "__main__":
+    main()
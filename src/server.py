@@ -0,0 +1,408 @@
+"""
+Multi-session agent server.
+
+One process hosts many conversations: models (embeddings, STT) are loaded
+once and STT/embedding/LLM/tool calls go through shared, bounded worker pools.
+Each session gets its own Memory, ContextController and TurnPipeline.
+
+Run from the project root
+py ./src/server.py --port 8080
+
+HTTP API (JSON):
+  POST   /sessions/<id>/turn   {"text": "..."} or {"audio": "<base64 float32 PCM, 16 kHz mono>"}
+  DELETE /sessions/<id>
+  GET    /stats
+  GET    /metrics              Prometheus text format (span latency histograms, counters)
+  GET    /health
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple, Union
+import numpy as np
+from dotenv import load_dotenv
+from agent.llm_client import LLMClient, RequestPolicy
+from agent.llm_wrapper import LLMWrapper
+from agent.planning import Planner
+from agent.routing import IntentRouter
+from agent.memory import Memory
+from agent.reflection import Reflection
+from agent.retrieval.embedding_model import EmbeddingModel
+from agent.retrieval.bm25_index import BM25Index
+from agent.retrieval.document_index import DocumentIndex
+from agent.context.controller import PROMPT_LAYOUTS, ContextController
+from agent.memory_log import MemoryJournal
+from agent.pipeline import TurnPipeline
+from agent.session import Session, SessionManager
+from agent.startup import Startup
+from agent.tool_runtime import ToolRuntime
+from agent.tool_use import ToolRegistry
+from agent.tracing import JsonlExporter, SlowTraceProfiler, tracer
+from agent.worker_pool import PoolOverloaded, WorkerPool, run_blocking
+from tools.simple_tool import SimpleCalculatorTool
+
+
+REFLECTION_INTERVAL = 4
+CONTEXT_WINDOW_SIZE = 10
+CONTEXT_TOKEN_BUDGET = 3000
+TOP_K_RETRIEVAL = 3
+RETRIEVAL_SCORE_THRESHOLD = 0.6
+HYBRID_RETRIEVAL = True  # BM25 matches covering most query terms are kept below the score threshold
+ROUTER_CONFIDENCE_THRESHOLD = 0.75
+TOOL_TIMEOUT = 5.0  # seconds per tool call
+TOOL_PROCESSES = 2  # worker processes for isolated tools (killed on timeout)
+IDLE_SWEEP_INTERVAL = 60  # seconds between idle-session sweeps
+MAX_BODY_BYTES = 8 * 1024 * 1024  # ~98 s of base64 float32 audio at 16 kHz
+SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")  # also used as a file name
+
+DOCUMENTS = [
+    {"id": "supervised", "content": "Supervised learning uses labeled data where each input has a known output."},
+    {"id": "unsupervised", "content": "Unsupervised learning finds patterns in unlabeled data."},
+    {"id": "reinforcement", "content": "Reinforcement learning trains agents using rewards and penalties."},
+]
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class BadRequest(Exception):
+    """
+    A request that cannot be parsed; answered with `status`, then the connection is closed.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AgentServer:
+    """
+    Shares loaded models across sessions and serves turns over HTTP/1.1.
+    """
+
+    def __init__(self, args):
+        self.startup = Startup()
+        self.trace_exporter = None
+        if args.tracing:
+            tracer.enabled = True
+            if args.trace_file:
+                self.trace_exporter = JsonlExporter(args.trace_file)
+                tracer.exporters.append(self.trace_exporter)
+            if args.profile_slow_turns is not None:
+                tracer.profiler = SlowTraceProfiler(threshold=args.profile_slow_turns)
+        load_dotenv()
+        # One pooled client for every session: bounded in-flight requests, retries, planner hedging
+        self.llm_client = LLMClient(
+            base_url=args.base_url,
+            api_key=os.environ["HF_TOKEN"],
+            max_concurrency=args.llm_concurrency,
+            policies={
+                "planner": RequestPolicy(timeout=args.planner_timeout, retries=2, hedge=not args.no_hedging),
+                "response": RequestPolicy(timeout=args.response_timeout, retries=1),
+                "reflection": RequestPolicy(timeout=args.reflection_timeout, retries=3),
+            },
+        )
+        self.llm = LLMWrapper(
+            client=self.llm_client,
+            model=args.model,
+            embedding_model="sentence-transformers/all-MiniLM-L6-v2",
+        )
+
+        # Loaded once, shared by every session
+        self.embedding_model = EmbeddingModel(micro_batching=True)
+        self.router = IntentRouter(self.embedding_model, confidence_threshold=ROUTER_CONFIDENCE_THRESHOLD)
+        self.tools = ToolRegistry()
+        self.tools.register(SimpleCalculatorTool())
+        self.planner = Planner(self.llm, router=self.router, registry=self.tools)
+        self.reflection = Reflection(self.llm, context_window_size=CONTEXT_WINDOW_SIZE)
+        self.stt = None
+        if args.enable_stt:
+            from speech.stt import WhisperSTT
+            self.stt = WhisperSTT(model_size="base")
+            # Loads while the embedding model and documents are set up below
+            self.startup.warm_up("stt", self.stt.warm_up)
+
+        with self.startup.measure("embeddings"):
+            self.embedding_model.warm_up()
+        with self.startup.measure("documents"):
+            self.document_index = DocumentIndex(self.embedding_model, sparse=BM25Index())
+            self.document_index.sync(DOCUMENTS)
+
+        self.pools: Dict[str, WorkerPool] = {
+            "llm": WorkerPool("llm", args.llm_concurrency, max_queue=args.max_queue),
+            "embedding": WorkerPool("embedding", args.embedding_concurrency, max_queue=args.max_queue),
+            "tool": WorkerPool("tool", 4, max_queue=args.max_queue),
+            "stt": WorkerPool("stt", 1, max_queue=args.max_queue),
+        }
+        # Shared, so per-tool latency covers every session
+        self.tool_runtime = ToolRuntime(
+            default_timeout=TOOL_TIMEOUT, pool=self.pools["tool"], processes=TOOL_PROCESSES
+        )
+        self.memory_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="memory")
+        self.session_dir = args.session_dir
+        self.prompt_layout = args.prompt_layout
+        self.sessions = SessionManager(
+            self._create_session,
+            max_sessions=args.max_sessions,
+            idle_timeout=args.idle_timeout,
+        )
+
+    def _create_session(self, session_id: str) -> Session:
+        memory = Memory()
+        context_controller = ContextController(token_budget=CONTEXT_TOKEN_BUDGET, layout=self.prompt_layout)
+        journal = None
+        if self.session_dir:
+            # Picks up where a previous run (or an evicted session) left off
+            journal = MemoryJournal(os.path.join(self.session_dir, session_id), memory, context_controller)
+            journal.resume()
+        pipeline = TurnPipeline(
+            llm=self.llm,
+            planner=self.planner,
+            memory=memory,
+            reflection=self.reflection,
+            tools=self.tools,
+            embedding_model=self.embedding_model,
+            document_index=self.document_index,
+            top_k=TOP_K_RETRIEVAL,
+            score_threshold=RETRIEVAL_SCORE_THRESHOLD,
+            hybrid_retrieval=HYBRID_RETRIEVAL,
+            context_window_size=CONTEXT_WINDOW_SIZE,
+            reflection_interval=REFLECTION_INTERVAL,
+            session_id=session_id,
+            pools=self.pools,
+            memory_executor=self.memory_executor,
+            context_controller=context_controller,
+            tool_runtime=self.tool_runtime,
+        )
+        return Session(
+            id=session_id,
+            memory=memory,
+            context_controller=context_controller,
+            pipeline=pipeline,
+            journal=journal,
+        )
+
+    async def handle_turn(self, session_id: str, body: Dict) -> Tuple[int, Dict]:
+        session = await self.sessions.get(session_id)
+        async with session.lock:
+            user_input = body.get("text", "")
+            if "audio" in body:
+                if self.stt is None:
+                    return 400, {"error": "Audio input is disabled (start with --enable-stt)"}
+                audio = np.frombuffer(base64.b64decode(body["audio"]), dtype=np.float32)
+                user_input = await run_blocking(self.pools["stt"], session_id, self.stt.transcribe, audio)
+
+            user_input = user_input.strip()
+            if not user_input:
+                return 400, {"error": "Empty input"}
+
+            result = await session.pipeline.run_turn(user_input)
+            session.context_controller.step()
+            session.turns += 1
+
+        return 200, {
+            "session": session_id,
+            "input": user_input,
+            "action": result["action"],
+            "response": result["response"],
+            "router": result["plan"].get("router"),
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self.sessions),
+            "pools": {name: pool.stats() for name, pool in self.pools.items()},
+            "planner": self.planner.route_counts,
+            "llm": self.llm_client.stats(),
+            "prompt_prefix": self.llm.prefix_stats(),
+            "tools": self.tool_runtime.stats(),
+            "embedding": self.embedding_model.stats(),
+            "startup": self.startup.report(),
+            "latency": tracer.summary(),
+        }
+
+    async def route(self, method: str, path: str, body: Optional[Dict]) -> Tuple[int, Union[Dict, str]]:
+        parts = [p for p in path.split("/") if p]
+        if parts == ["health"]:
+            return 200, {"status": "ok"}
+        if parts == ["stats"]:
+            return 200, self.stats()
+        if parts == ["metrics"]:
+            return 200, tracer.prometheus()
+        if len(parts) >= 2 and parts[0] == "sessions" and not SESSION_ID.match(parts[1]):
+            return 400, {"error": "Session ids are 1-64 characters of [A-Za-z0-9_-]"}
+        if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "turn":
+            if method != "POST":
+                return 405, {"error": "Use POST"}
+            return await self.handle_turn(parts[1], body or {})
+        if len(parts) == 2 and parts[0] == "sessions":
+            if method != "DELETE":
+                return 405, {"error": "Use DELETE"}
+            closed = await self.sessions.close(parts[1])
+            return (200, {"closed": parts[1]}) if closed else (404, {"error": "No such session"})
+        return 404, {"error": f"No route for {path}"}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except BadRequest as e:
+                    # The rest of the stream cannot be trusted: answer and hang up
+                    write_response(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, raw_body = request
+
+                try:
+                    body = json.loads(raw_body) if raw_body else None
+                    status, payload = await self.route(method, path, body)
+                except json.JSONDecodeError:
+                    status, payload = 400, {"error": "Body must be JSON"}
+                except PoolOverloaded as e:
+                    # Backpressure: tell the client to retry rather than queue unboundedly
+                    status, payload = 503, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def sweep_idle_sessions(self):
+        while True:
+            await asyncio.sleep(IDLE_SWEEP_INTERVAL)
+            evicted = await self.sessions.evict_idle()
+            if evicted:
+                print(f"[DEBUG] Evicted idle sessions: {evicted}")
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        sweeper = asyncio.ensure_future(self.sweep_idle_sessions())
+        print(f"Agent server listening on http://{host}:{port} (ready in {self.startup.ready():.2f}s)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+            await self.sessions.close_all()
+            for pool in self.pools.values():
+                pool.shutdown()
+            self.memory_executor.shutdown(wait=True)
+            self.tool_runtime.close()
+            self.embedding_model.close()
+            self.llm_client.close()
+            if self.trace_exporter is not None:
+                self.trace_exporter.close()
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """
+    Parse one HTTP/1.1 request. Returns None when the client closed the connection.
+    Raises BadRequest for a malformed request line or Content-Length (400),
+    a body over MAX_BODY_BYTES (413) or a head over the reader's limit (431).
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+    except asyncio.LimitOverrunError:
+        raise BadRequest(431, "Request head too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ", 2)
+    if len(parts) != 3 or not parts[1].startswith("/"):
+        raise BadRequest(400, "Malformed request line")
+    method, path, _ = parts
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise BadRequest(400, "Invalid Content-Length")
+    if length < 0:
+        raise BadRequest(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise BadRequest(413, f"Body over {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path.split("?", 1)[0], headers, body
+
+
+def write_response(writer: asyncio.StreamWriter, status: int, payload: Union[Dict, str], keep_alive: bool):
+    """
+    A dict is sent as JSON, a str as plain text (/metrics).
+    """
+    if isinstance(payload, str):
+        body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+    head = (
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+    )
+    if status == 503:
+        head += "Retry-After: 1\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n" + body)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Multi-session agent server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--base-url", default="https://router.huggingface.co/v1")
+    parser.add_argument("--model", default="moonshotai/Kimi-K2-Instruct-0905")
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--idle-timeout", type=float, default=30 * 60)
+    parser.add_argument("--llm-concurrency", type=int, default=32)
+    parser.add_argument("--planner-timeout", type=float, default=10.0, help="seconds per planner attempt")
+    parser.add_argument("--response-timeout", type=float, default=30.0, help="seconds to the first response token")
+    parser.add_argument("--reflection-timeout", type=float, default=60.0)
+    parser.add_argument("--no-hedging", action="store_true", help="never send a second planner request")
+    parser.add_argument(
+        "--prompt-layout", choices=PROMPT_LAYOUTS, default="prefix",
+        help="prefix: static prompt first, volatile content last (upstream prefix caching)",
+    )
+    parser.add_argument("--embedding-concurrency", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=2048)
+    parser.add_argument("--enable-stt", action="store_true")
+    parser.add_argument("--session-dir", default=None, help="persist session memory here (e.g. data/sessions)")
+    parser.add_argument("--no-tracing", dest="tracing", action="store_false", help="disable per-stage latency spans")
+    parser.add_argument("--trace-file", default=None, help="append one JSON span tree per turn (e.g. data/traces.jsonl)")
+    parser.add_argument(
+        "--profile-slow-turns", type=float, default=None, metavar="SECONDS",
+        help="sample stacks of turns slower than this and attach them to the trace",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(AgentServer(args).serve(args.host, args.port))
@@ -1,30 +1,93 @@
+import threading
+import time
+from typing import Dict, List
+
+
 class AudioController:
-    def __init__(self):
+    """
+    Tracks whether the agent is listening and/or speaking.
+
+    Half-duplex by default: listening and speaking exclude each other.
+    With `duplex` the microphone may stay open while the agent speaks
+    (state "DUPLEX"), and `interrupt` records a barge-in: the user talked
+    over the agent and playback was stopped.
+
+    Every state change is logged; `take_transitions` hands the log to the
+    turn's MCP audio packet.
+    """
+
+    def __init__(self, duplex: bool = False):
+        self.duplex = duplex
         self.state = "IDLE"
+        self._listening = False
+        self._speaking = False
+        self._transitions: List[Dict] = []
+        self._lock = threading.Lock()
 
     def begin_listening(self):
-        if self.state != "IDLE":
-            raise RuntimeError("Cannot listen while speaking")
-        self.state = "LISTENING"
+        with self._lock:
+            if self._speaking and not self.duplex:
+                raise RuntimeError("Cannot listen while speaking")
+            if self._listening:
+                raise RuntimeError("Already listening")
+            self._listening = True
+            self._changed("begin_listening")
         print("Mic ON")
 
     def end_listening(self):
-        if self.state != "LISTENING":
-            return
-        self.state = "IDLE"
+        with self._lock:
+            if not self._listening:
+                return
+            self._listening = False
+            self._changed("end_listening")
         print("Mic OFF")
 
     def begin_speaking(self):
-        if self.state != "IDLE":
-            raise RuntimeError("Cannot speak while listening")
-        self.state = "SPEAKING"
+        with self._lock:
+            if self._listening and not self.duplex:
+                raise RuntimeError("Cannot speak while listening")
+            if self._speaking:
+                raise RuntimeError("Already speaking")
+            self._speaking = True
+            self._changed("begin_speaking")
         print("Speaker ON")
 
     def end_speaking(self):
-        if self.state != "SPEAKING":
-            return
-        self.state = "IDLE"
+        with self._lock:
+            if not self._speaking:
+                return
+            self._speaking = False
+            self._changed("end_speaking")
         print("Speaker OFF")
 
+    def interrupt(self):
+        """
+        Record a barge-in; playback (if any) is over.
+        """
+        with self._lock:
+            self._speaking = False
+            self._changed("interrupt")
+        print("Speaker OFF (interrupted)")
+
     def can_listen(self):
-        return self.state == "LISTENING"
+        return self._listening
+
+    def take_transitions(self) -> List[Dict]:
+        """
+        State changes since the last call, oldest first.
+        """
+        with self._lock:
+            transitions, self._transitions = self._transitions, []
+        return transitions
+
+    def _changed(self, event: str):
+        previous = self.state
+        if self._listening and self._speaking:
+            self.state = "DUPLEX"
+        elif self._listening:
+            self.state = "LISTENING"
+        elif self._speaking:
+            self.state = "SPEAKING"
+        else:
+            self.state = "IDLE"
+        self._transitions.append({"event": event, "from": previous, "to": self.state, "at": round(time.time(), 3)})
@@ -0,0 +1,93 @@
+import threading
+import wave
+from typing import Iterator
+import numpy as np
+from speech.ring_buffer import AudioRingBuffer
+
+
+class ArraySource:
+    """
+    Replays an in-memory signal as fixed-size float32 blocks.
+    """
+
+    def __init__(self, audio: np.ndarray, sample_rate: int = 16000, block_size: int = 1600):
+        audio = np.asarray(audio, dtype=np.float32)
+        self.audio = audio.reshape(-1) if audio.ndim == 1 or audio.shape[1] == 1 else audio.mean(axis=1)
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for start in range(0, self.audio.shape[0], self.block_size):
+            yield self.audio[start : start + self.block_size]
+
+
+class WavFileSource(ArraySource):
+    """
+    Reads a PCM WAV file, downmixes to mono and resamples to `sample_rate`.
+    """
+
+    def __init__(self, path: str, sample_rate: int = 16000, block_size: int = 1600):
+        with wave.open(path, "rb") as wav:
+            channels = wav.getnchannels()
+            width = wav.getsampwidth()
+            file_rate = wav.getframerate()
+            raw = wav.readframes(wav.getnframes())
+
+        if width == 2:
+            audio = np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+        elif width == 4:
+            audio = np.frombuffer(raw, dtype=np.int32).astype(np.float32) / 2147483648.0
+        elif width == 1:
+            audio = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        else:
+            raise ValueError(f"Unsupported sample width: {width} bytes")
+
+        audio = audio.reshape(-1, channels).mean(axis=1)
+        if file_rate != sample_rate:
+            duration = audio.shape[0] / file_rate
+            target = np.arange(int(duration * sample_rate)) / sample_rate
+            audio = np.interp(target, np.arange(audio.shape[0]) / file_rate, audio).astype(np.float32)
+
+        super().__init__(audio, sample_rate=sample_rate, block_size=block_size)
+
+
+class MicrophoneSource:
+    """
+    Live microphone capture into a preallocated ring buffer, until `stop()` is called.
+    The audio callback copies each block into the ring (no per-block allocation)
+    and iteration yields contiguous views of newly captured audio.
+    Consumers that understand `ring` (StreamingRecognizer) read it directly.
+    """
+
+    def __init__(self, sample_rate: int = 16000, block_size: int = 1600, capacity_s: float = 30.0):
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.ring = AudioRingBuffer(int(capacity_s * sample_rate))
+        self._data_ready = threading.Event()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        import sounddevice as sd
+
+        def callback(indata, frames_count, time, status):
+            self.ring.write(indata)
+            self._data_ready.set()
+
+        self._stopped.clear()
+        with sd.InputStream(
+            samplerate=self.sample_rate,
+            channels=1,
+            blocksize=self.block_size,
+            dtype="float32",
+            callback=callback,
+        ):
+            while not self._stopped.is_set():
+                if not self._data_ready.wait(timeout=0.1):
+                    continue
+                self._data_ready.clear()
+                block = self.ring.read()
+                if block.shape[0]:
+                    yield block.reshape(-1)
@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Optional
+import numpy as np
+from agent.tracing import tracer
+from speech.streaming_stt import Hypothesis, StreamingRecognizer
+
+
+class DuplexListener:
+    """
+    Keeps the microphone open while the agent thinks and speaks (full duplex).
+
+    A background thread runs a StreamingRecognizer over a source from
+    `source_factory` (e.g. a MicrophoneSource with short blocks). Final
+    utterances are queued for `next_utterance`. When the VAD detects speech
+    while a response is in progress (between `begin_response` and
+    `end_response`), that is a barge-in: the response's cancel event is set,
+    `on_barge_in` is called (e.g. TTSWorker.cancel) and the AudioController
+    records the interruption - all before the utterance is transcribed.
+
+    Without echo cancellation the agent's own voice can trigger the VAD:
+    use headphones or a VAD with a higher threshold.
+    """
+
+    def __init__(
+        self,
+        recognizer: StreamingRecognizer,
+        source_factory: Callable[[], Iterable[np.ndarray]],
+        audio=None,
+        on_barge_in: Optional[Callable[[], None]] = None,
+        on_partial: Optional[Callable[[Hypothesis], None]] = None,
+    ):
+        self.recognizer = recognizer
+        self.source_factory = source_factory
+        self.audio = audio  # optional AudioController
+        self.on_barge_in = on_barge_in
+        self.on_partial = on_partial
+        self.barge_ins = 0
+        self.last_barge_in: Optional[float] = None  # perf_counter() of the last detection
+        self._utterances: "queue.Queue" = queue.Queue()
+        self._response: Optional[threading.Event] = None
+        self._lock = threading.Lock()
+        self._source = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._source = self.source_factory()
+        self._utterances = queue.Queue()
+        if self.audio is not None:
+            self.audio.begin_listening()
+        self._thread = threading.Thread(target=self._run, name="duplex-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Close the source and wait for the listener thread.
+        """
+        if self._thread is None:
+            return
+        stop = getattr(self._source, "stop", None)
+        if stop is not None:
+            stop()
+        self._thread.join()
+        self._thread = None
+        if self.audio is not None:
+            self.audio.end_listening()
+
+    def begin_response(self) -> threading.Event:
+        """
+        Mark a response as in progress; returns the event set on barge-in.
+        """
+        with self._lock:
+            self._response = threading.Event()
+            return self._response
+
+    def end_response(self):
+        with self._lock:
+            self._response = None
+
+    @property
+    def response_cancel(self) -> Optional[threading.Event]:
+        """
+        Cancel event of the response in progress, if any.
+        """
+        return self._response
+
+    def next_utterance(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Block until the user finishes an utterance; None on timeout or when
+        the listener stopped.
+        """
+        try:
+            return self._utterances.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _speech_started(self):
+        with self._lock:
+            response = self._response
+            if response is None or response.is_set():
+                return
+            response.set()
+        self.barge_ins += 1
+        self.last_barge_in = time.perf_counter()
+        tracer.count("barge_ins")
+        if self.on_barge_in is not None:
+            self.on_barge_in()
+        if self.audio is not None:
+            self.audio.interrupt()
+
+    def _run(self):
+        try:
+            for hypothesis in self.recognizer.stream(self._source, on_speech_start=self._speech_started):
+                if hypothesis.is_final:
+                    if hypothesis.text:
+                        self._utterances.put(hypothesis.text)
+                elif self.on_partial is not None:
+                    self.on_partial(hypothesis)
+        except Exception as e:
+            print(f"[STT] Listener failed: {e}")
+        finally:
+            self._utterances.put(None)
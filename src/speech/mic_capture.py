@@ -1,23 +1,32 @@
 import sounddevice as sd
-import numpy as np
+from .ring_buffer import AudioRingBuffer  # relative: tests import this as src.speech.mic_capture
 
 def record_until_enter(
     samplerate: int = 16000,
     channels: int = 1,
+    max_seconds: float = 120.0,
 ):
+    """
+    Record into a preallocated ring buffer until ENTER is pressed.
+    Returns a (num_samples, channels) float32 view of the capture; only the
+    last `max_seconds` are kept if the user talks for longer.
+    """
     print("Recording... press ENTER to stop")
 
-    frames = []
+    ring = AudioRingBuffer(int(max_seconds * samplerate), channels=channels)
 
     def callback(indata, frames_count, time, status):
-        frames.append(indata.copy())
+        ring.write(indata)
 
     with sd.InputStream(
         samplerate=samplerate,
         channels=channels,
+        dtype="float32",
         callback=callback,
     ):
         input()  # waits for ENTER
 
-    audio = np.concatenate(frames, axis=0)
+    if ring.overflow_samples:
+        print(f"[DEBUG] Recording exceeded {max_seconds:.0f}s; kept the most recent audio")
+    audio = ring.read()
     return audio
@@ -0,0 +1,131 @@
+import threading
+from typing import Optional
+import numpy as np
+
+
+class AudioRingBuffer:
+    """
+    Fixed-capacity float32 audio ring buffer with overflow accounting.
+
+    Storage is mirrored (every sample is written at i and i + capacity), so
+    any window of up to `capacity` samples is one contiguous slice. `view`,
+    `latest` and `read` therefore return NumPy views, not copies. A view of
+    samples [start, end) stays intact only until the writer laps `start`,
+    i.e. for `capacity - (total_written - start)` further samples: with a
+    concurrent writer (an audio callback), finish with a view before then or
+    copy it (`intact` tells whether it was overwritten).
+
+    Positions are absolute sample indices since the buffer was created.
+    """
+
+    def __init__(self, capacity: int, channels: int = 1):
+        self.capacity = capacity
+        self.channels = channels
+        self._buffer = np.zeros((2 * capacity, channels), dtype=np.float32)
+        self.total_written = 0
+        self.overflow_samples = 0  # samples overwritten before the reader got to them
+        self._read_pos = 0
+        self._lock = threading.Lock()
+
+    @property
+    def oldest(self) -> int:
+        """
+        Absolute index of the oldest sample still held.
+        """
+        return max(0, self.total_written - self.capacity)
+
+    @property
+    def read_position(self) -> int:
+        """
+        Absolute index just past the last sample consumed by `read`.
+        """
+        return self._read_pos
+
+    @property
+    def available(self) -> int:
+        """
+        Samples written but not yet consumed by `read`.
+        """
+        return self.total_written - self._read_pos
+
+    def write(self, block: np.ndarray):
+        """
+        Append samples (shape (n,) or (n, channels)). Safe to call from an
+        audio callback: no allocation when `block` is already float32.
+        """
+        block = np.asarray(block, dtype=np.float32).reshape(-1, self.channels)
+        n = block.shape[0]
+        with self._lock:
+            if n > self.capacity:
+                # Only the newest `capacity` samples can be kept
+                skipped = n - self.capacity
+                block = block[skipped:]
+                self.total_written += skipped
+                n = self.capacity
+
+            start = self.total_written % self.capacity
+            first = min(n, self.capacity - start)
+            self._buffer[start : start + first] = block[:first]
+            self._buffer[start + self.capacity : start + self.capacity + first] = block[:first]
+            rest = n - first
+            if rest:
+                self._buffer[:rest] = block[first:]
+                self._buffer[self.capacity : self.capacity + rest] = block[first:]
+            self.total_written += n
+
+            lost = self.total_written - self._read_pos - self.capacity
+            if lost > 0:
+                self.overflow_samples += lost
+                self._read_pos += lost
+
+    def intact(self, start: int) -> bool:
+        """
+        Whether samples from `start` on are still held (a view of them was not overwritten).
+        """
+        return start >= self.oldest
+
+    def view(self, start: int, end: int) -> np.ndarray:
+        """
+        Contiguous view of absolute samples [start, end), shape (end - start, channels).
+        """
+        with self._lock:
+            return self._view(start, end)
+
+    def latest(self, num_samples: int) -> np.ndarray:
+        with self._lock:
+            num_samples = min(num_samples, self.total_written, self.capacity)
+            return self._view(self.total_written - num_samples, self.total_written)
+
+    def copy(self, start: int, end: int) -> np.ndarray:
+        """
+        Copy of samples [start, end), safe to keep while the writer continues.
+        Samples already overwritten are left out (`start` is clamped to `oldest`).
+        """
+        with self._lock:
+            return self._view(min(max(start, self.oldest), end), end).copy()
+
+    def read(self, max_samples: Optional[int] = None) -> np.ndarray:
+        """
+        Consume unread samples (up to `max_samples`) and return them as a view.
+        """
+        with self._lock:
+            # Sliced under the lock: the writer cannot lap `start` in between
+            start = self._read_pos
+            end = self.total_written
+            if max_samples is not None:
+                end = min(end, start + max_samples)
+            self._read_pos = end
+            return self._view(start, end)
+
+    def clear(self):
+        with self._lock:
+            self._read_pos = self.total_written
+
+    def _view(self, start: int, end: int) -> np.ndarray:
+        if start < self.oldest or end > self.total_written or end < start:
+            raise IndexError(
+                f"Samples [{start}, {end}) not in buffer [{self.oldest}, {self.total_written})"
+            )
+        offset = start % self.capacity
+        return self._buffer[offset : offset + (end - start)]
+
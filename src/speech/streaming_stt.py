@@ -0,0 +1,202 @@
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional
+import numpy as np
+from speech.ring_buffer import AudioRingBuffer
+from speech.vad import EnergyVAD
+
+
+@dataclass
+class Hypothesis:
+    """
+    A partial or final transcription of the current utterance.
+    """
+    text: str
+    is_final: bool
+    start: float  # seconds from the start of the stream
+    end: float
+
+
+class StreamingRecognizer:
+    """
+    Transcribes speech while the user is still talking.
+
+    Audio is framed and classified by a VAD. While speech is active, the open
+    segment is re-transcribed every `step_s` to emit partial hypotheses.
+    Segments are committed at short pauses (or when they reach `window_s`),
+    so each transcription covers a bounded window and the tail left to
+    transcribe at end of speech stays short. End of speech is declared after
+    `end_silence_ms` of silence; no ENTER press is needed.
+
+    `stt` is anything with `transcribe(np.ndarray) -> str`, e.g. WhisperSTT.
+    """
+
+    def __init__(
+        self,
+        stt,
+        sample_rate: int = 16000,
+        vad: Optional[EnergyVAD] = None,
+        step_s: float = 0.5,
+        window_s: float = 8.0,
+        min_speech_ms: int = 90,
+        pause_ms: int = 240,
+        end_silence_ms: int = 450,
+        preroll_ms: int = 300,
+    ):
+        self.stt = stt
+        self.sample_rate = sample_rate
+        self.vad = vad or EnergyVAD(sample_rate=sample_rate)
+        frame_ms = self.vad.frame_ms
+        self.frame_size = self.vad.frame_size
+        self.step_frames = max(1, int(step_s * 1000 / frame_ms))
+        self.window_frames = max(1, int(window_s * 1000 / frame_ms))
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.pause_frames = max(1, pause_ms // frame_ms)
+        self.end_frames = max(self.pause_frames + 1, end_silence_ms // frame_ms)
+        self.preroll_frames = preroll_ms // frame_ms
+
+    def stream(
+        self,
+        source: Iterable[np.ndarray],
+        on_speech_start: Optional[Callable[[], None]] = None,
+    ) -> Iterator[Hypothesis]:
+        """
+        Yield partial and final hypotheses for every utterance in `source`.
+        on_speech_start: called as soon as the VAD detects an utterance,
+                         before anything is transcribed (e.g. for barge-in)
+        """
+        fs = self.frame_size
+        # Audio lives in a ring buffer and segments are absolute sample ranges,
+        # so STT gets contiguous views instead of concatenated copies. A ring
+        # shared with a capture thread keeps filling during a (slow) STT call,
+        # so segments are copied out of it instead.
+        ring: Optional[AudioRingBuffer] = getattr(source, "ring", None)
+        shared = ring is not None
+
+        def segment(start: int, end: int) -> np.ndarray:
+            return ring.copy(start, end) if shared else ring.view(start, end)
+
+        if not shared:
+            frames = self.window_frames + self.preroll_frames + self.min_speech_frames + self.end_frames
+            ring = AudioRingBuffer(frames * fs + 2 * self.sample_rate)
+
+        position = ring.total_written  # start of the next unprocessed frame
+        stream_start = position
+        in_speech = False
+        speech_run = 0
+        silence_run = 0
+        since_partial = 0
+        segment_start = 0
+        utterance_start = 0
+        committed: List[str] = []
+
+        for block in source:
+            if shared:
+                end = ring.read_position
+            else:
+                ring.write(block)
+                end = ring.total_written
+            while position + fs <= end:
+                if not ring.intact(position):
+                    # Fell behind the writer; skip to the first whole frame still held
+                    position = ring.oldest + (stream_start - ring.oldest) % fs
+                    if in_speech:
+                        segment_start = max(segment_start, position)
+                    continue
+                try:
+                    frame = ring.view(position, position + fs).reshape(-1)
+                except IndexError:
+                    continue  # lapped since the check above
+                position += fs
+                speech = self.vad.is_speech(frame)
+
+                if not in_speech:
+                    speech_run = speech_run + 1 if speech else 0
+                    if speech_run >= self.min_speech_frames:
+                        in_speech = True
+                        preroll = (self.preroll_frames + speech_run) * fs
+                        segment_start = max(position - preroll, ring.oldest, stream_start)
+                        utterance_start = segment_start
+                        committed = []
+                        silence_run = 0
+                        since_partial = 0
+                        if on_speech_start is not None:
+                            on_speech_start()
+                    continue
+
+                silence_run = 0 if speech else silence_run + 1
+                since_partial += 1
+
+                if silence_run >= self.end_frames:
+                    # End of speech: transcribe the (short) tail and finalize
+                    speech_end = position - silence_run * fs
+                    if speech_end > segment_start:
+                        committed.append(self._transcribe(segment(segment_start, speech_end)))
+                    yield Hypothesis(
+                        text=self._join(committed),
+                        is_final=True,
+                        start=self._seconds(utterance_start - stream_start),
+                        end=self._seconds(speech_end - stream_start),
+                    )
+                    in_speech = False
+                    speech_run = 0
+                    continue
+
+                segment_frames = (position - segment_start) // fs
+                if silence_run == self.pause_frames or segment_frames >= self.window_frames:
+                    # Commit at a pause (or a full window) so the next window starts fresh
+                    committed.append(self._transcribe(segment(segment_start, position)))
+                    segment_start = position
+                    since_partial = 0
+                    yield self._partial(committed, utterance_start - stream_start, position - stream_start)
+                elif since_partial >= self.step_frames and silence_run == 0:
+                    since_partial = 0
+                    partial = self._transcribe(segment(segment_start, position))
+                    yield self._partial(committed + [partial], utterance_start - stream_start, position - stream_start)
+
+        # Source ended mid-utterance
+        if in_speech:
+            if position > segment_start:
+                committed.append(self._transcribe(segment(segment_start, position)))
+            yield Hypothesis(
+                text=self._join(committed),
+                is_final=True,
+                start=self._seconds(utterance_start - stream_start),
+                end=self._seconds(position - stream_start),
+            )
+
+    def transcribe_utterance(
+        self,
+        source: Iterable[np.ndarray],
+        on_partial: Optional[Callable[[Hypothesis], None]] = None,
+    ) -> str:
+        """
+        Consume `source` until the first final hypothesis and return its text.
+        """
+        hypotheses = self.stream(source)
+        try:
+            for hypothesis in hypotheses:
+                if hypothesis.is_final:
+                    return hypothesis.text
+                if on_partial is not None:
+                    on_partial(hypothesis)
+        finally:
+            hypotheses.close()  # releases the source (e.g. closes the mic stream)
+        return ""
+
+    def _transcribe(self, audio: np.ndarray) -> str:
+        return self.stt.transcribe(audio.reshape(-1)).strip()
+
+    def _partial(self, parts: List[str], start: int, end: int) -> Hypothesis:
+        return Hypothesis(
+            text=self._join(parts),
+            is_final=False,
+            start=self._seconds(start),
+            end=self._seconds(end),
+        )
+
+    def _seconds(self, samples: int) -> float:
+        return samples / self.sample_rate
+
+    @staticmethod
+    def _join(parts: List[str]) -> str:
+        return " ".join(part for part in parts if part)
@@ -0,0 +1,187 @@
+import contextvars
+import inspect
+import queue
+import re
+import threading
+from typing import Callable, Iterable, List, Optional
+
+
+class SentenceChunker:
+    """
+    Splits a stream of LLM tokens into speakable chunks at sentence boundaries,
+    so TTS can start on the first sentence while later tokens are still arriving.
+    """
+
+    # Sentence end: punctuation (optionally closed by a quote/bracket) followed by whitespace
+    BOUNDARY = re.compile(r"[.!?;:][\"')\]]*\s+|\n+")
+
+    def __init__(self, min_chars: int = 20, max_chars: int = 250):
+        self.min_chars = min_chars  # avoid speaking "Dr." or "1." on its own
+        self.max_chars = max_chars  # force a split in very long sentences
+        self._buffer = ""
+
+    def feed(self, token: str) -> List[str]:
+        """
+        Add a token; return any chunks that are now complete.
+        """
+        self._buffer += token
+        chunks = []
+        search_from = 0
+        while True:
+            match = self.BOUNDARY.search(self._buffer, search_from)
+            if match is None:
+                break
+            if match.end() < self.min_chars:
+                search_from = match.end()
+                continue
+            chunks.append(self._buffer[: match.end()].strip())
+            self._buffer = self._buffer[match.end():]
+            search_from = 0
+
+        if len(self._buffer) > self.max_chars:
+            split = self._buffer.rfind(" ", 0, self.max_chars)
+            split = split if split > 0 else self.max_chars
+            chunks.append(self._buffer[:split].strip())
+            self._buffer = self._buffer[split:]
+
+        return [chunk for chunk in chunks if chunk]
+
+    def flush(self) -> Optional[str]:
+        """
+        Return whatever text is left at the end of the stream.
+        """
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest or None
+
+
+class TTSWorker:
+    """
+    Background thread that speaks queued text chunks in order.
+    The TTS engine is created inside the worker thread via `tts_factory`,
+    since pyttsx3 engines must be driven from the thread that created them.
+
+    `cancel` drops the queued chunks and stops the one playing, if the
+    engine's `speak` takes a `cancel` event (as WindowsTTS does).
+    """
+
+    def __init__(self, tts_factory: Callable):
+        self._queue: "queue.Queue" = queue.Queue()
+        self._cancelled = threading.Event()  # shared by every chunk queued since the last cancel
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(
+            target=self._run, args=(tts_factory,), name="tts-worker", daemon=True
+        )
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def say(self, text: str):
+        """
+        Queue text for playback (non-blocking).
+        """
+        # Played in the caller's context, so its trace span nests under the turn
+        with self._lock:
+            self._queue.put((text, contextvars.copy_context(), self._cancelled))
+
+    def cancel(self):
+        """
+        Stop playback now and drop every queued chunk (barge-in).
+        Chunks queued afterwards play normally.
+        """
+        with self._lock:
+            cancelled, self._cancelled = self._cancelled, threading.Event()
+        cancelled.set()
+
+    def wait(self):
+        """
+        Block until every queued chunk has been spoken.
+        """
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self, tts_factory: Callable):
+        try:
+            tts = tts_factory()
+        except BaseException as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        cancellable = "cancel" in inspect.signature(tts.speak).parameters
+
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                text, context, cancelled = item
+                if cancelled.is_set():
+                    continue
+                if cancellable:
+                    context.run(tts.speak, text, cancel=cancelled)
+                else:
+                    context.run(tts.speak, text)
+            except Exception as e:
+                print(f"[TTS] Playback failed: {e}")
+            finally:
+                self._queue.task_done()
+
+
+def speak_stream(
+    tokens: Iterable[str],
+    tts_worker: TTSWorker,
+    audio=None,
+    on_token: Optional[Callable[[str], None]] = None,
+    chunker: Optional[SentenceChunker] = None,
+    cancel: Optional[threading.Event] = None,
+) -> str:
+    """
+    Consume a token stream, speaking each completed sentence as soon as it is ready.
+    The AudioController (if given) enters SPEAKING with the first chunk and
+    returns to IDLE only after the last chunk has played.
+    Setting `cancel` (barge-in) stops reading tokens and cuts playback;
+    the token stream is closed, which cancels the LLM request.
+    Returns the generated text (up to the cancellation).
+    """
+    chunker = chunker or SentenceChunker()
+    parts = []
+    speaking = False
+
+    def enqueue(chunk: str):
+        nonlocal speaking
+        if audio is not None and not speaking:
+            audio.begin_speaking()
+        speaking = True
+        tts_worker.say(chunk)
+
+    try:
+        for token in tokens:
+            if cancel is not None and cancel.is_set():
+                break
+            parts.append(token)
+            if on_token is not None:
+                on_token(token)
+            for chunk in chunker.feed(token):
+                enqueue(chunk)
+
+        tail = chunker.flush()
+        if tail and not (cancel is not None and cancel.is_set()):
+            enqueue(tail)
+    finally:
+        close = getattr(tokens, "close", None)
+        if close is not None:
+            close()
+        if cancel is not None and cancel.is_set():
+            tts_worker.cancel()
+        tts_worker.wait()
+        if audio is not None and speaking:
+            audio.end_speaking()
+
+    return "".join(parts)
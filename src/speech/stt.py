@@ -1,11 +1,13 @@
+import threading
 import numpy as np
-from faster_whisper import WhisperModel
+from agent.tracing import tracer
 
 
 class WhisperSTT:
     """
     Speech-to-text using faster-whisper.
     Designed for short, push-to-talk utterances.
+    The model is loaded on first use (or by `warm_up`).
     """
 
     def __init__(
@@ -16,23 +18,48 @@ class WhisperSTT:
         sample_rate: int = 16000,
     ):
         self.sample_rate = sample_rate
-        self.model = WhisperModel(
-            model_size,
-            device=device,
-            compute_type=compute_type,
-        )
+        self.model_size = model_size
+        self.device = device
+        self.compute_type = compute_type
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from faster_whisper import WhisperModel
+                    self._model = WhisperModel(
+                        self.model_size,
+                        device=self.device,
+                        compute_type=self.compute_type,
+                    )
+        return self._model
+
+    def warm_up(self):
+        """
+        Load the model and transcribe a second of silence: once through the
+        VAD filter (loads it) and once without (runs the decoder).
+        """
+        silence = np.zeros(self.sample_rate, dtype=np.float32)
+        for vad_filter in (True, False):
+            segments, _ = self.model.transcribe(silence, language="en", vad_filter=vad_filter)
+            list(segments)  # segments are decoded lazily
 
+    @tracer.traced("stt.transcribe")
     def transcribe(self, audio: np.ndarray) -> str:
         """
-        audio: np.ndarray of shape (num_samples, 1) or (num_samples,)
+        audio: np.ndarray of shape (num_samples, channels) or (num_samples,);
+               multichannel input is downmixed to mono
         returns: transcribed text
         """
 
+        # Ensure float32 in [-1, 1]; mono float32 views are passed through
+        # without a copy (asarray/reshape only copy when they have to)
+        audio = np.asarray(audio, dtype=np.float32)
         if audio.ndim == 2:
-            audio = audio.squeeze(axis=1)
-
-        # Ensure float32 in [-1, 1]
-        audio = audio.astype(np.float32)
+            audio = audio.reshape(-1) if audio.shape[1] == 1 else audio.mean(axis=1)
 
         segments, _ = self.model.transcribe(
             audio,
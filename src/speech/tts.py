@@ -1,14 +1,21 @@
-import pyttsx3
+import threading
+import time
 from typing import Optional
+from agent.tracing import tracer
+
+CANCEL_POLL_S = 0.01  # how often playback checks for a cancellation
 
 
 class WindowsTTS:
     """
     Text-to-speech using Windows pyttsx3 voices.
     Works with AudioController to ensure half-duplex.
+    With a `cancel` event, playback runs pyttsx3's loop step by step and
+    stops within CANCEL_POLL_S of the event being set (barge-in).
     """
 
     def __init__(self, voice_name: Optional[str] = None, rate: int = 150, volume: float = 1.0):
+        import pyttsx3  # imported here so text-only sessions never load it
         self.engine = pyttsx3.init()
         self.engine.setProperty("rate", rate)
         self.engine.setProperty("volume", volume)
@@ -20,7 +27,8 @@ class WindowsTTS:
                     self.engine.setProperty("voice", v.id)
                     break
 
-    def speak(self, text: str):
+    @tracer.traced("tts.speak")
+    def speak(self, text: str, cancel: Optional[threading.Event] = None):
         """
         Speak the given text (blocking).
         """
@@ -28,4 +36,17 @@ class WindowsTTS:
             return
 
         self.engine.say(text)
-        self.engine.runAndWait()
+        if cancel is None:
+            self.engine.runAndWait()
+            return
+
+        self.engine.startLoop(False)
+        try:
+            while self.engine.isBusy():
+                if cancel.is_set():
+                    self.engine.stop()
+                    break
+                self.engine.iterate()
+                time.sleep(CANCEL_POLL_S)
+        finally:
+            self.engine.endLoop()
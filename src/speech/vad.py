@@ -0,0 +1,38 @@
+import numpy as np
+
+
+class EnergyVAD:
+    """
+    Frame-level voice activity detector based on RMS energy.
+    A frame is speech when its energy clears both an absolute floor and
+    `ratio` times the running noise estimate, which adapts on non-speech frames.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = 30,
+        threshold: float = 0.01,
+        ratio: float = 3.0,
+        noise_adapt: float = 0.05,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_size = int(sample_rate * frame_ms / 1000)
+        self.frame_ms = frame_ms
+        self.threshold = threshold
+        self.ratio = ratio
+        self.noise_adapt = noise_adapt
+        self.noise_floor = threshold / ratio
+
+    def rms(self, frame: np.ndarray) -> float:
+        return float(np.sqrt(np.mean(np.square(frame), dtype=np.float64)))
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        energy = self.rms(frame)
+        speech = energy >= max(self.threshold, self.ratio * self.noise_floor)
+        if not speech:
+            self.noise_floor += self.noise_adapt * (energy - self.noise_floor)
+        return speech
+
+    def reset(self):
+        self.noise_floor = self.threshold / self.ratio
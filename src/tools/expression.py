@@ -0,0 +1,148 @@
+import ast
+import math
+import operator
+from functools import lru_cache
+from typing import Callable, Optional, Union
+
+Number = Union[int, float]
+
+MAX_EXPRESSION_CHARS = 256
+MAX_INT_BITS = 4096  # ~1200 digits; bigger intermediate ints are rejected
+MAX_ROUND_DIGITS = 400  # round() builds 10**ndigits internally, before any result check
+MAX_FUNCTION_ARGS = 16
+
+
+class ExpressionError(ValueError):
+    """
+    Raised for expressions outside the supported arithmetic subset or size limits.
+    """
+
+
+def _round(number: Number, ndigits: Optional[Number] = None) -> Number:
+    if ndigits is None:
+        return round(number)
+    if type(ndigits) is not int:
+        raise ExpressionError("round() digits must be an integer")
+    if abs(ndigits) > MAX_ROUND_DIGITS:
+        raise ExpressionError(f"round() digits must be within {MAX_ROUND_DIGITS}")
+    return round(number, ndigits)
+
+
+BINARY = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: None,  # checked before it runs, see _power
+}
+UNARY = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+FUNCTIONS = {
+    "abs": abs,
+    "round": _round,
+    "min": min,
+    "max": max,
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+}
+CONSTANTS = {"pi": math.pi, "e": math.e}
+
+
+def _check(value: Number) -> Number:
+    # Every intermediate result must be a finite real: (-8)**0.5 is complex, 1e308*10 is inf
+    if type(value) is int:
+        if value.bit_length() > MAX_INT_BITS:
+            raise ExpressionError(f"Result exceeds {MAX_INT_BITS} bits")
+    elif type(value) is not float:
+        raise ExpressionError(f"Result is not a real number: {value!r}")
+    elif not math.isfinite(value):
+        raise ExpressionError(f"Result is not finite: {value!r}")
+    return value
+
+
+def _power(base: Number, exponent: Number) -> Number:
+    # Decide from the operand sizes, so 9**9**9 fails in O(1) instead of running for hours
+    if type(base) is int and type(exponent) is int and exponent > 0 and abs(base) > 1:
+        if (abs(base).bit_length() - 1) * exponent > MAX_INT_BITS:
+            raise ExpressionError(f"Result exceeds {MAX_INT_BITS} bits")
+    return _check(base ** exponent)
+
+
+def _compile(node: ast.AST) -> Callable[[], Number]:
+    if isinstance(node, ast.Expression):
+        return _compile(node.body)
+
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        value = _check(node.value)
+        return lambda: value
+
+    if isinstance(node, ast.Name) and node.id in CONSTANTS:
+        value = CONSTANTS[node.id]
+        return lambda: value
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY:
+        op = UNARY[type(node.op)]
+        operand = _compile(node.operand)
+        return lambda: op(operand())
+
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY:
+        op = BINARY[type(node.op)]
+        left, right = _compile(node.left), _compile(node.right)
+        if op is None:
+            return lambda: _power(left(), right())
+        return lambda: _check(op(left(), right()))
+
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id in FUNCTIONS
+        and not node.keywords
+    ):
+        if len(node.args) > MAX_FUNCTION_ARGS:
+            raise ExpressionError(f"{node.func.id}() takes at most {MAX_FUNCTION_ARGS} arguments here")
+        fn = FUNCTIONS[node.func.id]
+        args = [_compile(arg) for arg in node.args]
+        return lambda: _check(fn(*[arg() for arg in args]))
+
+    raise ExpressionError(f"Unsupported syntax: {type(node).__name__}")
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression: str) -> Callable[[], Number]:
+    """
+    Parse and validate an arithmetic expression once; returns a function that evaluates it.
+    Only numbers, + - * / // % **, unary +/-, pi, e and a few math
+    functions are allowed; integers are capped at MAX_INT_BITS and every
+    result must be a finite int or float.
+    """
+    if len(expression) > MAX_EXPRESSION_CHARS:
+        raise ExpressionError(f"Expression longer than {MAX_EXPRESSION_CHARS} characters")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid expression: {e.msg}") from None
+    return _compile(tree)
+
+
+def evaluate(expression: str) -> Number:
+    """
+    Evaluate an expression; every failure (syntax, limits, overflow,
+    division by zero, math domain) raises ExpressionError.
+    """
+    try:
+        return compile_expression(expression)()
+    except ExpressionError:
+        raise
+    except (ArithmeticError, ValueError, TypeError) as e:
+        # e.g. OverflowError(34, 'Numerical result out of range'): keep the text
+        message = e.args[-1] if e.args and isinstance(e.args[-1], str) else str(e)
+        raise ExpressionError(message or type(e).__name__) from None
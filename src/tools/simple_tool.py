@@ -1,15 +1,30 @@
+from tools.expression import evaluate
+
+
 class SimpleCalculatorTool:
     """
     Minimal example tool.
     Demonstrates agent -> tool -> result flow.
+    Expressions are parsed into a whitelisted AST (no eval) and cached.
+    Returns the number (so other tool calls can use it); invalid
+    expressions raise ExpressionError.
+    Isolated: with ToolRuntime(processes>0) it runs in a worker process
+    that is terminated if it exceeds its timeout.
     """
 
     name = "calculator"
+    isolated = True
     description = "Performs basic arithmetic expressions."
+    parameters = {
+        "type": "object",
+        "properties": {
+            "expression": {
+                "type": "string",
+                "description": "arithmetic expression, e.g. (12 * 7) / 3, 2 ** 10 or sqrt(2)",
+            },
+        },
+        "required": ["expression"],
+    }
 
-    def run(self, expression: str) -> str:
-        try:
-            result = eval(expression, {"__builtins__": {}})
-            return f"Result: {result}"
-        except Exception as e:
-            return f"Error evaluating expression: {str(e)}"
+    def run(self, expression: str):
+        return evaluate(expression)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Modules import each other as agent.*, speech.*, tools.* (run from src/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# Interactive scripts (microphone / speakers); run them by hand, e.g. py -m tests.test_speech
+collect_ignore = ["test_speech.py", "test_stt.py", "test_tts.py"]
@@ -0,0 +1,425 @@
+import asyncio
+import re
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from agent.batching import MicroBatcher
+from agent.context.controller import ContextController
+from agent.llm_client import LLMClient, RequestPolicy
+from agent.memory import Memory
+from agent.pipeline import INTERRUPTED_MARKER, TurnPipeline
+from agent.reflection import ReflectionWorker
+from agent.response_cache import ResponseCache
+from agent.routing import IntentRouter, extract_expression, extract_spoken_expression
+from agent.startup import Startup
+
+
+class FlatEmbeddings:
+    """
+    Every text gets the same vector, so no exemplar route is confident.
+    """
+
+    def embed_array(self, texts):
+        return np.full((len(texts), 4), 0.5, dtype=np.float32)
+
+
+@pytest.mark.parametrize(
+    "text,expression",
+    [
+        ("what is 12*7?", "12*7"),
+        ("what is 12x7?", "12*7"),
+        ("12 × 7", "12*7"),
+        ("calculate 100 - 1234", "100 - 1234"),
+        ("2 ** 10", "2 ** 10"),
+        ("0.5 * 4", "0.5 * 4"),
+        ("100/10/5", "100/10/5"),
+        ("1000-1", "1000-1"),
+    ],
+)
+def test_extracts_arithmetic(text, expression):
+    assert extract_expression(text) == {"expression": expression}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "2024-01-05",
+        "555-1234",
+        "10/12/2024",
+        "1-800-555-0199",
+        "call (555) 555-1234",
+        "05 + 3",
+        "box 2x3",
+        "extra x 5",
+        "hello",
+    ],
+)
+def test_ignores_dates_phone_numbers_and_text(text):
+    assert extract_expression(text) is None
+
+
+def test_router_sends_arithmetic_to_the_calculator():
+    router = IntentRouter(FlatEmbeddings())
+    plan = router.route("what is 6 x 3")
+    assert plan["tool_name"] == "SimpleCalculatorTool"
+    assert plan["arguments"] == {"expression": "6*3"}
+    assert plan["confidence"] == 1.0
+
+
+@pytest.mark.parametrize("text", ["2024-01-05", "555-1234", "10/12/2024", "1-800-555-0199"])
+def test_router_leaves_dates_and_phone_numbers_to_the_llm(text):
+    assert IntentRouter(FlatEmbeddings()).route(text) is None
+
+
+def test_router_answers_greetings_locally():
+    plan = IntentRouter(FlatEmbeddings()).route("thanks!")
+    assert plan["action"] == "respond" and plan["router"] == "local"
+
+
+@pytest.mark.parametrize(
+    "text,expression",
+    [
+        ("what is 12 times 7", "12 * 7"),
+        ("calculate 15 percent of 200", "15 / 100 * 200"),
+        ("add 3 and 4", "3 + 4"),
+        ("What is 2 to the power of 10?", "2 ** 10"),
+        ("divide 144 by 12", "144 / 12"),
+        ("subtract 4 from 10", "10 - 4"),
+        ("9 minus 2 plus 1", "9 - 2 + 1"),
+        ("what is 12*7?", "12*7"),
+    ],
+)
+def test_extracts_spoken_arithmetic(text, expression):
+    assert extract_spoken_expression(text) == {"expression": expression}
+
+
+@pytest.mark.parametrize("text", ["what is 3 times better", "add salt and pepper", "what is 2024-01-05 plus 1"])
+def test_spoken_extractor_ignores_text(text):
+    assert extract_spoken_expression(text) is None
+
+
+def test_every_calculator_exemplar_can_be_extracted():
+    for text in IntentRouter.DEFAULT_EXEMPLARS["SimpleCalculatorTool"]:
+        assert extract_expression(text) is None  # words never match the rules tier
+        assert extract_spoken_expression(text) is not None
+
+
+def test_router_sends_spoken_arithmetic_through_the_embedding_tier():
+    router = IntentRouter(BagOfWordsEmbeddings())
+    plan = router.route("what is 9 times 8")  # same words as an exemplar
+    assert plan["tool_name"] == "SimpleCalculatorTool"
+    assert plan["arguments"] == {"expression": "9 * 8"}
+    assert router.route("what is supervised learning")["action"] == "respond"
+
+
+class RespondPlanner:
+    def plan(self, user_input, history):
+        return {"action": "respond"}
+
+
+def make_pipeline(memory):
+    return TurnPipeline(
+        llm=None,
+        planner=RespondPlanner(),
+        memory=memory,
+        reflection=None,
+        tools={},
+        embedding_model=FlatEmbeddings(),
+        reflection_interval=100,
+    )
+
+
+def run_turn(memory, respond, cancel):
+    async def turn():
+        pipeline = make_pipeline(memory)
+        result = await pipeline.run_turn("tell me a story", respond=respond, cancel=cancel)
+        await pipeline.drain()
+        pipeline.close()
+        return result
+
+    return asyncio.run(turn())
+
+
+def test_completed_response_is_stored_as_is():
+    memory = Memory()
+    result = run_turn(memory, lambda messages: "Once upon a time.", threading.Event())
+    assert not result["interrupted"]
+    assert [m["content"] for m in memory.get_llm_messages()] == ["tell me a story", "Once upon a time."]
+
+
+def test_barge_in_marks_the_partial_response():
+    memory = Memory()
+    cancel = threading.Event()
+
+    def respond(messages):
+        cancel.set()  # the user talks over the agent mid-sentence
+        return "Once upon"
+
+    result = run_turn(memory, respond, cancel)
+    assert result["interrupted"] and result["response"] == "Once upon"
+    assert memory.get_llm_messages()[-1]["content"] == "Once upon" + INTERRUPTED_MARKER
+
+
+def test_barge_in_before_the_response_skips_it():
+    memory = Memory()
+    cancel = threading.Event()
+    cancel.set()
+    calls = []
+    result = run_turn(memory, calls.append, cancel)
+    assert calls == [] and result["interrupted"] and result["response"] == ""
+    assert [m["role"] for m in memory.get_llm_messages()] == ["user"]
+
+
+def test_startup_report_while_warm_ups_finish():
+    startup = Startup(verbose=False)
+    release = threading.Event()
+
+    def failing():
+        raise RuntimeError("no model")
+
+    for i in range(8):
+        startup.warm_up(f"model{i}", release.wait)
+    startup.warm_up("broken", failing)
+    report = startup.report()
+    assert all(report[f"model{i}"] == "loading" for i in range(8))
+
+    release.set()
+    while not startup.wait(timeout=0):
+        startup.report()  # concurrent with the threads recording their timings
+    report = startup.report()
+    assert all(isinstance(report[f"model{i}"], float) for i in range(8))
+    assert report["broken"] == "failed"
+
+
+class Throttled(ConnectionError):
+    def __init__(self, retry_after):
+        super().__init__("429")
+        self.response = type("Response", (), {"headers": {"retry-after": str(retry_after)}})()
+
+
+class ThrottledClient:
+    """
+    Minimal AsyncOpenAI stand-in: the first `throttled` calls fail with Retry-After.
+    """
+
+    def __init__(self, retry_after, throttled=1):
+        self.calls = 0
+        self.retry_after = retry_after
+        self.throttled = throttled
+        self.chat = self
+        self.completions = self
+
+    async def create(self, model, messages, stream=False):
+        self.calls += 1
+        if self.calls <= self.throttled:
+            raise Throttled(self.retry_after)
+        return "ok"
+
+
+def test_llm_client_follows_retry_after_beyond_the_backoff_cap():
+    fake = ThrottledClient(retry_after=0.3)
+    client = LLMClient(client=fake, backoff_cap=0.01, policies={"response": RequestPolicy(timeout=5.0, retries=1)})
+    try:
+        start = time.perf_counter()
+        assert client.complete("m", []) == "ok"
+        assert time.perf_counter() - start >= 0.3
+    finally:
+        client.close()
+
+
+def test_llm_client_gives_up_when_retry_after_exceeds_the_timeout():
+    fake = ThrottledClient(retry_after=120)
+    client = LLMClient(client=fake, policies={"response": RequestPolicy(timeout=5.0, retries=3)})
+    try:
+        with pytest.raises(Throttled):
+            client.complete("m", [])
+        assert fake.calls == 1
+        assert client.stats()["response"]["errors"] == 1
+    finally:
+        client.close()
+
+
+class BagOfWordsEmbeddings:
+    """
+    Texts with the same words (any case, punctuation or order) get the same unit vector.
+    """
+
+    def embed_array(self, texts):
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in re.findall(r"[a-z]+", text.lower()):
+                vectors[i, sum(word.encode()) % 64] = 1.0
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+
+def turn(user, system="SOURCES: [supervised] (score: 0.91) labeled data", history=()):
+    return [{"role": "system", "content": system}, *history, {"role": "user", "content": user}]
+
+
+def test_response_cache_exact_and_semantic_hits():
+    cache = ResponseCache(BagOfWordsEmbeddings())
+    cache.store(turn("What is supervised learning?"), "Learning from labeled data.", latency=1.5)
+
+    assert cache.lookup(turn("  what is SUPERVISED learning?")) == "Learning from labeled data."
+    assert cache.lookup(turn("Supervised learning: what is?")) == "Learning from labeled data."
+    assert cache.lookup(turn("What is unsupervised learning?")) is None
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["saved_seconds"] == 3.0
+
+
+def test_response_cache_scope_splits_on_grounding_and_recent_history():
+    cache = ResponseCache(BagOfWordsEmbeddings())
+    cache.store(turn("what is it"), "answer about supervised learning")
+
+    # Retrieval scores differ between near-identical queries and do not split the scope
+    assert cache.lookup(turn("What is it?", system="SOURCES: [supervised] (score: 0.87) labeled data")) is not None
+    # Different retrieval context or a different tool result: never reuse the answer
+    assert cache.lookup(turn("what is it", system="SOURCES: [reinforcement] rewards")) is None
+    tool = {"role": "assistant", "content": "Tool SimpleCalculatorTool result: 84"}
+    assert cache.lookup(turn("what is it", history=[tool])) is None
+
+
+def test_response_cache_expiry_eviction_and_persistence(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(BagOfWordsEmbeddings(), max_items=2, path=path)
+    for word in ["alpha", "beta", "gamma"]:
+        cache.store(turn(f"tell me about {word}"), f"{word} answer")
+    assert cache.lookup(turn("tell me about alpha")) is None  # least recently used, evicted
+    cache.close()
+
+    reloaded = ResponseCache(BagOfWordsEmbeddings(), max_items=2, path=path)
+    assert reloaded.lookup(turn("about beta, tell me")) == "beta answer"
+    assert reloaded.lookup(turn("tell me about alpha")) is None
+    reloaded.ttl = 0  # everything is now expired
+    time.sleep(0.01)
+    assert reloaded.lookup(turn("tell me about gamma")) is None
+    reloaded.close()
+
+
+
+def test_response_cache_database_matches_memory_under_concurrent_stores(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(max_items=4, path=path)
+
+    def store(worker):
+        for i in range(100):
+            cache.store(turn(f"question {worker} {i}"), "answer")
+
+    threads = [threading.Thread(target=store, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stored = {key for (key,) in cache._db.execute("SELECT key FROM responses")}
+    assert stored == set(cache._entries)  # no evicted entry was written back
+    cache.close()
+
+
+class RecordingReflection:
+    """
+    Summaries are just the message contents seen so far, so the test can follow the cursor.
+    """
+
+    def __init__(self):
+        self.folded = []
+        self.rolled = []
+
+    def fold(self, summary, new_messages):
+        self.folded.append([m["content"] for m in new_messages])
+        return " ".join(filter(None, [summary] + [m["content"] for m in new_messages]))
+
+    def roll_up(self, session_summary, segment_summary):
+        self.rolled.append(segment_summary)
+        return " | ".join(filter(None, [session_summary, segment_summary]))
+
+
+async def call(kind, fn, *args):
+    return fn(*args)
+
+
+def test_reflection_folds_only_new_messages_and_rolls_up_segments():
+    memory, controller, reflection = Memory(), ContextController(), RecordingReflection()
+    worker = ReflectionWorker(reflection, memory, controller, call, interval=4, segment_folds=2)
+
+    async def chat(worker, turns):
+        for i in turns:
+            memory.add("user", f"u{i}")
+            memory.add("assistant", f"a{i}")
+            memory.add("tool", "ignored")
+            worker.notify()
+            await asyncio.sleep(0)
+        await worker.drain()
+
+    asyncio.run(chat(worker, range(5)))
+    # A fold needs `interval` new messages; each sees only what came after the cursor
+    assert reflection.folded == [["u0", "a0", "u1", "a1"], ["u2", "a2", "u3", "a3"]]
+    assert reflection.rolled == ["u0 a0 u1 a1 u2 a2 u3 a3"]
+    assert worker.segment_summary == "" and worker.cursor == 12  # u4/a4 wait for the next fold
+    sources = {p.source: p.content for p in controller.packets}
+    assert sources == {ReflectionWorker.SESSION_SOURCE: "Session summary: u0 a0 u1 a1 u2 a2 u3 a3"}
+
+    # A new worker (e.g. after a restart) resumes the summaries; earlier messages count as folded
+    resumed = ReflectionWorker(reflection, memory, controller, call, interval=2, segment_folds=2)
+    assert resumed.session_summary == worker.session_summary and resumed.cursor == memory.total_added
+    asyncio.run(chat(resumed, [5]))
+    assert reflection.folded[-1] == ["u5", "a5"]
+
+
+def test_micro_batcher_groups_concurrent_items():
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch_size=4, max_wait_ms=50)
+    assert batcher.map(range(10)) == [item * 2 for item in range(10)]
+    batcher.close()
+    assert batcher.batches == 3 and batcher.mean_batch_size == pytest.approx(10 / 3)
+
+
+def test_micro_batcher_fails_the_batch_on_a_result_count_mismatch():
+    batcher = MicroBatcher(lambda items: items[:-1], max_wait_ms=50)
+    futures = batcher.submit_many([1, 2, 3])
+    for future in futures:
+        with pytest.raises(ValueError, match="2 results for 3 items"):
+            future.result(timeout=1)
+    batcher.close()
+
+
+def test_micro_batcher_close_races_with_submit():
+    # Every submit either raises or gets a result; none is left waiting
+    for _ in range(20):
+        batcher = MicroBatcher(lambda items: items, max_wait_ms=1)
+        futures = []
+
+        def submit():
+            for item in range(50):
+                try:
+                    futures.append(batcher.submit(item))
+                except RuntimeError:
+                    return
+
+        thread = threading.Thread(target=submit)
+        thread.start()
+        batcher.close()
+        thread.join()
+        assert [future.result(timeout=1) for future in futures] == list(range(len(futures)))
+        with pytest.raises(RuntimeError):
+            batcher.submit(0)
+
+
+def test_micro_batcher_skips_cancelled_items():
+    release = threading.Event()
+    seen = []
+
+    def batch_fn(items):
+        release.wait(1)
+        seen.extend(items)
+        return items
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=1)
+    first, second = batcher.submit_many(["a", "b"])
+    assert second.cancel()
+    release.set()
+    assert first.result(timeout=1) == "a"
+    batcher.close()
+    assert seen == ["a"] and second.cancelled()
@@ -0,0 +1,206 @@
+import threading
+
+import numpy as np
+import pytest
+
+from speech.ring_buffer import AudioRingBuffer
+from speech.streaming_stt import StreamingRecognizer
+from speech.stt import WhisperSTT
+
+
+class RecordingModel:
+    """
+    Stands in for the faster-whisper model; keeps what it was asked to transcribe.
+    """
+
+    def __init__(self):
+        self.audio = None
+
+    def transcribe(self, audio, language, vad_filter):
+        self.audio = audio
+        return iter(()), None
+
+
+def stt_with_recording_model():
+    stt = WhisperSTT()
+    stt._model = RecordingModel()
+    return stt
+
+
+def test_transcribe_passes_mono_through_without_copying():
+    stt = stt_with_recording_model()
+    audio = np.linspace(-1, 1, 1600, dtype=np.float32).reshape(-1, 1)
+    stt.transcribe(audio)
+    assert stt.model.audio.shape == (1600,)
+    assert np.shares_memory(stt.model.audio, audio)
+
+
+def test_transcribe_downmixes_stereo():
+    stt = stt_with_recording_model()
+    left = np.linspace(-1, 1, 1600, dtype=np.float32)
+    stt.transcribe(np.stack([left, np.zeros_like(left)], axis=1))
+    assert stt.model.audio.shape == (1600,)  # not 3200 interleaved samples
+    np.testing.assert_allclose(stt.model.audio, left / 2)
+
+
+def samples(start, end):
+    return np.arange(start, end, dtype=np.float32)
+
+
+def test_ring_buffer_views_stay_contiguous_across_wraparound():
+    ring = AudioRingBuffer(capacity=8)
+    ring.write(samples(0, 6))
+    assert ring.read().ravel().tolist() == list(range(6))
+    ring.write(samples(6, 11))  # wraps past the end of the storage
+    view = ring.read()
+    assert view.ravel().tolist() == list(range(6, 11))
+    assert view.base is not None  # a view, not a copy
+    assert ring.latest(8).ravel().tolist() == list(range(3, 11))
+    assert ring.view(4, 10).ravel().tolist() == list(range(4, 10))
+
+
+def test_ring_buffer_overflow_skips_the_reader_ahead():
+    ring = AudioRingBuffer(capacity=8)
+    ring.write(samples(0, 5))
+    ring.write(samples(5, 12))
+    assert ring.overflow_samples == 4 and ring.read_position == 4
+    assert ring.read(3).ravel().tolist() == [4, 5, 6]
+    assert ring.available == 5
+    with pytest.raises(IndexError):
+        ring.view(3, 5)  # overwritten
+
+
+def test_ring_buffer_block_larger_than_capacity_keeps_the_newest():
+    ring = AudioRingBuffer(capacity=4, channels=2)
+    ring.write(np.arange(20, dtype=np.float32).reshape(10, 2))
+    assert ring.total_written == 10 and ring.oldest == 6
+    assert ring.latest(4)[:, 0].tolist() == [12, 14, 16, 18]
+    assert ring.read().shape == (4, 2)
+
+
+def test_ring_buffer_read_never_sees_a_lapped_range():
+    ring = AudioRingBuffer(capacity=64)
+    stop = threading.Event()
+
+    def capture():
+        block = np.ones(60, dtype=np.float32)
+        while not stop.is_set():
+            ring.write(block)
+
+    writer = threading.Thread(target=capture)
+    writer.start()
+    try:
+        for _ in range(5000):
+            assert ring.read().shape[0] <= 64  # used to raise IndexError when lapped
+            ring.latest(32)
+    finally:
+        stop.set()
+        writer.join()
+
+
+def test_ring_buffer_copy_outlives_the_writer():
+    ring = AudioRingBuffer(capacity=8)
+    ring.write(samples(0, 8))
+    copied, view = ring.copy(2, 6), ring.view(2, 6)
+    ring.write(samples(8, 16))
+    assert copied.ravel().tolist() == [2, 3, 4, 5]
+    assert view.ravel().tolist() == [10, 11, 12, 13] and not ring.intact(2)
+    assert ring.copy(4, 10).ravel().tolist() == [8, 9]  # overwritten samples are left out
+
+
+class RecordingSTT:
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio):
+        self.calls.append(audio)
+        return "hello"
+
+
+class LappingSource:
+    """
+    Shares its ring like MicrophoneSource, but the "capture" writes more than
+    the ring holds between two reads, so the reader is always lapped.
+    """
+
+    def __init__(self, capacity, blocks):
+        self.ring = AudioRingBuffer(capacity)
+        self.blocks = blocks
+
+    def __iter__(self):
+        for block in self.blocks:
+            self.ring.write(block)
+            yield self.ring.read()
+
+
+def test_streaming_recognizer_catches_up_with_a_shared_ring():
+    stt = RecordingSTT()
+    recognizer = StreamingRecognizer(stt)
+    fs = recognizer.frame_size
+    speech = np.full(fs * 40 + 7, 0.5, dtype=np.float32)  # not a whole number of frames
+    silence = np.zeros(fs * 30, dtype=np.float32)
+    source = LappingSource(capacity=fs * 20, blocks=[speech, speech, silence])
+
+    hypotheses = list(recognizer.stream(source))
+    assert hypotheses[-1].is_final and hypotheses[-1].text.startswith("hello")
+    assert stt.calls and not any(np.shares_memory(audio, source.ring._buffer) for audio in stt.calls)
+
+
+def tone(seconds, amplitude=0.3, rate=16000):
+    t = np.arange(int(seconds * rate), dtype=np.float32) / rate
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def quiet(seconds, rate=16000):
+    return np.zeros(int(seconds * rate), dtype=np.float32)
+
+
+def blocks(audio, size=1600):
+    return [audio[i : i + size] for i in range(0, audio.shape[0], size)]
+
+
+class LengthSTT:
+    """
+    "Transcribes" a segment as its length in ms, so tests can see what was sent.
+    """
+
+    def __init__(self):
+        self.lengths = []
+
+    def transcribe(self, audio):
+        self.lengths.append(audio.shape[0])
+        return f"{audio.shape[0] * 1000 // 16000}ms"
+
+
+def test_vad_endpoints_each_utterance_without_a_key_press():
+    stt = LengthSTT()
+    recognizer = StreamingRecognizer(stt, step_s=10, window_s=30)
+    audio = np.concatenate([quiet(0.5), tone(1.0), quiet(1.0), tone(0.6), quiet(1.0)])
+    started = []
+
+    finals = [h for h in recognizer.stream(blocks(audio), on_speech_start=lambda: started.append(1)) if h.is_final]
+    assert len(finals) == 2 and len(started) == 2
+    first, second = finals
+    # Endpoints within a couple of 30 ms frames (plus the 300 ms preroll at the start)
+    assert 0.15 <= first.start <= 0.5 and abs(first.end - 1.5) <= 0.07
+    assert 2.1 <= second.start <= 2.5 and abs(second.end - 3.1) <= 0.07
+    # Speech plus preroll and at most a pause of silence is transcribed, not the silences between
+    assert len(stt.lengths) == 2 and sum(stt.lengths) <= 2.8 * 16000 < audio.shape[0]
+
+
+def test_partials_are_committed_at_pauses():
+    stt = LengthSTT()
+    recognizer = StreamingRecognizer(stt, step_s=10, window_s=30, pause_ms=240, end_silence_ms=450)
+    audio = np.concatenate([tone(0.6), quiet(0.3), tone(0.6), quiet(1.0)])
+    hypotheses = list(recognizer.stream(blocks(audio)))
+    *partials, final = hypotheses
+    # Committed at the short pause, then again when the end silence passes the pause length
+    assert [p.text.count("ms") for p in partials] == [1, 2] and not any(p.is_final for p in partials)
+    assert final.is_final and final.text == partials[-1].text
+    assert final.end == pytest.approx(1.5, abs=0.07)
+
+
+def test_source_ending_mid_utterance_still_finalizes():
+    recognizer = StreamingRecognizer(LengthSTT())
+    (final,) = [h for h in recognizer.stream(blocks(tone(1.0))) if h.is_final]
+    assert final.text and final.end == pytest.approx(1.0, abs=0.03)
@@ -0,0 +1,126 @@
+from agent.context.controller import ContextController
+from agent.context.packet import ContextPacket
+from agent.context.prefix import PrefixTracker, shared_prefix_length
+
+
+def packet(type, content, source=None, priority=0, ttl=-1):
+    return ContextPacket(type=type, content=content, source=source or type, ttl=ttl, priority=priority)
+
+
+def message(i, size=40):
+    return {"role": "user" if i % 2 == 0 else "assistant", "content": f"{i:03d} " + "x" * (size - 4)}
+
+
+def contents(messages):
+    return [m["content"] for m in messages]
+
+
+def test_packets_are_ordered_by_priority_then_insertion():
+    controller = ContextController()
+    controller.add(packet("reflection", "low", priority=10))
+    controller.add(packet("retrieved_knowledge", "high", priority=80))
+    controller.add(packet("reflection", "low too", source="other", priority=10))
+    messages = controller.build_messages(suffix=[{"role": "user", "content": "hi"}])
+    assert contents(messages) == ["high", "low", "low too", "hi"]
+
+
+def test_budget_is_filled_by_priority_and_cuts_the_lowest_first():
+    # 4 characters per token + 4 tokens per message
+    controller = ContextController(token_budget=60, min_truncated_tokens=8)
+    controller.add(packet("retrieved_knowledge", "r" * 80, priority=80))  # 24 tokens
+    controller.add(packet("conversation", [message(i) for i in range(4)], source="memory", priority=50))  # 14 each
+    controller.add(packet("reflection", "summary", priority=10))
+
+    messages = controller.build_messages(suffix=[{"role": "user", "content": "question"}])  # 6 tokens
+    # 60 - 6 - 24 leaves 30: the two newest conversation messages; the reflection is dropped
+    assert contents(messages) == ["r" * 80, message(2)["content"], message(3)["content"], "question"]
+    assert controller.last_build["truncated"] == 1 and controller.last_build["dropped"] == 1
+    assert controller.last_build["tokens"] <= 60
+
+
+def test_text_packets_are_truncated_to_the_remaining_budget():
+    controller = ContextController(token_budget=30, min_truncated_tokens=8)
+    controller.add(packet("retrieved_knowledge", "word " * 100, priority=80))
+    (kept,) = controller.build_messages()
+    assert kept["content"].endswith(" ...") and controller.estimator.count_message(kept) <= 30
+
+
+def test_render_cache_follows_replaced_and_reassigned_content():
+    controller = ContextController()
+    controller.add(packet("reflection", "first summary", source="reflection"))
+    assert contents(controller.build_messages()) == ["first summary"]
+
+    controller.replace(packet("reflection", "second summary", source="reflection"))
+    assert contents(controller.build_messages()) == ["second summary"]
+
+    controller.packets[0].content = "third summary"
+    assert contents(controller.build_messages()) == ["third summary"]
+
+    history = [message(0)]
+    controller.add(packet("conversation", history, source="memory"))
+    controller.build_messages()
+    history.append(message(1))  # memory hands out a growing list
+    assert contents(controller.build_messages())[-1] == message(1)["content"]
+
+    controller.replace(packet("reflection", "", source="reflection"))  # empty content only removes
+    assert [p.type for p in controller.packets] == ["conversation"]
+
+
+def test_step_expires_packets():
+    controller = ContextController()
+    controller.add(packet("retrieved_knowledge", "this turn only", ttl=1))
+    controller.add(packet("system", "always"))
+    controller.step()
+    assert contents(controller.build_messages()) == ["always"]
+
+
+def test_prefix_layout_puts_static_packets_first():
+    controller = ContextController(layout="prefix")
+    controller.add(packet("audio_state", None, priority=90))
+    controller.packets[0].metadata = {"audio_state": "LISTENING"}
+    controller.add(packet("retrieved_knowledge", "sources", priority=80))
+    controller.add(packet("conversation", [message(0)], source="memory", priority=50))
+    controller.add(packet("reflection", "summary", priority=40))
+    controller.add(packet("system", "instructions", priority=100))
+    messages = controller.build_messages()
+    assert contents(messages) == [
+        "instructions", message(0)["content"], "summary", "sources", "Audio state: LISTENING",
+    ]
+
+
+def test_prefix_layout_keeps_conversations_append_only():
+    controller = ContextController(token_budget=100, layout="prefix", prefix_headroom=0.5, min_truncated_tokens=8)
+    history = []
+    firsts = []
+    for i in range(12):
+        history.append(message(i))  # 14 tokens each: 7 fit in the budget
+        conversation = packet("conversation", list(history), source="memory")
+        messages = controller.build_messages(packets=[conversation])
+        firsts.append(messages[0]["content"][:3])
+        assert controller.last_build["tokens"] <= 100
+
+    # Starts stay put while the history fits, then jump once to leave room for the next turns
+    assert firsts == ["000"] * 7 + ["005"] * 5  # cut to half the budget: 3 messages
+    assert len(set(firsts)) == 2
+
+
+def test_window_is_append_only_too():
+    controller = ContextController(prefix_headroom=0.5, min_truncated_tokens=8)
+    history = [message(i) for i in range(4)]
+    assert controller.window("planner", history, token_budget=100) == history
+    history += [message(i) for i in range(4, 9)]
+    kept = controller.window("planner", history, token_budget=100)
+    assert contents(kept)[-1] == message(8)["content"] and len(kept) <= 7
+    anchor = kept[0]
+    history.append(message(9))
+    assert controller.window("planner", history, token_budget=100)[0] is anchor
+
+
+def test_prefix_tracker_measures_the_shared_prefix():
+    assert shared_prefix_length("abcdef", "abcxyz") == 3
+    tracker = PrefixTracker()
+    system = {"role": "system", "content": "instructions " * 20}
+    first = tracker.observe("response", [system, {"role": "user", "content": "one"}])
+    second = tracker.observe("response", [system, {"role": "user", "content": "two"}])
+    assert first[0] == 0 and 0 < second[0] < second[1]
+    assert tracker.stats()["response"]["requests"] == 2
@@ -0,0 +1,206 @@
+import copy
+import json
+import os
+
+import pytest
+
+from agent.memory import Memory
+from agent.memory_log import HEADER, MemoryJournal, RecordLog
+
+
+def write_records(path, count):
+    log = RecordLog(path, fsync_every=1)
+    for i in range(count):
+        log.append({"i": i})
+    log.close()
+
+
+@pytest.mark.parametrize("cut", [1, 4, 9])
+def test_truncated_log_replays_the_intact_records(tmp_path, cut):
+    path = str(tmp_path / "turns.log")
+    write_records(path, 5)
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - cut)  # a torn final write
+
+    log = RecordLog(path)
+    assert [r["i"] for r in log.read_from()] == [0, 1, 2, 3]
+    assert log.recovered_bytes > 0 and os.path.getsize(path) == log.size
+    log.append({"i": 4})  # appends continue after the cut
+    assert [r["i"] for r in log.tail(2)] == [3, 4]
+    log.close()
+
+
+def test_corrupt_tail_is_truncated(tmp_path):
+    path = str(tmp_path / "turns.log")
+    write_records(path, 3)
+    with open(path, "r+b") as f:
+        f.seek(-6, os.SEEK_END)
+        f.write(b"\xff")  # flip a payload byte of the last record
+
+    log = RecordLog(path)
+    assert [r["i"] for r in log.read_from()] == [0, 1]
+    log.close()
+
+
+def test_header_only_log_is_empty(tmp_path):
+    path = str(tmp_path / "turns.log")
+    RecordLog(path).close()
+    log = RecordLog(path)
+    assert log.size == HEADER.size and list(log.read_from()) == [] and log.tail(3) == []
+    log.close()
+
+
+def journaled(path, **kwargs):
+    memory = Memory(max_items=kwargs.pop("max_items", 100))
+    journal = MemoryJournal(path, memory, fsync_interval=None, **kwargs)
+    return memory, journal, journal.resume()
+
+
+def test_resume_replays_snapshot_plus_log(tmp_path):
+    path = str(tmp_path / "session")
+    memory, journal, _ = journaled(path, snapshot_every=4)
+    for i in range(10):
+        memory.add("user", f"message {i}")
+    journal.close()
+
+    memory, journal, stats = journaled(path, snapshot_every=4)
+    assert [m["content"] for m in memory.get_llm_messages()] == [f"message {i}" for i in range(10)]
+    assert stats["replayed"] == 2  # the rest came from the snapshot taken at 8
+    journal.close()
+
+
+def test_compaction_resets_the_log_and_keeps_the_history(tmp_path):
+    path = str(tmp_path / "session")
+    memory, journal, _ = journaled(path, snapshot_every=3, compact_bytes=1)
+    for i in range(7):
+        memory.add("assistant", f"reply {i}")
+    epoch = journal.log.epoch
+    journal.close()
+    assert epoch > 0
+
+    memory, journal, stats = journaled(path, snapshot_every=3, compact_bytes=1)
+    assert journal.log.epoch == epoch
+    assert stats["replayed"] == 1
+    assert memory.get_latest("assistant") == "reply 6" and len(memory) == 7
+    journal.close()
+
+
+def test_crash_between_compacted_snapshot_and_log_reset(tmp_path, monkeypatch):
+    path = str(tmp_path / "session")
+    memory, journal, _ = journaled(path, snapshot_every=1000)
+    for i in range(3):
+        memory.add("user", f"message {i}")
+    # The snapshot for the next epoch is written, then the process dies before the reset
+    monkeypatch.setattr(journal.log, "reset", lambda epoch: None)
+    journal.snapshot(compact=True)
+    journal.close()
+
+    memory, journal, stats = journaled(path)
+    assert journal.log.epoch == 1 and stats["replayed"] == 0
+    assert [m["content"] for m in memory.get_llm_messages()] == ["message 0", "message 1", "message 2"]
+    journal.close()
+
+
+def test_resume_keeps_only_the_newest_items(tmp_path):
+    path = str(tmp_path / "session")
+    memory, journal, _ = journaled(path)
+    for i in range(10):
+        memory.add("user", f"message {i}")
+    journal.close()
+
+    memory, journal, _ = journaled(path, max_items=3)
+    assert [m["content"] for m in memory.get_llm_messages()] == ["message 7", "message 8", "message 9"]
+    journal.close()
+
+
+def test_memory_evicts_oldest_and_updates_indexes():
+    memory = Memory(max_items=3)
+    memory.add("user", "alpha question")
+    memory.add("assistant", "alpha answer")
+    memory.add("user", "beta question")
+    memory.add("user", "gamma question")
+
+    assert len(memory) == 3 and memory.total_added == 4
+    assert memory.retrieve(keyword="alpha") == [memory.history[0]]
+    assert [m["content"] for m in memory.retrieve(role="user")] == ["beta question", "gamma question"]
+    assert memory.get_latest("assistant") == "alpha answer"
+
+    memory.add("user", "delta question")
+    assert memory.get_latest("assistant") is None
+    assert "alpha" not in memory._by_word and "assistant" not in memory._by_role
+
+
+def test_memory_keyword_is_a_case_insensitive_substring():
+    memory = Memory()
+    memory.add("user", "The ERR_CONN_RESET error again")
+    memory.add("assistant", "Restart the router")
+    memory.add("user", "router still resets")
+    assert [m["content"] for m in memory.retrieve(keyword="conn_reset")] == ["The ERR_CONN_RESET error again"]
+    assert len(memory.retrieve(keyword="reset")) == 2
+    assert len(memory.retrieve(keyword="ROUTER", role="user")) == 1
+    assert memory.retrieve(keyword="  ") == []
+
+
+CONTENTS = [
+    "Restart the router, then check the cable",
+    "the router's firmware is v1.2",
+    "Routers drop Wi-Fi after updates",
+    "check the cable and the router again",
+]
+
+
+@pytest.mark.parametrize(
+    "needle", ["the router", "check the cable", "router, then", "the router again", "rout", "s firmware is", "-fi after"]
+)
+def test_memory_keyword_matches_a_full_scan(needle):
+    memory = Memory()
+    for content in CONTENTS:
+        memory.add("user", content)
+    expected = [content for content in CONTENTS if needle in content.lower()]
+    assert [m["content"] for m in memory.retrieve(keyword=needle)] == expected
+
+
+class NoScan(dict):
+    def items(self):
+        raise AssertionError("scanned the vocabulary")
+
+
+def test_memory_keyword_with_a_whole_word_uses_its_postings():
+    memory = Memory()
+    for content in CONTENTS:
+        memory.add("user", content)
+    memory._by_word = NoScan(memory._by_word)
+    assert [m["content"] for m in memory.retrieve(keyword="check the cable")] == [CONTENTS[0], CONTENTS[3]]
+    with pytest.raises(AssertionError):
+        memory.retrieve(keyword="router")  # may be part of "routers": needs the scan
+
+
+def test_memory_llm_messages_are_read_only():
+    memory = Memory()
+    memory.add("user", "hello")
+    message = memory.get_llm_messages()[0]
+    with pytest.raises(TypeError):
+        message["content"] = "changed"
+    with pytest.raises(TypeError):
+        message.update(role="system")
+    assert memory.get_llm_messages() == [{"role": "user", "content": "hello"}]
+
+    for editable in (dict(message), copy.copy(message), copy.deepcopy(message)):
+        editable["content"] = "changed"
+    assert json.loads(json.dumps(message)) == {"role": "user", "content": "hello"}
+
+
+def test_memory_llm_messages_tail_and_cursor():
+    memory = Memory()
+    for i in range(6):
+        memory.add("user" if i % 2 == 0 else "assistant", f"m{i}")
+    memory.add("tool", "not for the llm")
+
+    assert [m["content"] for m in memory.get_llm_messages(last_n=3)] == ["m3", "m4", "m5"]
+    assert [m["content"] for m in memory.get_llm_messages(last_n=2, roles=["user"])] == ["m2", "m4"]
+    assert memory.get_llm_messages(last_n=0) == []
+
+    messages, cursor = memory.messages_since(5)
+    assert [m["content"] for m in messages] == ["m5", "not for the llm"] and cursor == 7
+    assert memory.messages_since(cursor) == ([], 7)
@@ -0,0 +1,290 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from agent.context.tokens import TokenEstimator
+from agent.retrieval.bm25_index import BM25Index, tokenize
+from agent.retrieval.document_index import DocumentIndex
+from agent.retrieval.ingestion import chunk_text, ingest_directory, parse_shard, plan_shards
+from agent.retrieval.ivf_index import IVFIndex, spherical_kmeans
+from agent.retrieval.retrieval_helper import build_retrieval_context
+from agent.retrieval.scoring import reciprocal_rank_fusion, weighted_fusion
+
+TEXTS = [
+    "Reset the router when err_conn_reset shows up",
+    "The router firmware v1.2 fixes Wi-Fi drops",
+    "",
+    "Billing questions go to the billing team",
+    "Wi-Fi drops after a firmware update: roll back to v1.1",
+]
+
+
+def incremental(texts):
+    index = BM25Index()
+    for row, text in enumerate(texts):
+        index.add(row, text)
+    return index
+
+
+def test_bulk_build_matches_incremental_adds():
+    built, added = BM25Index(), incremental(TEXTS)
+    built.build(TEXTS)
+    assert len(built) == len(added) == len(TEXTS)
+    for query in ["router firmware", "err_conn_reset", "wi-fi v1.2", "billing"]:
+        assert built.search(query, 5) == added.search(query, 5)
+
+
+def test_bulk_built_index_stays_updatable():
+    index = BM25Index()
+    index.build(TEXTS)
+    index.add(len(TEXTS), "router reboot loop")
+    index.remove(0, TEXTS[0])
+    rows = [row for row, _, _ in index.search("router", 5)]
+    assert sorted(rows) == [1, len(TEXTS)]
+    assert np.isclose(index._total_len, index._doc_len.sum())
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    tokens = tokenize("What is err_conn_reset in v1.2?")
+    assert tokens == ["err_conn_reset", "err", "conn", "reset", "v1.2", "v1", "2"]
+
+
+def test_bm25_ranks_rare_terms_and_reports_coverage():
+    index = BM25Index()
+    index.build(TEXTS)
+    (row, score, coverage), *_ = index.search("err_conn_reset", 3)
+    assert row == 0 and score > 0 and coverage == pytest.approx(1.0)
+    _, _, coverage = index.search("router weather", 1)[0]
+    assert coverage < 0.5  # "weather" is unseen, so it weighs more than "router"
+    assert index.search("the and of", 3) == []
+
+
+def test_bm25_save_and_load_round_trip(tmp_path):
+    index = BM25Index(k1=1.5, b=0.5)
+    index.build(TEXTS)
+    path = str(tmp_path / "bm25")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert (loaded.k1, loaded.b, len(loaded)) == (1.5, 0.5, len(TEXTS))
+    assert loaded.search("firmware wi-fi", 5) == index.search("firmware wi-fi", 5)
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], k=60)
+    assert [row for row, _ in fused] == [1, 3, 2, 4]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+    weighted = reciprocal_rank_fusion([[1, 2], [2, 1]], k=60, weights=[1.0, 3.0])
+    assert weighted[0][0] == 2
+
+
+def test_weighted_fusion_normalizes_bm25():
+    fused = dict(weighted_fusion({0: 0.8, 1: 0.2}, {1: 12.0, 2: 6.0}, alpha=0.5))
+    assert fused == pytest.approx({0: 0.4, 1: 0.6, 2: 0.25})
+
+
+class WordHashEmbeddings:
+    """
+    Bag-of-words vectors: each word hashes to one of `dim` axes (deterministic).
+    """
+
+    def __init__(self, dim=32):
+        self.dim = dim
+
+    def embed_array(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[i, sum(word.encode()) % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-9)
+
+
+def hybrid_index(**kwargs):
+    embeddings = WordHashEmbeddings()
+    index = DocumentIndex(embeddings)
+    index.attach_sparse(BM25Index(), **kwargs)
+    index.sync({"id": f"doc{row}", "content": text} for row, text in enumerate(TEXTS) if text)
+    return embeddings, index
+
+
+@pytest.mark.parametrize("fusion", ["rrf", "weighted"])
+def test_hybrid_search_rescues_exact_identifier_matches(fusion):
+    embeddings, index = hybrid_index(fusion=fusion)
+    query = "why do I get err_conn_reset"
+    vector = embeddings.embed_array([query])[0]
+    assert index.search(vector, 2, score_threshold=0.9) == [[]]  # dense only: below threshold
+    hits = index.search(vector, 2, score_threshold=0.9, query_texts=[query])[0]
+    assert [doc["id"] for _, doc in hits] == ["doc0"]
+
+
+def test_hybrid_index_stays_in_sync_after_removal():
+    embeddings, index = hybrid_index()
+    index.remove(["doc0"])  # the last row moves into its slot
+    query = "err_conn_reset wi-fi drops"
+    hits = index.search(embeddings.embed_array([query])[0], 3, query_texts=[query])[0]
+    ids = [doc["id"] for _, doc in hits]
+    assert "doc0" not in ids and "doc4" in ids
+
+
+def test_ivf_attached_to_an_empty_index_trains_on_the_first_write():
+    embeddings = WordHashEmbeddings()
+    index = DocumentIndex(embeddings)
+    index.attach_backend(IVFIndex(num_lists=4))  # used to raise in spherical_kmeans
+    assert not index.backend.is_trained
+    assert index.search(embeddings.embed_array(["router"])[0], 1) == [[]]
+
+    index.sync({"id": f"doc{row}", "content": text} for row, text in enumerate(TEXTS) if text)
+    assert index.backend.is_trained and len(index.backend) == len(index)
+    hits = index.search(embeddings.embed_array([TEXTS[3]])[0], 1)[0]
+    assert hits[0][1]["id"] == "doc3"
+
+
+def test_spherical_kmeans_clamps_clusters_to_points():
+    assert spherical_kmeans(np.eye(4, dtype=np.float32)[:2], 5).shape == (2, 4)
+    with pytest.raises(ValueError):
+        spherical_kmeans(np.empty((0, 4), dtype=np.float32), 2)
+
+
+def test_ivf_add_counts_only_new_rows():
+    vectors = np.eye(4, dtype=np.float32)
+    ivf = IVFIndex(num_lists=2)
+    ivf.build(vectors)
+    diagonal = np.full(4, 0.5, dtype=np.float32)
+    ivf.add(np.array([1, 1, 9]), np.stack([vectors[0], diagonal, vectors[3]]))  # row 1 twice, row 9 new
+    assert len(ivf) == 5 == sum(inv.size for inv in ivf._lists)
+    assert ivf.search(diagonal, 1, nprobe=2)[0][0][0] == 1  # the last vector given for row 1 wins
+    ivf.remove(np.array([1, 9]))
+    assert len(ivf) == 3
+
+
+def test_loaded_index_can_be_saved_back_to_the_same_path(tmp_path):
+    embeddings, index = hybrid_index()
+    path = str(tmp_path / "docs")
+    index.save(path)
+    loaded = DocumentIndex.load(path, embeddings, sparse_cls=BM25Index)
+    assert isinstance(loaded.matrix, np.memmap)
+    loaded.save(path)  # replacing a mapped file fails on Windows; a new version is written instead
+    loaded.upsert([{"id": "doc9", "content": "new firmware notes"}])
+    loaded.save(path)
+
+    again = DocumentIndex.load(path, embeddings)
+    assert len(again) == len(index) + 1
+    np.testing.assert_array_equal(again.matrix[: len(index)], index.matrix)
+    assert sorted(os.listdir(tmp_path)) == ["docs.3.npy", "docs.bm25.json", "docs.bm25.npz", "docs.json"]
+
+
+def test_interrupted_save_keeps_the_previous_version(tmp_path, monkeypatch):
+    embeddings, index = hybrid_index()
+    path = str(tmp_path / "docs")
+    index.save(path)
+    index.upsert([{"id": "doc9", "content": "new firmware notes"}])
+
+    def crash(*args, **kwargs):
+        raise OSError("power loss")
+
+    monkeypatch.setattr(json, "dump", crash)  # dies after the vectors, before the JSON
+    with pytest.raises(OSError):
+        index.save(path)
+    monkeypatch.undo()
+
+    loaded = DocumentIndex.load(path, embeddings)
+    assert len(loaded) == len(index) - 1
+    np.testing.assert_array_equal(loaded.matrix, index.matrix[: len(loaded)])
+
+
+def write_jsonl(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"id": f"r{i}", "text": f"record {i} " + "word " * (i % 7)}) + "\n")
+
+
+@pytest.mark.parametrize("shard_bytes", [1, 7, 40, 41, 64, 1000, 10 ** 6])
+def test_each_jsonl_line_is_owned_by_exactly_one_shard(tmp_path, shard_bytes):
+    path = tmp_path / "corpus.jsonl"
+    write_jsonl(path, 30)
+    shards = list(plan_shards([str(path)], shard_bytes))
+    assert shards[0][1] == 0 and shards[-1][2] == os.path.getsize(path)
+    assert all(a[2] == b[1] for a, b in zip(shards, shards[1:]))  # contiguous, no gaps
+
+    ids = [chunk["id"] for shard in shards for chunk in parse_shard(shard, str(tmp_path), 256, 32)]
+    assert ids == [f"r{i}#0" for i in range(30)]
+
+
+def test_shard_starting_exactly_on_a_line_owns_that_line(tmp_path):
+    path = tmp_path / "corpus.jsonl"
+    write_jsonl(path, 3)
+    first_line = len(open(path, "rb").readline())
+    size = os.path.getsize(path)
+    head = parse_shard((str(path), 0, first_line), str(tmp_path), 256, 32)
+    tail = parse_shard((str(path), first_line, size), str(tmp_path), 256, 32)
+    assert [c["id"] for c in head] == ["r0#0"] and [c["id"] for c in tail] == ["r1#0", "r2#0"]
+
+
+def test_chunks_overlap_and_stay_within_budget():
+    text = " ".join(f"w{i:03d}." if i % 10 == 9 else f"w{i:03d}" for i in range(300))
+    chunks = chunk_text(text, chunk_tokens=40, overlap_tokens=8)
+    estimator = TokenEstimator()
+    assert all(sum(estimator.count(w) for w in c.split()) <= 40 for c in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert previous.split()[-1] in current.split()[:8]  # the tail is repeated
+    assert chunks[0].endswith(".")  # cut at a sentence boundary
+    assert chunks[-1].split()[-1] == "w299."
+
+
+def test_sharded_ingestion_matches_a_single_shard(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    write_jsonl(corpus / "records.jsonl", 40)
+    (corpus / "notes.md").write_text("Router notes. Reset it twice.", encoding="utf-8")
+
+    def ingest(shard_bytes):
+        index = DocumentIndex(WordHashEmbeddings())
+        report = ingest_directory(str(corpus), index, workers=0, batch_size=7, shard_bytes=shard_bytes)
+        return report, sorted(doc["id"] for doc in index.documents)
+
+    sharded, sharded_ids = ingest(shard_bytes=50)
+    whole, whole_ids = ingest(shard_bytes=10 ** 6)
+    assert sharded_ids == whole_ids and len(whole_ids) == 41
+    assert (sharded.files, sharded.chunks, sharded.duplicates) == (2, 41, 0)
+    assert sharded.bytes == whole.bytes
+
+
+@pytest.mark.parametrize("prebuilt", [False, True])
+def test_retrieval_context_keeps_the_threshold_unless_hybrid(prebuilt):
+    embeddings, index = hybrid_index()
+    documents = [{"id": f"doc{row}", "content": text} for row, text in enumerate(TEXTS) if text]
+    kwargs = dict(top_k=2, score_threshold=0.9, index=index if prebuilt else None)
+    query = "why do I get err_conn_reset"
+    assert build_retrieval_context(query, documents, embeddings, **kwargs) == ""
+    context = build_retrieval_context(query, documents, embeddings, hybrid=True, **kwargs)
+    assert context.count("\n[") == 1 and "err_conn_reset shows up" in context
+
+
+def test_large_text_files_are_sharded_on_line_boundaries(tmp_path):
+    path = tmp_path / "manual.md"
+    lines = [f"Line {i} explains step {i}." for i in range(60)]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    shards = list(plan_shards([str(path)], 200))
+    assert len(shards) > 1
+
+    chunks = [chunk for shard in shards for chunk in parse_shard(shard, str(tmp_path), 256, 32)]
+    assert chunks[0]["id"] == "manual.md@0#0"
+    assert len({chunk["id"] for chunk in chunks}) == len(chunks)
+    assert " ".join(chunk["content"] for chunk in chunks).split() == " ".join(lines).split()
+    # Small enough for one shard: ids stay per file
+    assert parse_shard((str(path), 0, os.path.getsize(path)), str(tmp_path), 256, 32)[0]["id"] == "manual.md#0"
+
+
+def test_reingesting_a_chunk_that_became_a_duplicate_drops_its_old_version(tmp_path):
+    (tmp_path / "a.md").write_text("Reset the router.", encoding="utf-8")
+    (tmp_path / "b.md").write_text("Update the firmware.", encoding="utf-8")
+    index = DocumentIndex(WordHashEmbeddings())
+    ingest_directory(str(tmp_path), index, workers=0)
+    assert sorted(doc["id"] for doc in index.documents) == ["a.md#0", "b.md#0"]
+
+    (tmp_path / "b.md").write_text("Reset the router.", encoding="utf-8")
+    report = ingest_directory(str(tmp_path), index, workers=0)
+    assert (report.duplicates, report.removed) == (1, 1)
+    assert [doc["id"] for doc in index.documents] == ["a.md#0"]
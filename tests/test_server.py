@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+import server
+from agent.session import SessionManager
+
+
+def parse(raw: bytes, limit: int = 2 ** 16):
+    async def read():
+        reader = asyncio.StreamReader(limit=limit)
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await server.read_request(reader)
+
+    return asyncio.run(read())
+
+
+def test_read_request_parses_method_path_and_body():
+    method, path, headers, body = parse(
+        b"post /sessions/a/turn?x=1 HTTP/1.1\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}"
+    )
+    assert (method, path, headers["connection"], body) == ("POST", "/sessions/a/turn", "close", b"{}")
+    assert parse(b"") is None
+
+
+@pytest.mark.parametrize(
+    "raw,status",
+    [
+        (b"GARBAGE\r\n\r\n", 400),
+        (b"GET /health HTTP/1.1\r\nContent-Length: ten\r\n\r\n", 400),
+        (b"GET /health HTTP/1.1\r\nContent-Length: -5\r\n\r\n", 400),
+        (b"POST /x HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % (server.MAX_BODY_BYTES + 1), 413),
+        (b"GET /health HTTP/1.1\r\nX-Pad: " + b"a" * 2048 + b"\r\n\r\n", 431),
+    ],
+)
+def test_read_request_rejects_bad_requests(raw, status):
+    with pytest.raises(server.BadRequest) as info:
+        parse(raw, limit=1024)
+    assert info.value.status == status
+
+
+class DrainingPipeline:
+    def __init__(self, release: asyncio.Event):
+        self.release = release
+        self.closed = False
+
+    async def drain(self):
+        await self.release.wait()
+
+    def close(self):
+        self.closed = True
+
+
+class Journal:
+    open = 0
+
+    def __init__(self):
+        Journal.open += 1
+
+    def close(self):
+        Journal.open -= 1
+
+
+def test_get_waits_for_a_pending_close_of_the_same_session():
+    async def scenario():
+        release = asyncio.Event()
+        created = []
+
+        def create(session_id):
+            session = server.Session(
+                id=session_id, memory=None, context_controller=None,
+                pipeline=DrainingPipeline(release), journal=Journal(),
+            )
+            created.append(session)
+            return session
+
+        manager = SessionManager(create)
+        first = await manager.get("s")
+        close = asyncio.ensure_future(manager.close("s"))
+        await asyncio.sleep(0)  # close is now draining
+        reopen = asyncio.ensure_future(manager.get("s"))
+        await asyncio.sleep(0.01)
+        assert not reopen.done() and len(created) == 1 and Journal.open == 1
+        release.set()
+        assert await close
+        second = await reopen
+        assert second is not first and first.pipeline.closed and Journal.open == 1
+        assert await manager.close("missing") is False
+
+    asyncio.run(scenario())
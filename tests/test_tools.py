@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+import pytest
+
+from agent.tool_runtime import ToolRuntime
+from tools.expression import ExpressionError, evaluate
+from tools.simple_tool import SimpleCalculatorTool
+
+
+def test_arithmetic():
+    assert evaluate("(12 * 7) / 3") == 28
+    assert evaluate("2 ** 10") == 1024
+    assert evaluate("round(2.567, 2)") == 2.57
+    assert evaluate("max(1, 5, 3)") == 5
+    assert evaluate("sqrt(16) + pi - pi") == 4
+
+
+@pytest.mark.parametrize("expression", ["9**9**9", "2 ** 5000", "(2 ** 4000) * (2 ** 4000)"])
+def test_huge_integers_fail_fast(expression):
+    start = time.perf_counter()
+    with pytest.raises(ExpressionError, match="exceeds"):
+        evaluate(expression)
+    assert time.perf_counter() - start < 0.5
+
+
+@pytest.mark.parametrize("expression", ["round(5, -10**9)", "round(5, 10**9)", "round(5, -401)"])
+def test_round_digits_are_capped(expression):
+    start = time.perf_counter()
+    with pytest.raises(ExpressionError, match="round"):
+        evaluate(expression)
+    assert time.perf_counter() - start < 0.5
+
+
+def test_round_digits_must_be_integers():
+    with pytest.raises(ExpressionError, match="integer"):
+        evaluate("round(1.5, 2.0)")
+
+
+def test_argument_count_is_capped():
+    assert evaluate("min(" + ", ".join(["1"] * 16) + ")") == 1
+    with pytest.raises(ExpressionError, match="at most"):
+        evaluate("max(" + ", ".join(["1"] * 17) + ")")
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "__import__('os')",
+        "(1).real",
+        "abs.__self__",
+        "x + 1",
+        "open('f')",
+        "abs(x=1)",
+        "round(2.5, ndigits=1)",
+        "'a' * 3",
+        "[1, 2]",
+        "lambda: 1",
+    ],
+)
+def test_unsupported_syntax(expression):
+    with pytest.raises(ExpressionError):
+        evaluate(expression)
+
+
+@pytest.mark.parametrize(
+    "expression,message",
+    [
+        ("exp(1000)", "range"),
+        ("10.0 ** 400", "out of range"),
+        ("1 / 0", "division by zero"),
+        ("sqrt(-1)", "domain"),
+    ],
+)
+def test_arithmetic_errors(expression, message):
+    with pytest.raises(ExpressionError, match=message):
+        evaluate(expression)
+
+
+def test_complex_results_are_rejected():
+    with pytest.raises(ExpressionError, match="not a real number"):
+        evaluate("(-8) ** 0.5")
+    assert evaluate("8 ** 0.5") == pytest.approx(2.8284271247461903)
+
+
+@pytest.mark.parametrize("expression", ["1e308 * 10", "-1e308 * 10", "1e999", "min(1e999, 1)"])
+def test_infinite_results_are_rejected(expression):
+    with pytest.raises(ExpressionError, match="not finite"):
+        evaluate(expression)
+
+
+def test_calculator_reports_non_real_results_as_errors():
+    result = asyncio.run(ToolRuntime().run("calculator", SimpleCalculatorTool(), {"expression": "(-8)**0.5"}))
+    assert not result.ok and result.value is None and "not a real number" in result.error
+
+
+def test_long_expressions_are_rejected():
+    with pytest.raises(ExpressionError, match="longer"):
+        evaluate("1+" * 200 + "1")
+
+
+class SlowTool:
+    def run(self, seconds: float):
+        time.sleep(seconds)
+        return "done"
+
+
+class SpinningTool:
+    isolated = True
+
+    def run(self):
+        while True:
+            pass
+
+
+def test_runtime_returns_values_and_errors():
+    runtime = ToolRuntime()
+    calculator = SimpleCalculatorTool()
+
+    ok = asyncio.run(runtime.run("calculator", calculator, {"expression": "6 * 7"}))
+    assert ok.ok and ok.value == 42 and ok.output == "42"
+
+    failed = asyncio.run(runtime.run("calculator", calculator, {"expression": "9**9**9"}))
+    assert not failed.ok and not failed.timed_out
+    assert "exceeds" in failed.error and failed.text.startswith("Error running calculator")
+
+    assert runtime.stats()["calculator"]["errors"] == 1
+
+
+def test_runtime_timeout_releases_the_caller():
+    runtime = ToolRuntime(default_timeout=0.2)
+
+    async def timed():
+        start = time.perf_counter()
+        result = await runtime.run("slow", SlowTool(), {"seconds": 1.0})
+        return result, time.perf_counter() - start
+
+    result, seconds = asyncio.run(timed())  # (asyncio.run then waits for the abandoned thread)
+    assert result.timed_out and result.error == "timed out after 0.2s"
+    assert seconds < 0.6
+    assert runtime.stats()["slow"]["timeouts"] == 1
+
+
+def test_isolated_tools_are_killed_on_timeout():
+    runtime = ToolRuntime(default_timeout=0.5, processes=1)
+    try:
+        result = asyncio.run(runtime.run("spin", SpinningTool()))
+        assert result.timed_out
+        assert runtime.stats()["process_restarts"] == 1
+        # A fresh worker process serves the next call
+        result = asyncio.run(runtime.run("calculator", SimpleCalculatorTool(), {"expression": "round(5, -10**9)"}))
+        assert not result.ok and "round" in result.error
+    finally:
+        runtime.close()
@@ -0,0 +1,109 @@
+import asyncio
+import re
+
+import numpy as np
+import pytest
+
+from agent.tracing import BUCKET_BOUNDS, NULL_SPAN, Histogram, Tracer, format_trace
+
+
+def histogram_of(samples):
+    histogram = Histogram()
+    for seconds in samples:
+        histogram.observe(float(seconds))
+    return histogram
+
+
+@pytest.mark.parametrize("q", [0.5, 0.9, 0.95, 0.99])
+def test_histogram_quantiles_stay_within_ten_percent(q):
+    samples = np.random.default_rng(0).lognormal(mean=np.log(0.2), sigma=1.0, size=20000)
+    exact = np.quantile(samples, q)
+    assert histogram_of(samples).quantile(q) == pytest.approx(exact, rel=0.10)
+
+
+def test_histogram_edges():
+    assert Histogram().quantile(0.5) == 0.0
+    constant = histogram_of([0.25] * 100)
+    assert all(constant.quantile(q) <= 0.25 for q in (0.01, 0.5, 1.0))
+    assert constant.quantile(1.0) == pytest.approx(0.25, rel=0.2)
+
+    # Below the first bound and past the last one
+    tiny = histogram_of([1e-6, 1e-6])
+    assert tiny.counts[0] == 2 and tiny.quantile(0.99) <= 1e-6
+    huge = histogram_of([1000.0])
+    assert huge.counts[-1] == 1 and huge.quantile(0.5) <= 1000.0
+
+
+def test_observation_lands_in_the_bucket_bounding_it():
+    histogram = Histogram()
+    for seconds in (0.00013, 0.01, 0.37, 4.2, BUCKET_BOUNDS[12]):
+        histogram.observe(seconds)
+        index = max(i for i, count in enumerate(histogram.counts) if count)
+        assert BUCKET_BOUNDS[index - 1] < seconds <= BUCKET_BOUNDS[index] * (1 + 1e-9)
+        histogram.counts[index] = 0
+
+
+def test_spans_nest_and_feed_histograms():
+    tracer = Tracer(enabled=True)
+    traces = []
+    tracer.exporters.append(traces.append)
+    with tracer.span("turn", user="u1"):
+        with tracer.span("plan"):
+            pass
+        with tracer.span("llm.generate") as span:
+            span.set(tokens=12)
+    with pytest.raises(KeyError):
+        with tracer.span("turn"):
+            raise KeyError("boom")
+
+    first, failed = traces
+    assert [child["name"] for child in first["children"]] == ["plan", "llm.generate"]
+    assert first["attrs"] == {"user": "u1"} and first["children"][1]["attrs"] == {"tokens": 12}
+    assert failed["attrs"] == {"error": "KeyError"}
+    assert re.fullmatch(r"turn \d+ms \[plan \d+ms, llm.generate \d+ms\]", format_trace(first))
+    assert tracer.summary()["spans"]["turn"]["count"] == 2
+
+
+def test_spans_follow_asyncio_tasks_and_threads():
+    tracer = Tracer(enabled=True)
+
+    async def main():
+        with tracer.span("turn"):
+            await asyncio.gather(
+                asyncio.to_thread(tracer.traced("worker")(lambda: None)),
+                asyncio.create_task(child()),
+            )
+
+    async def child():
+        with tracer.span("task"):
+            await asyncio.sleep(0)
+
+    asyncio.run(main())
+    names = sorted(child["name"] for child in tracer.last_trace["children"])
+    assert names == ["task", "worker"]
+
+
+def test_disabled_tracer_is_a_no_op():
+    tracer = Tracer()
+    assert tracer.span("turn") is NULL_SPAN
+    tracer.count("tokens", 5)
+    assert tracer.traced()(lambda x: x + 1)(1) == 2
+    assert tracer.summary() == {"spans": {}, "counters": {}}
+
+
+def test_prometheus_buckets_are_cumulative():
+    tracer = Tracer(enabled=True)
+    for _ in range(3):
+        with tracer.span("turn"):
+            pass
+    tracer.count("tokens", 7, kind="prompt")
+    tracer.count("tokens", 5, kind="prompt")
+    tracer.count("cache_hits")
+
+    text = tracer.prometheus()
+    buckets = [int(value) for value in re.findall(r'agent_span_seconds_bucket\{span="turn",le="[^"]+"\} (\d+)', text)]
+    assert buckets == sorted(buckets) and buckets[-1] == 3
+    assert 'agent_span_seconds_count{span="turn"} 3' in text
+    assert 'agent_tokens_total{kind="prompt"} 12' in text
+    assert text.count("# TYPE agent_tokens_total counter") == 1
+    assert "agent_cache_hits_total 1" in text